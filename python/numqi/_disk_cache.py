@@ -0,0 +1,189 @@
+import os
+import json
+import shutil
+import hashlib
+import functools
+import numpy as np
+
+# on-disk cache of the expensive combinatorial tables, one directory per entry
+#   {cache_dir}/v{_CACHE_FORMAT_VERSION}/{name}-v{version}-{sha1(args)}/
+#       tree.json: nested structure of the return value, leaf arrays are stored as a{i}.npy
+# large arrays are memory-mapped (read-only), so the spawned workers share the page cache instead of recomputing
+
+_CACHE_FORMAT_VERSION = 1
+_MMAP_MIN_NBYTES = 2**16
+
+
+def get_cache_dir():
+    r'''get the directory of the disk cache, set by the environment variable `NUMQI_CACHE_DIR`
+    or `numqi.utils.set_cache_dir`
+
+    Returns:
+        ret (str,None): the directory, None if the disk cache is disabled
+    '''
+    ret = os.path.expanduser(os.environ.get('NUMQI_CACHE_DIR', ''))
+    ret = ret if ret else None
+    return ret
+
+
+def get_cache_max_size():
+    r'''get the size limit (in bytes) of the disk cache, set by the environment variable `NUMQI_CACHE_MAX_SIZE`
+    or `numqi.utils.set_cache_dir`, default to 1 GiB
+
+    Returns:
+        ret (int): the size limit in bytes
+    '''
+    ret = int(float(os.environ.get('NUMQI_CACHE_MAX_SIZE', 2**30)))
+    return ret
+
+
+def set_cache_dir(cache_dir:(str|None), max_size:(int|None)=None):
+    r'''set the directory of the disk cache for the expensive tables (e.g. `numqi.group.symext.get_symmetric_extension_irrep_coeff`).
+    The setting is stored in the environment variables `NUMQI_CACHE_DIR` and `NUMQI_CACHE_MAX_SIZE`,
+    so it is inherited by the worker processes (also the spawned ones). The entries are evicted in the
+    least-recently-used order when the total size exceeds `max_size`
+
+    Parameters:
+        cache_dir (str,None): the directory, e.g. `~/.cache/numqi`, None to disable the disk cache
+        max_size (int,None): size limit in bytes, None to keep the current one
+    '''
+    if cache_dir is None:
+        os.environ.pop('NUMQI_CACHE_DIR', None)
+    else:
+        os.environ['NUMQI_CACHE_DIR'] = str(cache_dir)
+    if max_size is not None:
+        assert max_size>=0
+        os.environ['NUMQI_CACHE_MAX_SIZE'] = str(int(max_size))
+
+
+def clear_cache():
+    r'''remove all the entries (of all versions) in the disk cache directory'''
+    cache_dir = get_cache_dir()
+    if cache_dir is not None:
+        for x in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+            if x.startswith('v') and x[1:].isdigit():
+                shutil.rmtree(os.path.join(cache_dir, x), ignore_errors=True)
+
+
+def _tree_flatten(x, leaf_list):
+    if isinstance(x, np.ndarray):
+        leaf_list.append(x)
+        ret = {'a': len(leaf_list)-1}
+    elif isinstance(x, (tuple,list)):
+        ret = {('t' if isinstance(x,tuple) else 'l'): [_tree_flatten(y, leaf_list) for y in x]}
+    elif isinstance(x, np.generic):
+        ret = {'v': x.item()}
+    else:
+        assert (x is None) or isinstance(x, (bool,int,float,str)), f'unsupported type "{type(x)}" in disk cache'
+        ret = {'v': x}
+    return ret
+
+
+def _tree_unflatten(tree, leaf_list):
+    if 'a' in tree:
+        ret = leaf_list[tree['a']]
+    elif 't' in tree:
+        ret = tuple(_tree_unflatten(y, leaf_list) for y in tree['t'])
+    elif 'l' in tree:
+        ret = [_tree_unflatten(y, leaf_list) for y in tree['l']]
+    else:
+        ret = tree['v']
+    return ret
+
+
+def _set_read_only(x):
+    if isinstance(x, np.ndarray):
+        x.flags.writeable = False
+    elif isinstance(x, (tuple,list)):
+        for y in x:
+            _set_read_only(y)
+
+
+def _load_entry(path):
+    with open(os.path.join(path, 'tree.json'), 'r') as fid:
+        tree = json.load(fid)
+    leaf_list = []
+    for ind0,nbytes in enumerate(tree['nbytes']):
+        tmp0 = 'r' if (nbytes>=_MMAP_MIN_NBYTES) else None
+        tmp1 = np.load(os.path.join(path, f'a{ind0}.npy'), mmap_mode=tmp0, allow_pickle=False)
+        tmp1.flags.writeable = False
+        leaf_list.append(tmp1)
+    ret = _tree_unflatten(tree['tree'], leaf_list)
+    os.utime(os.path.join(path, 'tree.json')) #the access time for the eviction
+    return ret
+
+
+def _save_entry(path, value, key:str):
+    leaf_list = []
+    tree = _tree_flatten(value, leaf_list)
+    # write to a temporary directory first, concurrent process never reads a partial entry
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    os.makedirs(tmp_path, exist_ok=True)
+    for ind0,x in enumerate(leaf_list):
+        np.save(os.path.join(tmp_path, f'a{ind0}.npy'), np.ascontiguousarray(x), allow_pickle=False)
+    with open(os.path.join(tmp_path, 'tree.json'), 'w') as fid:
+        json.dump({'key':key, 'nbytes':[int(x.nbytes) for x in leaf_list], 'tree':tree}, fid)
+    try:
+        os.replace(tmp_path, path)
+    except OSError: #written by another process
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _evict(root:str, max_size:int):
+    entry_list = []
+    try:
+        name_list = os.listdir(root)
+    except OSError: #removed by clear_cache() in another process
+        name_list = []
+    for x in name_list:
+        path = os.path.join(root, x)
+        if x.endswith('.tmp'):
+            continue
+        try:
+            tmp0 = sum(os.path.getsize(os.path.join(path,y)) for y in os.listdir(path))
+            entry_list.append((os.path.getmtime(os.path.join(path, 'tree.json')), tmp0, path))
+        except OSError: #not an entry, or evicted by another process concurrently
+            pass
+    total = sum(x[1] for x in entry_list)
+    for _,size,path in sorted(entry_list):
+        if total<=max_size:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def disk_cache(name:str, version:int=1):
+    r'''decorator, cache the return value of the function on disk if `numqi.utils.get_cache_dir()` is not None.
+    The arguments should be hashable with a stable `repr` (int, bool, tuple of int, etc.), the return value
+    should be a nested tuple/list of `np.ndarray` and python scalars. The in-memory memoization is left to
+    `functools.lru_cache`. If the disk cache is enabled, the returned arrays are read-only (large ones are
+    memory-mapped), otherwise the return value of the function is passed through untouched. The memoized
+    callers (`functools.lru_cache`) set their shared arrays read-only themselves, so the contract does not
+    depend on the disk cache
+
+    Parameters:
+        name (str): name of the table
+        version (int): bump it when the content of the table changes, the old entries are not read any more
+    '''
+    def hf0(func):
+        @functools.wraps(func)
+        def hf1(*args, **kwargs):
+            cache_dir = get_cache_dir()
+            if cache_dir is None:
+                return func(*args, **kwargs)
+            key = f'{name}{args!r}{sorted(kwargs.items())!r}'
+            root = os.path.join(cache_dir, f'v{_CACHE_FORMAT_VERSION}')
+            path = os.path.join(root, f'{name}-v{version}-' + hashlib.sha1(key.encode()).hexdigest()[:16])
+            if os.path.isfile(os.path.join(path, 'tree.json')):
+                try:
+                    return _load_entry(path)
+                except (OSError, ValueError, KeyError): #broken entry, recompute
+                    shutil.rmtree(path, ignore_errors=True)
+            ret = func(*args, **kwargs)
+            os.makedirs(root, exist_ok=True)
+            _save_entry(path, ret, key)
+            _evict(root, get_cache_max_size())
+            _set_read_only(ret)
+            return ret
+        return hf1
+    return hf0
@@ -112,3 +112,170 @@ class PSDMatrixLogm(torch.nn.Module):
 def get_PSDMatrixLogm(num_sqrtm:int, pade_order:int, device:str='cpu'):
     ret = PSDMatrixLogm(num_sqrtm, pade_order, device)
     return ret
+
+
+def _psd_spectral_value(EVL, kind):
+    # return the clamped eigenvalues, f(x) and f'(x)
+    if kind=='log':
+        x = torch.clamp(EVL, min=torch.finfo(EVL.dtype).eps)
+        fval = torch.log(x)
+        fprime = 1/x
+    elif kind=='entropy': #f(x)=-x log(x), trace function
+        x = torch.clamp(EVL, min=torch.finfo(EVL.dtype).eps)
+        tmp0 = torch.log(x)
+        fval = -x*tmp0
+        fprime = -tmp0 - 1
+    else:
+        power = 0.5 if (kind=='sqrt') else float(kind[1])
+        x = torch.clamp(EVL, min=0)
+        fval = x**power
+        # the derivative is infinite at zero for power<1, drop it as PSDMatrixSqrtm
+        fprime = torch.where(x>0, power*x**(power-1), 0) if (power<1) else power*x**(power-1)
+    return x,fval,fprime
+
+
+def _divided_difference(x, fval, fprime):
+    # Daleckii-Krein matrix F_ij=(f(x_i)-f(x_j))/(x_i-x_j), the (nearly) degenerate pairs use the mean of f'
+    # whose error is O(dx^2) compared with the cancellation error O(eps/dx) of the difference quotient
+    dx = x.unsqueeze(-1) - x.unsqueeze(-2)
+    tmp0 = torch.maximum(x.abs().unsqueeze(-1), x.abs().unsqueeze(-2))
+    mask = dx.abs() <= np.sqrt(torch.finfo(x.dtype).eps)*tmp0
+    tmp1 = (fprime.unsqueeze(-1) + fprime.unsqueeze(-2))/2
+    tmp2 = (fval.unsqueeze(-1) - fval.unsqueeze(-2)) / torch.where(mask, 1, dx)
+    ret = torch.where(mask, tmp1, tmp2)
+    return ret
+
+
+def _psd_matrix_spectral_vjp(EVL, EVC, kind_list, grad_output):
+    EVCh = EVC.mH
+    tmp0 = 0
+    for kind,grad in zip(kind_list, grad_output):
+        if grad is None:
+            continue
+        x,fval,fprime = _psd_spectral_value(EVL, kind)
+        if kind=='entropy':
+            # gradient of trace function Tr f(A) is f'(A)
+            tmp0 = tmp0 + torch.diag_embed((fprime*grad.unsqueeze(-1)).to(EVC.dtype))
+        else:
+            tmp0 = tmp0 + _divided_difference(x, fval, fprime).to(EVC.dtype) * (EVCh @ grad @ EVC)
+    ret = EVC @ tmp0 @ EVCh
+    return ret
+
+
+class PSDMatrixSpectral(torch.autograd.Function):
+    # it's user's duty to check the Hermitian, PSD
+    # all the outputs share one eigen-decomposition, the backward is the Daleckii-Krein formula
+    # https://doi.org/10.1090/trans2/047
+    # the eigen-decomposition is returned as the last two (non-differentiable) outputs, required by setup_context()
+    # which makes the torch.func transforms (grad, jvp, vmap) work. The saved eigen-decomposition is a constant,
+    # so the backward recomputes it differentiably when higher order derivatives are possible (grad mode enabled in backward,
+    # e.g. create_graph=True or torch.func.grad), whose second derivative is not stable for the degenerate eigenvalues
+    generate_vmap_rule = True
+
+    @staticmethod
+    def forward(matA, kind_list):
+        EVL,EVC = torch.linalg.eigh(matA)
+        ret = []
+        for kind in kind_list:
+            fval = _psd_spectral_value(EVL, kind)[1]
+            if kind=='entropy':
+                ret.append(fval.sum(dim=-1))
+            else:
+                ret.append((EVC*fval.unsqueeze(-2).to(EVC.dtype)) @ EVC.mH)
+        return tuple(ret) + (EVL, EVC)
+
+    @staticmethod
+    def setup_context(ctx, inputs, output):
+        ctx.kind_list = inputs[1]
+        ctx.mark_non_differentiable(*output[-2:])
+        ctx.save_for_backward(inputs[0], *output[-2:])
+        ctx.save_for_forward(*output[-2:])
+
+    @staticmethod
+    def backward(ctx, *grad_output):
+        matA,EVL,EVC = ctx.saved_tensors
+        if torch.is_grad_enabled():
+            EVL,EVC = torch.linalg.eigh(matA)
+        ret = _psd_matrix_spectral_vjp(EVL, EVC, ctx.kind_list, grad_output[:len(ctx.kind_list)])
+        return ret,None
+
+    @staticmethod
+    def jvp(ctx, matA_t, _):
+        EVL,EVC = ctx.saved_tensors
+        EVCh = EVC.mH
+        tmp0 = EVCh @ matA_t.to(EVC.dtype) @ EVC
+        ret = []
+        for kind in ctx.kind_list:
+            x,fval,fprime = _psd_spectral_value(EVL, kind)
+            if kind=='entropy':
+                ret.append((fprime*torch.diagonal(tmp0, dim1=-2, dim2=-1).real).sum(dim=-1))
+            else:
+                ret.append(EVC @ (_divided_difference(x, fval, fprime).to(EVC.dtype) * tmp0) @ EVCh)
+        return tuple(ret) + (None, None)
+
+
+class HermitianMatrixExp(torch.autograd.Function):
+    # exp(iH) for the Hermitian matrix H, it's user's duty to check the Hermitian, use `.apply(matH)[0]`
+    # the eigen-decomposition is reused in the backward (Daleckii-Krein formula), and it's returned as the last two
+    # (non-differentiable) outputs, see PSDMatrixSpectral. When higher order derivatives are possible, the backward is
+    # the top-right block of exp(-i[[H,G],[0,H]]) which is differentiable and stable for the degenerate eigenvalues
+    generate_vmap_rule = True
+
+    @staticmethod
+    def forward(matH):
+        EVL,EVC = torch.linalg.eigh(matH)
+        fval = torch.exp(1j*EVL)
+        ret = (EVC*fval.unsqueeze(-2)) @ EVC.mH
+        return ret, EVL, EVC
+
+    @staticmethod
+    def setup_context(ctx, inputs, output):
+        ctx.mark_non_differentiable(*output[1:])
+        ctx.save_for_backward(inputs[0], *output[1:])
+        ctx.save_for_forward(*output[1:])
+
+    @staticmethod
+    def backward(ctx, grad_output, _0, _1):
+        matH,EVL,EVC = ctx.saved_tensors
+        N0 = matH.shape[-1]
+        if torch.is_grad_enabled():
+            tmp0 = torch.cat([matH, grad_output], dim=-1)
+            tmp1 = torch.cat([torch.zeros_like(matH), matH], dim=-1)
+            ret = torch.linalg.matrix_exp(-1j*torch.cat([tmp0,tmp1], dim=-2))[...,:N0,N0:]
+        else:
+            fval = torch.exp(1j*EVL)
+            # the adjoint of the Frechet derivative, so the divided difference is conjugated
+            tmp0 = _divided_difference(EVL, fval, 1j*fval).conj()
+            ret = EVC @ (tmp0 * (EVC.mH @ grad_output @ EVC)) @ EVC.mH
+        return ret
+
+    @staticmethod
+    def jvp(ctx, matH_t):
+        EVL,EVC = ctx.saved_tensors
+        fval = torch.exp(1j*EVL)
+        tmp0 = _divided_difference(EVL, fval, 1j*fval)
+        ret = EVC @ (tmp0 * (EVC.mH @ matH_t.to(EVC.dtype) @ EVC)) @ EVC.mH
+        return ret, None, None
+
+
+def get_psd_matrix_spectral(matA:torch.Tensor, kind:str|tuple|list):
+    r'''matrix functions of the positive semi-definite matrix via one eigen-decomposition, the gradient is
+    evaluated by the Daleckii-Krein formula which is stable for degenerate eigenvalues
+
+    Parameters:
+        matA (torch.Tensor): Hermitian positive semi-definite matrix, shape=(...,d,d), the leading dimensions are batch dimensions
+        kind (str,tuple,list): 'log' (eigenvalues clamped to eps), 'sqrt', ('power',p), 'entropy' ($-\mathrm{Tr}(A\log A)$),
+            or a list of them computed with the same eigen-decomposition
+
+    Returns:
+        ret (torch.Tensor,tuple[torch.Tensor]): shape=(...,d,d) for the matrix function and shape=(...) for 'entropy',
+            tuple if `kind` is a list
+    '''
+    is_list = isinstance(kind, list)
+    kind_list = tuple((tuple(x) if isinstance(x,list) else x) for x in (kind if is_list else [kind]))
+    for x in kind_list:
+        assert (x in {'log','sqrt','entropy'}) or ((len(x)==2) and (x[0]=='power'))
+    ret = PSDMatrixSpectral.apply(matA, kind_list)[:-2]
+    if not is_list:
+        ret = ret[0]
+    return ret
@@ -1,8 +1,13 @@
+import math
 import itertools
+import functools
 import numpy as np
 import scipy.special
+import scipy.sparse
 import torch
 
+import numqi._disk_cache
+
 
 def _dicke_hf0(klist, base, dim, num_qudit):
     ret = np.zeros(dim**num_qudit, dtype=np.float64)
@@ -72,8 +77,7 @@ def get_dicke_klist(num_qudit:int, dim:int):
     '''
     assert dim>=2
     assert num_qudit>=1
-    hf0 = lambda d,n: [(n,)] if (d<=1) else [(x,)+y for x in range(n+1) for y in hf0(d-1,n-x)]
-    ret = hf0(dim, num_qudit)
+    ret = [tuple(x) for x in _get_dicke_klist_np(int(num_qudit), int(dim)).tolist()]
     return ret
 
 
@@ -98,8 +102,56 @@ def get_qubit_dicke_partial_trace(num_qubit:int):
     return a00,a01,a11
 
 
+@functools.lru_cache(maxsize=16)
+def _get_dicke_klist_np(num_qudit:int, dim:int):
+    # stars and bars, the (dim-1) bars in lexicographic order give the same order as get_dicke_klist
+    tmp0 = np.array(list(itertools.combinations(range(num_qudit+dim-1), dim-1)), dtype=np.int64).reshape(-1, dim-1)
+    tmp1 = np.concatenate([np.full((tmp0.shape[0],1), -1), tmp0, np.full((tmp0.shape[0],1), num_qudit+dim-1)], axis=1)
+    ret = np.diff(tmp1, axis=1) - 1
+    ret.flags.writeable = False
+    return ret
+
+
+def _get_dicke_klist_rank(klist:np.ndarray, num_qudit:int):
+    # index of the klist in get_dicke_klist(num_qudit, dim), the number of compositions before k[p] at position p is
+    # sum_{x<k[p]} binom(n_p-x+q-1,q-1) = binom(n_p+q,q) - binom(n_p-k[p]+q,q), n_p the remaining sum, q=dim-p-1
+    dim = klist.shape[1]
+    binom = np.array([[math.comb(x,y) for y in range(dim)] for x in range(num_qudit+dim)], dtype=np.int64)
+    remain = num_qudit - np.cumsum(klist, axis=1) + klist
+    ret = 0
+    for ind0 in range(dim-1):
+        q = dim-ind0-1
+        ret = ret + binom[remain[:,ind0]+q,q] - binom[remain[:,ind0]-klist[:,ind0]+q,q]
+    return ret
+
+
+@functools.lru_cache(maxsize=16)
+@numqi._disk_cache.disk_cache('dicke_partial_trace_index')
+def _get_partial_trace_ABk_to_AB_index_hf0(num_qudit:int, dim:int):
+    klist_np = _get_dicke_klist_np(num_qudit, dim)
+    Bij = []
+    for ind0 in range(dim):
+        for ind1 in range(dim):
+            if ind0==ind1:
+                tmp0 = np.arange(klist_np.shape[0])
+                Bij.append((tmp0, tmp0, klist_np[:,ind0] / num_qudit))
+            else:
+                tmp0 = np.nonzero(klist_np[:,ind0]>0)[0]
+                tmp1 = klist_np[tmp0].copy()
+                tmp1[:,ind0] -= 1
+                tmp1[:,ind1] += 1
+                tmp2 = _get_dicke_klist_rank(tmp1, num_qudit)
+                tmp3 = np.sqrt(klist_np[tmp0,ind0]*tmp1[:,ind1])/num_qudit
+                Bij.append((tmp0,tmp2,tmp3))
+    # shared by the lru_cache whether or not the disk cache is enabled
+    for x in Bij:
+        for y in x:
+            y.flags.writeable = False
+    return Bij
+
+
 # old name: qudit_dicke_state_partial_trace
-def get_partial_trace_ABk_to_AB_index(num_qudit:int, dim:int, return_tensor=False):
+def get_partial_trace_ABk_to_AB_index(num_qudit:int, dim:int, return_tensor:bool=False, fused:bool=False):
     r'''return index for partial trace of qudit Dicke state `numqi.dicke.partial_trace_ABk_to_AB`
 
     $$ B_{rsab} = \mathrm{Tr}_{A^{n-1}} \left[ \langle r|D_{na}\rangle\langle D_{nb}| s\rangle \right] $$
@@ -109,39 +161,19 @@ def get_partial_trace_ABk_to_AB_index(num_qudit:int, dim:int, return_tensor=Fals
         dim (int): dimension of qudit
         return_tensor (bool): if True, return $B_{rsab}$, otherwise return indexing used for $B_{rsab}$.
                 `return_tensor=True` is useful for unittest. `return_tensor=False` use less memory
+        fused (bool): if True, all the $B_{rs}$ are concatenated into one sparse operator of shape `(dim*dim*#klist, #klist)`,
+                which is applied in one kernel by `numqi.dicke.partial_trace_ABk_to_AB`. Ignored if `return_tensor=True`
 
     Returns:
-        ret (list,np.ndarray): if `return_tensor=False`, list of tuple, each tuple is of length 3,
+        ret (list,tuple,np.ndarray): if `return_tensor=False`, list of tuple, each tuple is of length 3,
             and the first two elements are list of int, the third element is np.ndarray of `float64`.
-            if `return_tensor=True`, return $B_{rsab}$, shape (dim, dim, #klist, #klist)
+            if `fused=True`, tuple of `(dim, index_row, index_col, value)`, the row index is `(r*dim+s)*#klist+a`.
+            if `return_tensor=True`, return $B_{rsab}$, shape (dim, dim, #klist, #klist).
+            The index arrays are memoized and read-only
     '''
     assert (dim>1) and (num_qudit>=1)
-    klist = get_dicke_klist(num_qudit, dim)
-    len_klist = get_dicke_number(num_qudit, dim)
-    assert len(klist)==len_klist
-    klist_to_index = {y:x for x,y in enumerate(klist)}
-    klist_np = np.array(klist, dtype=np.int64)
-    Bij = []
-    for ind0 in range(dim):
-        for ind1 in range(dim):
-            if ind0==ind1:
-                tmp0 = np.arange(len_klist)
-                tmp1 = np.arange(len_klist)
-                tmp2 = klist_np[:,ind0] / num_qudit
-                Bij.append((tmp0,tmp1,tmp2))
-            else:
-                tmp0 = []
-                for x,y in enumerate(klist):
-                    tmp1 = list(y)
-                    tmp1[ind0] -= 1
-                    tmp1[ind1] += 1
-                    tmp1 = tuple(tmp1)
-                    if tmp1 in klist_to_index:
-                        tmp0.append((x,klist_to_index[tmp1]))
-                tmp1 = np.array([x[0] for x in tmp0], dtype=np.int64)
-                tmp2 = np.array([x[1] for x in tmp0], dtype=np.int64)
-                tmp3 = np.sqrt(klist_np[tmp1,ind0]*klist_np[tmp2,ind1])/num_qudit
-                Bij.append((tmp1,tmp2,tmp3))
+    Bij = _get_partial_trace_ABk_to_AB_index_hf0(int(num_qudit), int(dim))
+    len_klist = len(Bij[0][0])
     if return_tensor:
         Brsab = np.zeros((dim*dim,len_klist,len_klist), dtype=np.complex128)
         for ind0 in range(dim*dim):
@@ -149,8 +181,13 @@ def get_partial_trace_ABk_to_AB_index(num_qudit:int, dim:int, return_tensor=Fals
             Brsab[ind0,indI,indJ] = value
         Brsab = Brsab.reshape(dim,dim,len_klist,len_klist)
         ret = Brsab
+    elif fused:
+        index_row = np.concatenate([x[0]+ind0*len_klist for ind0,x in enumerate(Bij)])
+        index_col = np.concatenate([x[1] for x in Bij])
+        value = np.concatenate([x[2] for x in Bij])
+        ret = dim, index_row, index_col, value
     else:
-        ret = Bij
+        ret = list(Bij)
     return ret
 
 
@@ -162,16 +199,41 @@ def get_dicke_number(num_qudit:int, dim:int):
 
 # old name: qudit_partial_trace_AC_to_AB
 def partial_trace_ABk_to_AB(state, dicke_Bij):
-    assert state.ndim==2
-    dimA,dimBk = state.shape
-    dimB = int(np.sqrt(len(dicke_Bij)))
-    assert len(dicke_Bij)==dimB*dimB
-    ret = []
-    state_conj = state.conj()
-    for ind0,ind1,value in dicke_Bij:
-        ret.append((state[:,ind0] * value) @ state_conj[:,ind1].T)
-    if isinstance(state, torch.Tensor):
-        ret = torch.stack(ret, dim=2).reshape(dimA,dimA,dimB,dimB).transpose(1,2).reshape(dimA*dimB,dimA*dimB)
+    r'''partial trace of the bosonic extension state $|\psi\rangle\in\mathcal{H}_A\otimes\mathrm{Sym}^k(\mathcal{H}_B)$ to the AB system
+
+    Parameters:
+        state (np.ndarray,torch.Tensor): shape (dimA, #dicke) or (batch, dimA, #dicke), the coefficients in the Dicke basis
+        dicke_Bij (list,tuple): `numqi.dicke.get_partial_trace_ABk_to_AB_index(num_qudit, dimB, fused=True)` (recommended),
+            the list returned with `fused=False` is also supported. For `torch.Tensor` state, the indices should be `torch.Tensor` too
+
+    Returns:
+        ret (np.ndarray,torch.Tensor): shape (dimA*dimB, dimA*dimB) or (batch, dimA*dimB, dimA*dimB)
+    '''
+    assert state.ndim in (2,3)
+    shape = state.shape
+    dimA,num_dicke = shape[-2:]
+    state = state.reshape(-1, dimA, num_dicke)
+    batch_size = state.shape[0]
+    is_torch = isinstance(state, torch.Tensor)
+    if isinstance(dicke_Bij[0], int):
+        dimB,index_row,index_col,value = dicke_Bij
+    else:
+        dimB = int(np.sqrt(len(dicke_Bij)))
+        assert len(dicke_Bij)==dimB*dimB
+        hf0 = torch.cat if is_torch else np.concatenate
+        index_row = hf0([x[0]+ind0*num_dicke for ind0,x in enumerate(dicke_Bij)])
+        index_col = hf0([x[1] for x in dicke_Bij])
+        value = hf0([x[2] for x in dicke_Bij])
+    # all the dimB*dimB blocks in one sparse product, tmp0[b, rs*num_dicke+i] = sum_j B_{rs,ij} conj(state[b,j])
+    tmp1 = state.reshape(batch_size*dimA, num_dicke).conj()
+    if is_torch:
+        tmp0 = torch.zeros(batch_size*dimA, dimB*dimB*num_dicke, dtype=state.dtype, device=state.device)
+        tmp0 = tmp0.index_add(1, index_row, tmp1[:,index_col]*value)
+        tmp0 = tmp0.reshape(batch_size, dimA*dimB*dimB, num_dicke).transpose(1,2)
     else:
-        ret = np.stack(ret, axis=2).reshape(dimA,dimA,dimB,dimB).transpose(0,2,1,3).reshape(dimA*dimB,dimA*dimB)
+        tmp2 = scipy.sparse.csr_array((value, (index_row, index_col)), shape=(dimB*dimB*num_dicke, num_dicke))
+        tmp0 = (tmp2 @ tmp1.T).T.reshape(batch_size, dimA*dimB*dimB, num_dicke).transpose(0,2,1)
+    tmp0 = (state @ tmp0).reshape(batch_size,dimA,dimA,dimB,dimB)
+    tmp0 = tmp0.permute(0,1,3,2,4) if is_torch else tmp0.transpose(0,1,3,2,4)
+    ret = tmp0.reshape(*shape[:-2], dimA*dimB, dimA*dimB)
     return ret
@@ -5,6 +5,7 @@ from ._misc import (hf_interpolate_dm, check_swap_witness, get_dm_numerical_rang
 from .upb import (load_upb, upb_to_bes, get_upb_product,
                   LocalUnitaryEquivalentModel, BESNumEigenModel, BESNumEigen3qubitModel)
 from .ppt import (get_ppt_numerical_range, get_ppt_boundary, is_ppt, get_generalized_ppt_boundary, is_generalized_ppt,
+                  check_realignment_criterion, get_separability_prescreen,
                   cvx_matrix_xlogx, cvx_matrix_mlogx, get_ppt_ree, get_dm_cross_section_boundary, plot_dm_cross_section)
 from .cha import CHABoundaryBagging, AutodiffCHAREE
 from .pureb import PureBosonicExt
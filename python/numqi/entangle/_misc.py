@@ -7,35 +7,99 @@ from tqdm.auto import tqdm
 import numqi.gellmann
 import numqi.matrix_space
 import numqi.utils
+import numqi.optimize
 
 # TODO rename _density_matrix to _dm
 
-def _ree_bisection_solve(hf0, x0, x1, xtol, threshold, use_tqdm):
-    # function must be increasing, otherwise the result is not correct
-    # the REE function is okay
+def _ree_bisection_solve(hf0, x0, x1, xtol, threshold, use_tqdm, order=2):
+    # find the boundary where the increasing function hf0 reaches threshold, hf0 is flat (~0) before the boundary
+    # and grows like (x-x*)^order after it, e.g. order=2 for REE, order=1 for the nuclear norm (generalized PPT)
+    # secant (quadratic if possible) steps on the linearized curve hf0^(1/order) through the nearest points above threshold,
+    # the probes are placed at +-0.4*xtol around the predicted root so that the bracket closes in two evaluations,
+    # a bisection step is forced whenever the secant steps do not halve the bracket (Illinois-like safeguard)
     # do not evaluate hf0 on x0 or x1, the REE might be nan
     assert x0<x1
     maxiter = int(np.ceil(np.log2(max(2, (x1-x0)/xtol))))
-    tmp0 = tqdm(range(maxiter)) if use_tqdm else range(maxiter)
+    pbar = tqdm(total=maxiter) if use_tqdm else None
+    z_threshold = max(threshold, 0)**(1/order)
+    x_upper = [] #(x,z) above threshold, z=hf0^(1/order)
     history_info = []
-    for _ in tmp0:
-        xi = (x0 + x1)/2
+    width_ref = x1 - x0
+    num_secant = 0
+    while ((x1-x0)>xtol) and (len(history_info)<2*maxiter):
+        xi = None
+        if (len(x_upper)>=2) and (num_secant<3):
+            tmp0 = sorted(x_upper)[:3]
+            x_secant = None
+            if len(tmp0)==3:
+                tmp1 = np.roots(np.polyfit([x[0] for x in tmp0], [x[1]-z_threshold for x in tmp0], 2))
+                tmp1 = tmp1[np.isreal(tmp1)].real
+                tmp1 = tmp1[(tmp1>x0) & (tmp1<x1)]
+                if len(tmp1):
+                    x_secant = tmp1[np.argmin(np.abs(tmp1-tmp0[0][0]))]
+            (xa,za),(xb,zb) = tmp0[:2]
+            if (x_secant is None) and (zb>za):
+                x_secant = xa - (za-z_threshold)*(xb-xa)/(zb-za)
+            if x_secant is not None:
+                if x0 < x_secant-0.4*xtol < x1:
+                    xi = x_secant-0.4*xtol
+                elif x0 < x_secant+0.4*xtol < x1:
+                    xi = x_secant+0.4*xtol
+        if xi is None:
+            # a point above threshold near the boundary is more useful for the secant step than a point below
+            xi = x0 + (0.75 if (len(x_upper)==1) else 0.5)*(x1-x0)
+            num_secant = 0
+            width_ref = x1 - x0
+        else:
+            num_secant += 1
         yi = hf0(xi)
         history_info.append((xi,yi))
         if yi>=threshold:
             x1 = xi
+            x_upper.append((xi, max(yi,0)**(1/order)))
         else:
             x0 = xi
+        if (x1-x0) <= width_ref/2:
+            num_secant = 0
+            width_ref = x1 - x0
+        if pbar is not None:
+            pbar.update(1)
+    if pbar is not None:
+        pbar.close()
     history_info = np.array(sorted(history_info, key=lambda x: x[0]))
-    return xi,history_info
+    ret = (x0+x1)/2
+    return ret,history_info
+
+
+def _model_numerical_range_setup(model, op0, op1, kwargs, warm_start_tol):
+    # solver of one direction for the model with `.set_expectation_op()` and `.dm_torch`, see numqi.utils.run_parallel_sweep
+    state = dict(theta_warm=None, fval_accept=None)
+    def hf0(item):
+        theta_i,np_rng = item
+        # see numqi.entangle.get_ppt_numerical_range, we use the maximization there
+        model.set_expectation_op(-np.cos(theta_i)*op0 - np.sin(theta_i)*op1)
+        theta_optim = numqi.optimize.minimize_warm_start(model, state['theta_warm'], state['fval_accept'], seed=np_rng, **kwargs)
+        if warm_start_tol is not None:
+            state['theta_warm'] = theta_optim.x
+            state['fval_accept'] = theta_optim.fun + warm_start_tol
+        rho = model.dm_torch.detach().numpy()
+        ret = [np.trace(x @ rho).real for x in [op0,op1]]
+        return ret
+    # warm start only within the contiguous chunk
+    hf0.reset = lambda: state.update(theta_warm=None, fval_accept=None)
+    return hf0
 
 
-def _sdp_ree_solve(rho, use_tqdm, cvx_rho, cvxP, prob, obj, return_info, is_single_item):
-    ret = []
+def _sdp_ree_setup(hf_problem, problem_args, return_info):
+    # solver of one density matrix, `hf_problem(*problem_args)` returns the cached problem, see numqi.utils.run_parallel_sweep
+    cvx_rho, cvxP, prob, obj = hf_problem(*problem_args)
     hf0 = lambda x: np.ascontiguousarray(x.value)
-    for rho_i in (tqdm(rho) if use_tqdm else rho):
+    def hf1(rho_i):
         cvx_rho.value = rho_i
-        prob.solve()
+        # no warm start from the previous rho: SCS (chosen by cvxpy here) stops at a loose tolerance, and starting
+        # from another solution biases the result by ~1e-5, while it saves only a few percent of the iterations.
+        # A tolerance tight enough to remove the bias costs far more than the warm start saves (tens of times slower)
+        prob.solve(warm_start=False)
         ree = np.trace(rho_i @ scipy.linalg.logm(rho_i)).real + obj.value
         assert ree > -1e-4, str(ree) #for zero value, the prob.value will be around -1e-6
         # assert ree>-1e-5 #fail with solver=SCS
@@ -47,9 +111,16 @@ def _sdp_ree_solve(rho, use_tqdm, cvx_rho, cvxP, prob, obj, return_info, is_sing
                 'T': np.stack([hf0(x) for x in cvxP['T']], axis=0),
                 'mlogX': hf0(cvxP['mlogX']),
             }
-            ret.append((ree,info))
+            ret = ree,info
         else:
-            ret.append(ree)
+            ret = ree
+        return ret
+    return hf1
+
+
+def _sdp_ree_solve(rho, use_tqdm, hf_problem, problem_args, return_info, is_single_item, num_worker=1):
+    ret = numqi.utils.run_parallel_sweep(_sdp_ree_setup, (hf_problem, problem_args, return_info), list(rho),
+                num_worker=num_worker, use_tqdm=use_tqdm)
     if is_single_item:
         ret = ret[0]
     else:
@@ -156,18 +227,20 @@ def check_swap_witness(rho:np.ndarray, eps:float=-1e-7):
     r'''return whether the density matrix passes the swap witness criterion
 
     Parameters:
-        rho (np.ndarray): density matrix, `ndim=2`
+        rho (np.ndarray): density matrix, `shape=(N,N)` or `shape=(batch,N,N)`
         eps (float): threshold for the swap witness
 
     Returns:
-        ret (bool): whether the density matrix passes the swap witness criterion
+        ret (bool,np.ndarray): whether the density matrix passes the swap witness criterion,
+            bool array of `shape=(batch,)` for batch input
     '''
-    assert (rho.ndim==2) and (rho.shape[0]==rho.shape[1])
-    dimA = int(np.sqrt(rho.shape[0]))
-    assert dimA*dimA==rho.shape[0]
-    rho.reshape(dimA,dimA,dimA,dimA).transpose(0,1,3,2)
-    tmp0 = np.einsum(rho.reshape(dimA,dimA,dimA,dimA), [0,1,1,0], [], optimize=True).real.item()
+    assert (rho.ndim in (2,3)) and (rho.shape[-1]==rho.shape[-2])
+    dimA = int(np.sqrt(rho.shape[-1]))
+    assert dimA*dimA==rho.shape[-1]
+    tmp0 = np.einsum(rho.reshape(-1,dimA,dimA,dimA,dimA), [2,0,1,1,0], [2], optimize=True).real
     ret = tmp0 > eps
+    if rho.ndim==2:
+        ret = bool(ret[0])
     return ret
 
 
@@ -180,29 +253,34 @@ def check_reduction_witness(rho:np.ndarray, dim:tuple[int], eps:float=-1e-7):
     TODO, can positive linear map be parameterized
 
     Parameters:
-        rho (np.ndarray): density matrix, `ndim=2`
+        rho (np.ndarray): density matrix, `shape=(N,N)` or `shape=(batch,N,N)`
         dim (tuple[int]): dimension of the density matrix, `(dimA,dimB,dimC,...)`
         eps (float): threshold for the reduction witness. if min(eig(X))>eps, then we say X is positive
 
     Returns:
-        ret (bool): whether the density matrix passes the reduction criterion
+        ret (bool,np.ndarray): whether the density matrix passes the reduction criterion,
+            bool array of `shape=(batch,)` for batch input
     '''
-    N0 = rho.shape[0]
-    assert (rho.ndim==2) and (rho.shape[0]==rho.shape[1]) and (np.abs(rho-rho.T.conj()).max()<1e-10)
+    is_single = rho.ndim==2
+    rho = rho.reshape(-1, *rho.shape[-2:])
+    N0 = rho.shape[-1]
+    assert (rho.shape[1]==N0) and (np.abs(rho-rho.transpose(0,2,1).conj()).max()<1e-10)
     dim = numqi.utils.hf_tuple_of_int(dim)
-    assert (len(dim)>1) and (np.prod(dim)==rho.shape[0]) and all(x>1 for x in dim)
-    def hf0(i):
-        tmp0 = np.prod(dim[:i]) if i>0 else 1
-        tmp1 = np.prod(dim[(i+1):]) if (i+1)<len(dim) else 1
-        tmp2 = rho.reshape(tmp0,dim[i],tmp1,tmp0,dim[i],tmp1)
-        tmp3 = np.einsum(tmp2, [0,1,2,0,4,2], [1,4], optimize=True)
-        if tmp0!=1:
-            tmp3 = np.kron(np.eye(tmp0), tmp3)
-        if tmp1!=1:
-            tmp3 = np.kron(tmp3, np.eye(tmp1))
-        ret = numqi.utils.is_positive_semi_definite(tmp3-rho, shift=-eps)
-        return ret
-    ret = all(hf0(i) for i in range(len(dim)))
+    assert (len(dim)>1) and (np.prod(dim)==N0) and all(x>1 for x in dim)
+    ret = np.ones(rho.shape[0], dtype=np.bool_)
+    for ind0 in range(len(dim)):
+        ind1 = np.nonzero(ret)[0]
+        if len(ind1)==0:
+            break
+        tmp0 = int(np.prod(dim[:ind0]))
+        tmp1 = int(np.prod(dim[(ind0+1):]))
+        tmp2 = rho[ind1].reshape(-1,tmp0,dim[ind0],tmp1,tmp0,dim[ind0],tmp1)
+        tmp3 = np.einsum(tmp2, [6,0,1,2,0,4,2], [6,1,4], optimize=True)
+        # I \otimes rho_i \otimes I
+        tmp4 = np.einsum(np.eye(tmp0), [1,4], tmp3, [0,2,5], np.eye(tmp1), [3,6], [0,1,2,3,4,5,6], optimize=True).reshape(-1,N0,N0)
+        ret[ind1] = np.linalg.eigvalsh(tmp4-rho[ind1])[:,0] > eps
+    if is_single:
+        ret = bool(ret[0])
     return ret
 
 
@@ -217,19 +295,21 @@ def get_negativity(rho:np.ndarray, dim:tuple[int]):
     [wiki-link](https://en.wikipedia.org/wiki/Negativity_(quantum_mechanics))
 
     Parameters:
-        rho (np.ndarray): density matrix, `ndim=2`
+        rho (np.ndarray): density matrix, `shape=(N,N)` or `shape=(batch,N,N)`
         dim (tuple[int]): dimension of the density matrix, `(dimA,dimB)`
 
     Returns:
-        ret (float): negativity of the density matrix
+        ret (float,np.ndarray): negativity of the density matrix, `shape=(batch,)` for batch input
     '''
     assert len(dim)==2
-    dimA = int(dim)
-    dimB = int(dim)
-    assert (rho.ndim==2) and (rho.shape[0]==dimA*dimB) and (rho.shape[0]==rho.shape[1])
-    assert np.abs(rho-rho.T.conj()).max() < 1e-10
-    tmp0 = rho.reshape(dimA, dimB, dimA, dimB).transpose(0,3,2,1).reshape(dimA*dimB,dimA*dimB)
-    ret = (np.abs(np.linalg.eigvals(tmp0)).sum()-1) / 2
+    dimA = int(dim[0])
+    dimB = int(dim[1])
+    assert (rho.ndim in (2,3)) and (rho.shape[-1]==dimA*dimB) and (rho.shape[-1]==rho.shape[-2])
+    assert np.abs(rho-rho.swapaxes(-2,-1).conj()).max() < 1e-10
+    tmp0 = rho.reshape(-1, dimA, dimB, dimA, dimB).transpose(0,1,4,3,2).reshape(-1,dimA*dimB,dimA*dimB)
+    ret = (np.abs(np.linalg.eigvalsh(tmp0)).sum(axis=1)-1) / 2
+    if rho.ndim==2:
+        ret = ret.item()
     return ret
 
 
@@ -3,7 +3,6 @@ import numpy as np
 import cvxpy
 from tqdm.auto import tqdm
 import contextlib
-import scipy.linalg
 import math
 
 import numqi.gellmann
@@ -13,7 +12,7 @@ import numqi.optimize
 import numqi.manifold
 from numqi.manifold.plot import plot_cha_trivialization_map
 
-from ._misc import get_density_matrix_boundary, hf_interpolate_dm, _ree_bisection_solve
+from ._misc import get_density_matrix_boundary, hf_interpolate_dm, _ree_bisection_solve, _model_numerical_range_setup
 
 # TODO docs/api
 
@@ -23,7 +22,9 @@ def _rand_norm_bounded_unitary(dim, norm2_bound, N0, np_rng):
     tmp0 = np_rng.normal(size=(N0,dim,dim)) + 1j*np_rng.normal(size=(N0,dim,dim))
     ret = tmp0 + tmp0.transpose(0,2,1).conj()
     norm = np.linalg.norm(ret, axis=(1,2), ord='fro', keepdims=True)
-    ret = scipy.linalg.expm(ret*(1j*norm2_bound/norm))
+    # expm(1j*H) via the eigen-decomposition of the Hermitian H
+    EVL,EVC = np.linalg.eigh(ret*(norm2_bound/norm))
+    ret = (EVC * np.exp(1j*EVL)[:,np.newaxis]) @ EVC.transpose(0,2,1).conj()
     return ret
 
 
@@ -48,33 +49,204 @@ def _cha_reset_state(ketA, ketB, probability, threshold, norm, np_rng, indexR=No
     return ret
 
 
+class _CHARaySimplex:
+    # revised primal simplex for the convex-hull ray LP
+    #   max beta, s.t. sum_i lambda_i a_i = beta d, sum_i lambda_i = 1, lambda_i >= 0
+    # beta=beta0-beta1 is split into two non-negative variables, the (dim+1) artificial variables are only used in phase-1.
+    # The basis is kept between the calls, replacing the non-basic (zero probability) columns keeps it feasible,
+    # so no phase-1 is needed after each round of CHABoundaryBagging
+    def __init__(self, vec_target:np.ndarray, num_state:int, zero_eps:float=1e-9, refactor_freq:int=50):
+        dim = vec_target.shape[0]
+        self.num_state = num_state
+        self.dim = dim
+        self.zero_eps = zero_eps
+        self.refactor_freq = refactor_freq
+        self.matA = np.zeros((dim+1, num_state+2+dim+1), dtype=np.float64)
+        self.matA[dim,:num_state] = 1
+        self.matA[:dim,num_state] = -vec_target
+        self.matA[:dim,num_state+1] = vec_target
+        self.matA[:,num_state+2:] = np.eye(dim+1)
+        self.vecb = np.zeros(dim+1, dtype=np.float64)
+        self.vecb[dim] = 1
+        self.cost = np.zeros(self.matA.shape[1], dtype=np.float64)
+        self.cost[num_state] = -1
+        self.cost[num_state+1] = 1
+        self.basis = None
+        self.basis_inv = None
+        self.probability = None
+        self.status = None
+
+    def set_column(self, vec:np.ndarray, index:np.ndarray|None=None):
+        if index is None:
+            self.matA[:self.dim,:self.num_state] = vec.T
+        else:
+            self.matA[:self.dim,:self.num_state][:,index] = vec.T
+
+    def permute(self, index:np.ndarray):
+        self.matA[:,:self.num_state] = self.matA[:,index]
+        if self.basis is not None:
+            tmp0 = np.argsort(index)
+            mask = self.basis<self.num_state
+            self.basis[mask] = tmp0[self.basis[mask]]
+        if self.probability is not None:
+            self.probability = self.probability[index]
+
+    def _refactor(self):
+        # return False if the basis is singular
+        tmp0 = self.matA[:,self.basis]
+        if np.linalg.cond(tmp0) > 1/self.zero_eps:
+            return False
+        self.basis_inv = np.linalg.inv(tmp0)
+        return True
+
+    def _iterate(self, cost, num_column, maxiter):
+        # return 'optimal', 'unbounded', 'singular' or 'maxiter', the explicit basis inverse is updated by the pivot (product form)
+        basis = self.basis
+        num_degenerate = 0
+        for ind_step in range(maxiter):
+            if ind_step and (ind_step%self.refactor_freq==0) and (not self._refactor()):
+                return 'singular'
+            Binv = self.basis_inv
+            xB = np.maximum(Binv @ self.vecb, 0)
+            reduced_cost = cost[:num_column] - (cost[basis] @ Binv) @ self.matA[:,:num_column]
+            reduced_cost[basis[basis<num_column]] = 0
+            if reduced_cost.min() >= -self.zero_eps:
+                return 'optimal'
+            # Dantzig rule, switch to Bland rule (anti-cycling) on a long run of degenerate pivots
+            if num_degenerate<50:
+                ind_in = np.argmin(reduced_cost)
+            else:
+                ind_in = np.nonzero(reduced_cost < -self.zero_eps)[0][0]
+            u = Binv @ self.matA[:,ind_in]
+            ind0 = np.nonzero(u > self.zero_eps)[0]
+            if len(ind0)==0:
+                return 'unbounded'
+            ratio = xB[ind0] / u[ind0]
+            tmp0 = ind0[ratio <= ratio.min() + self.zero_eps]
+            ind_out = tmp0[np.argmin(basis[tmp0])]
+            num_degenerate = (num_degenerate+1) if (xB[ind_out] <= self.zero_eps) else 0
+            basis[ind_out] = ind_in
+            tmp1 = Binv[ind_out] / u[ind_out]
+            Binv -= u[:,np.newaxis] * tmp1
+            Binv[ind_out] = tmp1
+        return 'maxiter'
+
+    def _phase1(self, maxiter):
+        # return 'feasible', 'infeasible', 'singular' or 'maxiter'
+        num_column = self.num_state + 2
+        self.basis = np.arange(num_column, self.matA.shape[1])
+        self.basis_inv = np.eye(self.dim+1)
+        cost = np.zeros(self.matA.shape[1], dtype=np.float64)
+        cost[num_column:] = 1
+        status = self._iterate(cost, self.matA.shape[1], maxiter)
+        if (status!='optimal') or (not self._refactor()):
+            self.basis = None
+            return 'singular' if (status=='optimal') else status
+        xB = self.basis_inv @ self.vecb
+        if xB[self.basis>=num_column].sum() > np.sqrt(self.zero_eps):
+            self.basis = None
+            return 'infeasible'
+        # drive the (zero) artificial variables out of the basis, the redundant rows keep theirs
+        for ind0 in np.nonzero(self.basis>=num_column)[0]:
+            tmp0 = np.ones(num_column, dtype=np.bool_)
+            tmp0[self.basis[self.basis<num_column]] = False
+            ind1 = np.nonzero(tmp0)[0]
+            tmp1 = self.basis_inv[ind0] @ self.matA[:,ind1]
+            if np.abs(tmp1).max() > np.sqrt(self.zero_eps):
+                self.basis[ind0] = ind1[np.argmax(np.abs(tmp1))]
+                if not self._refactor():
+                    self.basis = None
+                    return 'singular'
+        return 'feasible'
+
+    def _solve_simplex(self, maxiter:int):
+        # return (status, beta), the warm basis is tried first, and phase-1 restarts from scratch if it breaks down
+        num_column = self.num_state + 2
+        is_warm = (self.basis is not None) and self._refactor()
+        if is_warm:
+            xB = self.basis_inv @ self.vecb
+            is_warm = (xB.min() >= -np.sqrt(self.zero_eps)) and (xB[self.basis>=num_column].sum() <= np.sqrt(self.zero_eps))
+        for ind_round in range(1 if is_warm else 2, 3):
+            if ind_round==2:
+                status = self._phase1(maxiter)
+                if status!='feasible':
+                    return status, None
+            status = self._iterate(self.cost, num_column, maxiter)
+            if (status=='optimal') and (not self._refactor()):
+                status = 'singular'
+            if status!='singular':
+                break
+            self.basis = None
+        if status!='optimal':
+            self.basis = None
+            return status, None
+        x = np.zeros(self.matA.shape[1], dtype=np.float64)
+        x[self.basis] = np.maximum(self.basis_inv @ self.vecb, 0)
+        self.probability = x[:self.num_state]
+        ret = x[self.num_state] - x[self.num_state+1]
+        return status, ret
+
+    def _solve_cvxpy(self):
+        vec_target = self.matA[:self.dim,self.num_state+1]
+        cvx_lambda = cvxpy.Variable(self.num_state)
+        cvx_beta = cvxpy.Variable()
+        constraints = [self.matA[:self.dim,:self.num_state] @ cvx_lambda==cvx_beta*vec_target, cvxpy.sum(cvx_lambda)==1, cvx_lambda>=0]
+        prob = cvxpy.Problem(cvxpy.Maximize(cvx_beta), constraints)
+        ret = prob.solve()
+        self.probability = None if (cvx_lambda.value is None) else np.maximum(cvx_lambda.value, 0)
+        return ret
+
+    def solve(self, maxiter:int=10000):
+        r'''return the optimal beta, `-inf` if infeasible and `inf` if unbounded. the solution is stored in `.probability`.
+        If the simplex breaks down (singular basis after a restart) or hits `maxiter`, the LP is solved by cvxpy instead
+        and `.status` records the reason, otherwise `.status` is the simplex status'''
+        status,ret = self._solve_simplex(maxiter)
+        self.status = status
+        if status=='infeasible':
+            self.probability = None
+            ret = -math.inf
+        elif status=='unbounded':
+            self.probability = None
+            ret = math.inf
+        elif status!='optimal': #'singular' or 'maxiter'
+            ret = self._solve_cvxpy()
+        return ret
+
+
 class CHABoundaryBagging:
     r'''Convex Hull Approximation with Bagging
 
     Separability-entanglement classifier via machine learning
     [doi-link](https://doi.org/10.1103/PhysRevA.98.012315)
     '''
-    def __init__(self, dim:tuple[int], num_state:int|None=None):
+    def __init__(self, dim:tuple[int], num_state:int|None=None, solver:str='simplex'):
         r'''initialize the model
 
         Parameters:
             dim (tuple[int]): dimension of the bipartite system, len(dim) must be 2
             num_state (int): number of states in the convex hull, default to 3*(dim[0]*dim[1])**2
+            solver (str): 'simplex' (native active-set solver warm-started from the previous basis,
+                only the replaced states are updated) or 'cvxpy' (the linear program is solved from scratch in each iteration)
         '''
         assert len(dim)==2
+        assert solver in {'simplex','cvxpy'}
         dimA,dimB = dim
         num_state = 3*(dimA*dimB)**2 if (num_state is None) else num_state
         self.dimA = dim[0]
         self.dimB = dim[1]
         # 3*dimA*dimB*dimA*dimB looks good for 3x3 bipartite system
         self.num_state = num_state
-
-        self.cvx_beta = cvxpy.Variable(name='beta')
-        self.cvx_lambda = cvxpy.Variable(num_state, name='lambda')
-        self.cvx_A_r = cvxpy.Parameter((num_state,dimA*dimB*dimA*dimB))
-        self.cvx_A_i = cvxpy.Parameter((num_state,dimA*dimB*dimA*dimB))
-        self.cvx_obj = cvxpy.Maximize(self.cvx_beta)
+        self.solver = solver
+
+        if solver=='cvxpy':
+            self.cvx_beta = cvxpy.Variable(name='beta')
+            self.cvx_lambda = cvxpy.Variable(num_state, name='lambda')
+            self.cvx_A_r = cvxpy.Parameter((num_state,dimA*dimB*dimA*dimB))
+            self.cvx_A_i = cvxpy.Parameter((num_state,dimA*dimB*dimA*dimB))
+            self.cvx_obj = cvxpy.Maximize(self.cvx_beta)
         self.cvx_problem = None
+        self.simplex = None
+        self.probability = None
         self.dm_target = None
         self.ketA = None
         self.ketB = None
@@ -88,14 +260,31 @@ class CHABoundaryBagging:
         for _ in range(max_retry):
             self.ketA = hf0(self.num_state, self.dimA)
             self.ketB = hf0(self.num_state, self.dimB)
-            beta = self._cvxpy_solve()
+            beta = self._lp_solve()
             if (beta is not None) and (not math.isinf(beta)):
                 break
         else:
             raise RuntimeError('Failed to find a good initial state')
-        ind0 = np.argsort(self.cvx_lambda.value)[::-1]
+        ind0 = np.argsort(self.probability)[::-1]
         self.ketA = self.ketA[ind0]
         self.ketB = self.ketB[ind0]
+        if self.solver=='simplex':
+            self.simplex.permute(ind0)
+        self.probability = self.probability[ind0]
+
+    def _lp_solve(self, index:np.ndarray|None=None):
+        # index: the replaced states, None for all
+        if self.solver=='simplex':
+            ketA,ketB = (self.ketA,self.ketB) if (index is None) else (self.ketA[index],self.ketB[index])
+            tmp0 = (ketA[:,:,np.newaxis]*ketB[:,np.newaxis]).reshape(ketA.shape[0], -1)
+            tmp1 = numqi.gellmann.dm_to_gellmann_basis(tmp0[:,:,np.newaxis]*tmp0[:,np.newaxis].conj())
+            self.simplex.set_column(tmp1, index)
+            ret = self.simplex.solve()
+            self.probability = self.simplex.probability
+        else:
+            ret = self._cvxpy_solve()
+            self.probability = self.cvx_lambda.value
+        return ret
 
     def _cvxpy_solve(self):
         N0 = self.dimA*self.dimB
@@ -132,35 +321,39 @@ class CHABoundaryBagging:
         assert abs(np.trace(dm)-1) < 1e-10
         assert np.abs(dm-dm.T.conj()).max() < 1e-10
         self.dm_target = dm.copy() #maybe not necessary
-        dm_normed = (dm - np.eye(N0)/N0).reshape(-1) / numqi.gellmann.dm_to_gellmann_norm(dm)
-        cvx_constrants = [
-            self.cvx_beta*dm_normed.real==self.cvx_lambda @ self.cvx_A_r,
-            self.cvx_beta*dm_normed.imag==self.cvx_lambda @ self.cvx_A_i,
-            self.cvx_lambda>=0,
-            cvxpy.sum(self.cvx_lambda)==1,
-        ]
-        self.cvx_problem = cvxpy.Problem(self.cvx_obj, cvx_constrants)
+        if self.solver=='simplex':
+            tmp0 = numqi.gellmann.dm_to_gellmann_basis(dm)
+            self.simplex = _CHARaySimplex(tmp0/np.linalg.norm(tmp0), self.num_state)
+        else:
+            dm_normed = (dm - np.eye(N0)/N0).reshape(-1) / numqi.gellmann.dm_to_gellmann_norm(dm)
+            cvx_constrants = [
+                self.cvx_beta*dm_normed.real==self.cvx_lambda @ self.cvx_A_r,
+                self.cvx_beta*dm_normed.imag==self.cvx_lambda @ self.cvx_A_i,
+                self.cvx_lambda>=0,
+                cvxpy.sum(self.cvx_lambda)==1,
+            ]
+            self.cvx_problem = cvxpy.Problem(self.cvx_obj, cvx_constrants)
 
         np_rng = numqi.random.get_numpy_rng(seed)
         if num_init_retry>0:
             self._rand_init_state(np_rng, num_init_retry)
-        beta_history = [self._cvxpy_solve()]
-        assert beta_history[-1] is not None, 'cvxpy solve failed, num_state might be too small'
+        beta_history = [self._lp_solve()]
+        assert (beta_history[-1] is not None) and (not math.isinf(beta_history[-1])), 'LP solve failed, num_state might be too small'
         norm2_bound = norm2_init
         with (tqdm(range(maxiter)) if use_tqdm else contextlib.nullcontext()) as pbar:
             for _ in (pbar if use_tqdm else range(maxiter)):
                 if use_tqdm:
                     pbar.set_postfix_str(f'beta={beta_history[-1]:.5f}, eps={norm2_bound:.4f}')
-                mask,tmp2,tmp3 = _cha_reset_state(self.ketA, self.ketB, self.cvx_lambda.value, threshold, norm2_bound, np_rng)
+                mask,tmp2,tmp3 = _cha_reset_state(self.ketA, self.ketB, self.probability, threshold, norm2_bound, np_rng)
                 if mask is not None:
                     self.ketA[mask] = tmp2
                     self.ketB[mask] = tmp3
                 norm2_bound *= decay_rate
-                beta_history.append(self._cvxpy_solve())
+                beta_history.append(self._lp_solve(mask))
         beta = beta_history[-1]
         if return_info:
-            mask = self.cvx_lambda.value > 0
-            ret = beta, (self.ketA[mask],self.ketB[mask],self.cvx_lambda.value[mask], beta_history)
+            mask = self.probability > 0
+            ret = beta, (self.ketA[mask],self.ketB[mask],self.probability[mask], beta_history)
         else:
             ret = beta
         return ret
@@ -231,18 +424,22 @@ class AutodiffCHAREE(torch.nn.Module):
         return loss
 
     def get_boundary(self, dm0:np.ndarray, xtol:float=1e-4, converge_tol:float=1e-10, threshold:float=1e-7, num_repeat:int=1,
-                    use_tqdm:bool=True, return_info:bool=False, seed:int|None=None):
+                    use_tqdm:bool=True, return_info:bool=False, seed:int|None=None, checkpoint:str|None=None,
+                    warm_start:bool=False):
         r'''get the boundary of the convex hull approximation
 
         Parameters:
             dm0 (np.ndarray): initial density matrix
-            xtol (float): tolerance for the bisection, default to 1e-4
+            xtol (float): tolerance of the boundary, default to 1e-4
             converge_tol (float): tolerance for the optimization, default to 1e-10
             threshold (float): threshold for the probability, default to 1e-7
             num_repeat (int): number of repeats for the optimization, default to 1
             use_tqdm (bool): use tqdm, default to True
             return_info (bool): return the information of the optimization, default to False
             seed (int): random seed, default to None
+            checkpoint (str|None): checkpoint file, completed points are saved and skipped after restart, default to None
+            warm_start (bool): start each step from the optimum of the nearest evaluated beta, random restarts are used only if
+                the warm solution is above threshold, default to False
 
         Returns:
             beta (float): the optimal beta, boundary length
@@ -251,19 +448,27 @@ class AutodiffCHAREE(torch.nn.Module):
         beta_u = get_density_matrix_boundary(dm0)[1]
         dm0_norm = numqi.gellmann.dm_to_gellmann_norm(dm0)
         np_rng = numqi.random.get_numpy_rng(seed)
+        theta_warm = []
         def hf0(beta):
             # use alpha to avoid time-consuming gellmann conversion
             tmp0 = hf_interpolate_dm(dm0, alpha=beta/dm0_norm)
             self.set_dm_target(tmp0)
-            theta_optim = numqi.optimize.minimize(self, theta0='uniform',
-                        tol=converge_tol, num_repeat=num_repeat, seed=np_rng, print_every_round=0)
+            # the loss is an upper bound of the minimum, so the warm solution below threshold is safe to accept
+            # the secant probes come in close pairs, start from the optimum of the nearest evaluated beta
+            tmp1 = min(theta_warm, key=lambda x: abs(x[0]-beta))[1] if theta_warm else None
+            theta_optim = numqi.optimize.minimize_warm_start(self, tmp1, threshold,
+                        theta0='uniform', tol=converge_tol, num_repeat=num_repeat, seed=np_rng, print_every_round=0)
+            if warm_start:
+                theta_warm.append((beta, theta_optim.x))
             return float(theta_optim.fun)
+        hf0 = numqi.optimize.SweepCheckpoint(checkpoint, np_rng).wrap(hf0)
         beta,history_info = _ree_bisection_solve(hf0, 0, beta_u, xtol, threshold, use_tqdm=use_tqdm)
         ret = (beta,history_info) if return_info else beta
         return ret
 
     def get_numerical_range(self, op0:np.ndarray, op1:np.ndarray, num_theta:int=400, converge_tol:float=1e-5,
-                            num_repeat:int=1, use_tqdm:bool=True, seed:int|None=None):
+                            num_repeat:int=1, use_tqdm:bool=True, seed:int|None=None, checkpoint:str|None=None,
+                            warm_start_tol:float|None=None, num_worker:int=1):
         r'''get the numerical range of the two Hermitian operators
 
         Parameters:
@@ -274,21 +479,28 @@ class AutodiffCHAREE(torch.nn.Module):
             num_repeat (int): number of repeats for the optimization, default to 1
             use_tqdm (bool): use tqdm, default to True
             seed (int): random seed, default to None
+            checkpoint (str|None): checkpoint file, completed points are saved and skipped after restart, default to None
+            warm_start_tol (float|None): if not None, each theta is started from the optimum of the previous theta, random
+                restarts are used only if the loss increases by more than `warm_start_tol`, default to None
+            num_worker (int): number of processes, the directions are sharded over the workers, default to 1
 
         Returns:
             ret (np.ndarray): the numerical range of the two Hermitian operators, `shape=(num_theta,2)`
+
+        if `num_worker>1`, the model is pickled to the workers, and `self.dm_torch` is not the last solution after the call
         '''
         np_rng = numqi.random.get_numpy_rng(seed)
         N0 = self.dim0*self.dim1
         assert (op0.shape==(N0,N0)) and (op1.shape==(N0,N0))
         theta_list = np.linspace(0, 2*np.pi, num_theta)
-        ret = []
-        kwargs = dict(num_repeat=num_repeat, seed=np_rng, print_every_round=0, tol=converge_tol)
-        for theta_i in (tqdm(theta_list) if use_tqdm else theta_list):
-            # see numqi.entangle.ppt.get_ppt_numerical_range, we use the maximization there
-            self.set_expectation_op(-np.cos(theta_i)*op0 - np.sin(theta_i)*op1)
-            numqi.optimize.minimize(self, **kwargs)
-            rho = self.dm_torch.numpy()
-            ret.append([np.trace(x @ rho).real for x in [op0,op1]])
-        ret = np.array(ret)
+        kwargs = dict(num_repeat=num_repeat, print_every_round=0, tol=converge_tol)
+        sweep_ckpt = numqi.optimize.SweepCheckpoint(checkpoint, np_rng)
+        ind_list = [x for x in range(num_theta) if x not in sweep_ckpt]
+        # each worker needs its own random generator
+        rng_list = [np_rng]*len(ind_list) if (num_worker==1) else np_rng.spawn(len(ind_list))
+        def hf_callback(ind0, ret_i):
+            sweep_ckpt[ind_list[ind0]] = ret_i
+        numqi.utils.run_parallel_sweep(_model_numerical_range_setup, (self, op0, op1, kwargs, warm_start_tol),
+                [(theta_list[x],y) for x,y in zip(ind_list,rng_list)], num_worker=num_worker, use_tqdm=use_tqdm, hf_callback=hf_callback)
+        ret = np.array([sweep_ckpt[x] for x in range(num_theta)])
         return ret
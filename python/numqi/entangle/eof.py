@@ -103,13 +103,44 @@ def get_eof_2qubit(rho:np.ndarray):
     return ret
 
 
+def _eof_sqrt_rho(rho:np.ndarray, dimA:int, dimB:int, rank:int, batch_size:int|None):
+    # square root of the density matrix rho=XX^dagger, X.shape=(...,dimA,dimB,rank)
+    if batch_size is None:
+        assert rho.shape == (dimA*dimB, dimA*dimB)
+    else:
+        assert rho.shape == (batch_size, dimA*dimB, dimA*dimB)
+    assert np.abs(rho - rho.swapaxes(-2,-1).conj()).max() < 1e-10
+    assert np.abs(np.trace(rho, axis1=-2, axis2=-1) - 1).max() < 1e-10
+    EVL,EVC = np.linalg.eigh(rho)
+    assert EVL[...,0].min() > -1e-10
+    EVL = np.maximum(0, EVL[...,-rank:])
+    assert np.abs(EVL.sum(axis=-1)-1).max() < 1e-10
+    EVC = EVC[...,-rank:]
+    ret = (EVC * np.sqrt(EVL)[...,np.newaxis,:]).reshape(*rho.shape[:-2], dimA, dimB, rank)
+    return ret
+
+
+def _eof_batch_contract_expr(dimA:int, dimB:int, num_term:int, rank:int, batch_size:int):
+    # (sqrt_rho, sqrt_rho.conj, mat_st, mat_st.conj) -> reduced density matrix of the smaller subsystem,
+    # the label 6 is the batch index, the sqrt of the density matrices is an operand so the expression is compiled once
+    if dimA<=dimB:
+        tmp0 = [(batch_size,dimA,dimB,rank), [6,0,3,4], (batch_size,dimA,dimB,rank), [6,1,3,5]]
+        tmp1 = dimA
+    else:
+        tmp0 = [(batch_size,dimA,dimB,rank), [6,3,0,4], (batch_size,dimA,dimB,rank), [6,3,1,5]]
+        tmp1 = dimB
+    ret = opt_einsum.contract_expression(*tmp0, (batch_size,num_term,rank), [6,2,4],
+                    (batch_size,num_term,rank), [6,2,5], [6,2,0,1])
+    return ret,tmp1
+
+
 class EntanglementFormationModel(torch.nn.Module):
     '''Calculate the entanglement of formation (EOF) of a bipartite pure state via optimization
 
     Variational characterizations of separability and entanglement of formation
     [doi-link](https://doi.org/10.1103/PhysRevA.64.052304)
     '''
-    def __init__(self, dimA:int, dimB:int, num_term:int, rank:int|None=None):
+    def __init__(self, dimA:int, dimB:int, num_term:int, rank:int|None=None, batch_size:int|None=None):
         r'''Initialize the model
 
         Parameters:
@@ -117,6 +148,8 @@ class EntanglementFormationModel(torch.nn.Module):
             dimB (int): the dimension of the second subsystem
             num_term (int): the number of terms in the variational ansatz, `num_term` is bounded by (dimA*dimB)**2
             rank (int,None): the rank of the density matrix
+            batch_size (int|None): if not None, `batch_size` density matrices are optimized jointly, the loss is the sum
+                of the EOF and the EOF of each item is stored in `.loss_batch`. see `numqi.optimize.minimize_batch`
         '''
         super().__init__()
         self.dtype = torch.float64
@@ -127,29 +160,29 @@ class EntanglementFormationModel(torch.nn.Module):
             rank = dimA*dimB
         self.num_term = num_term
         assert num_term>=rank
-        self.manifold = numqi.manifold.Stiefel(num_term, rank, dtype=self.cdtype, method='polar')
+        assert (batch_size is None) or (batch_size>=1)
+        self.batch_size = batch_size
+        self.manifold = numqi.manifold.Stiefel(num_term, rank, batch_size=batch_size, dtype=self.cdtype, method='polar')
         self.rank = rank
 
         self._sqrt_rho = None
         self._eps = torch.tensor(torch.finfo(self.dtype).smallest_normal, dtype=self.dtype)
         self.contract_expr = None
+        self.loss_batch = None
+        if batch_size is not None:
+            self.contract_expr = _eof_batch_contract_expr(dimA, dimB, num_term, rank, batch_size)[0]
 
     def set_density_matrix(self, rho:np.ndarray):
         r'''Set the density matrix
 
         Parameters:
-            rho (np.ndarray): the density matrix, shape=(dimA*dimB,dimA*dimB)
+            rho (np.ndarray): the density matrix, shape=(dimA*dimB,dimA*dimB), or (batch_size,dimA*dimB,dimA*dimB)
+                for the batched model
         '''
-        assert rho.shape == (self.dimA*self.dimB, self.dimA*self.dimB)
-        assert np.abs(rho - rho.T.conj()).max() < 1e-10
-        assert abs(np.trace(rho) - 1) < 1e-10
-        assert np.linalg.eigvalsh(rho)[0] > -1e-10
-        EVL,EVC = np.linalg.eigh(rho)
-        EVL = np.maximum(0, EVL[-self.rank:])
-        assert abs(EVL.sum()-1) < 1e-10
-        EVC = EVC[:,-self.rank:]
-        tmp0 = (EVC * np.sqrt(EVL)).reshape(self.dimA, self.dimB, self.rank)
+        tmp0 = _eof_sqrt_rho(rho, self.dimA, self.dimB, self.rank, self.batch_size)
         self._sqrt_rho = torch.tensor(tmp0, dtype=self.cdtype)
+        if self.batch_size is not None:
+            return
         tmp0 = self._sqrt_rho.conj().resolve_conj()
         if self.dimA<=self.dimB:
             self.contract_expr = opt_einsum.contract_expression(self._sqrt_rho, [0,3,4], tmp0, [1,3,5],
@@ -160,12 +193,20 @@ class EntanglementFormationModel(torch.nn.Module):
 
     def forward(self):
         mat_st = self.manifold()
-        rdm_not_normed = self.contract_expr(mat_st, mat_st.conj(), backend='torch')
+        if self.batch_size is None:
+            rdm_not_normed = self.contract_expr(mat_st, mat_st.conj(), backend='torch')
+        else:
+            rdm_not_normed = self.contract_expr(self._sqrt_rho, self._sqrt_rho.conj(), mat_st, mat_st.conj(), backend='torch')
         EVL = torch.linalg.eigvalsh(rdm_not_normed)
         tmp0 = torch.log(torch.maximum(EVL, self._eps))
-        prob = torch.einsum(rdm_not_normed, [0,1,1], [0]).real
+        prob = torch.diagonal(rdm_not_normed, dim1=-2, dim2=-1).sum(-1).real
         tmp1 = torch.log(torch.maximum(prob, self._eps))
-        ret = torch.dot(prob,tmp1) - torch.dot(EVL.reshape(-1), tmp0.reshape(-1))
+        if self.batch_size is None:
+            ret = torch.dot(prob,tmp1) - torch.dot(EVL.reshape(-1), tmp0.reshape(-1))
+        else:
+            tmp2 = (prob*tmp1).sum(1) - (EVL*tmp0).sum((1,2))
+            self.loss_batch = tmp2.detach()
+            ret = tmp2.sum()
         return ret
 
 
@@ -175,7 +216,7 @@ class ConcurrenceModel(torch.nn.Module):
     What is the motivation for the definition of concurrence in quantum information?
     [stackexchange-link](https://physics.stackexchange.com/a/46509/283720)
     '''
-    def __init__(self, dimA:int, dimB:int, num_term:int, rank:int=None):
+    def __init__(self, dimA:int, dimB:int, num_term:int, rank:int=None, batch_size:int|None=None):
         r'''Initialize the model
 
         Parameters:
@@ -183,6 +224,10 @@ class ConcurrenceModel(torch.nn.Module):
             dimB (int): the dimension of the second subsystem
             num_term (int): the number of terms in the variational ansatz, `num_term` is bounded by (dimA*dimB)**2
             rank (int): the rank of the density matrix
+            batch_size (int|None): if not None, `batch_size` density matrices are optimized jointly, the loss is the sum
+                of the concurrence and the concurrence of each item is stored in `.loss_batch`.
+                see `numqi.optimize.minimize_batch`. The loss is non-smooth at the optimum of the separable states,
+                which stalls the line search of the whole batch, so it's better to batch the entangled states only
         '''
         super().__init__()
         self.dtype = torch.float64
@@ -194,29 +239,31 @@ class ConcurrenceModel(torch.nn.Module):
         self.num_term = num_term
         assert num_term>=rank
         self.rank = rank
-        self.manifold = numqi.manifold.Stiefel(num_term, rank, dtype=self.cdtype, method='polar')
+        assert (batch_size is None) or (batch_size>=1)
+        self.batch_size = batch_size
+        self.manifold = numqi.manifold.Stiefel(num_term, rank, batch_size=batch_size, dtype=self.cdtype, method='polar')
 
         self._sqrt_rho = None
         self._eps = torch.tensor(torch.finfo(self.dtype).smallest_normal, dtype=self.dtype)
         self.contract_expr = None
         self.contract_expr1 = None
+        self.loss_batch = None
+        if batch_size is not None:
+            self.contract_expr,tmp0 = _eof_batch_contract_expr(dimA, dimB, num_term, rank, batch_size)
+            self.contract_expr1 = opt_einsum.contract_expression([batch_size,num_term,tmp0,tmp0], [3,0,1,2],
+                            [batch_size,num_term,tmp0,tmp0], [3,0,1,2], [3,0])
 
     def set_density_matrix(self, rho:np.ndarray):
         r'''Set the density matrix
 
         Parameters:
-            rho (np.ndarray): the density matrix, shape=(dimA*dimB,dimA*dimB)
+            rho (np.ndarray): the density matrix, shape=(dimA*dimB,dimA*dimB), or (batch_size,dimA*dimB,dimA*dimB)
+                for the batched model
         '''
-        assert rho.shape == (self.dimA*self.dimB, self.dimA*self.dimB)
-        assert np.abs(rho - rho.T.conj()).max() < 1e-10
-        assert abs(np.trace(rho) - 1) < 1e-10
-        assert np.linalg.eigvalsh(rho)[0] > -1e-10
-        EVL,EVC = np.linalg.eigh(rho)
-        EVL = np.maximum(0, EVL[-self.rank:])
-        assert abs(EVL.sum()-1) < 1e-10
-        EVC = EVC[:,-self.rank:]
-        tmp0 = (EVC * np.sqrt(EVL)).reshape(self.dimA, self.dimB, self.rank)
+        tmp0 = _eof_sqrt_rho(rho, self.dimA, self.dimB, self.rank, self.batch_size)
         self._sqrt_rho = torch.tensor(tmp0, dtype=self.cdtype)
+        if self.batch_size is not None:
+            return
         tmp0 = self._sqrt_rho.conj().resolve_conj()
         if self.dimA<=self.dimB:
             self.contract_expr = opt_einsum.contract_expression(self._sqrt_rho, [0,3,4], tmp0, [1,3,5],
@@ -229,9 +276,17 @@ class ConcurrenceModel(torch.nn.Module):
 
     def forward(self):
         mat_st = self.manifold()
-        rdm_not_normed = self.contract_expr(mat_st, mat_st.conj(), backend='torch')
-        prob = torch.einsum(rdm_not_normed, [0,1,1], [0]).real
+        if self.batch_size is None:
+            rdm_not_normed = self.contract_expr(mat_st, mat_st.conj(), backend='torch')
+        else:
+            rdm_not_normed = self.contract_expr(self._sqrt_rho, self._sqrt_rho.conj(), mat_st, mat_st.conj(), backend='torch')
+        prob = torch.diagonal(rdm_not_normed, dim1=-2, dim2=-1).sum(-1).real
         purity = self.contract_expr1(rdm_not_normed, rdm_not_normed.conj()).real
         tmp0 = torch.maximum(self._eps, 2*(prob*prob - purity))
-        loss = torch.sqrt(tmp0).sum()
+        if self.batch_size is None:
+            loss = torch.sqrt(tmp0).sum()
+        else:
+            tmp1 = torch.sqrt(tmp0).sum(1)
+            self.loss_batch = tmp1.detach()
+            loss = tmp1.sum()
         return loss
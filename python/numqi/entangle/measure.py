@@ -1,3 +1,4 @@
+import functools
 import numpy as np
 import torch
 import opt_einsum
@@ -30,7 +31,8 @@ def get_gme_2qubit(rho:np.ndarray):
 
 class DensityMatrixGMEModel(torch.nn.Module):
     r'''Solve geometric measure of entanglement (GME) for density matrix using gradient descent.'''
-    def __init__(self, dim_list:tuple[int], num_ensemble:int, rank:int|None=None, CPrank:int=1, dtype:str='float64'):
+    def __init__(self, dim_list:tuple[int], num_ensemble:int, rank:int|None=None, CPrank:int=1, dtype:str='float64',
+                batch_size:int|None=None):
         r'''Initialize the model.
 
         Parameters:
@@ -39,6 +41,9 @@ class DensityMatrixGMEModel(torch.nn.Module):
             rank (int): rank of the density matrix, if None, then rank is set to the maximum.
             CPrank (int): Canonical Polyadic rank rank of the state.
             dtype (str): data type of the state.
+            batch_size (int|None): if not None, `batch_size` density matrices are optimized jointly with one
+                contraction expression, the loss is the sum of the GME and the GME of each item is stored in `.loss_batch`.
+                see `numqi.optimize.minimize_batch`
         '''
         super().__init__()
         assert dtype in {'float32','float64'}
@@ -55,35 +60,60 @@ class DensityMatrixGMEModel(torch.nn.Module):
         self.rank = int(rank)
         assert CPrank>=1
         self.CPrank = int(CPrank)
+        assert (batch_size is None) or (batch_size>=1)
+        self.batch_size = batch_size
+        num_batch = 1 if (batch_size is None) else int(batch_size)
 
-        self.manifold_stiefel = numqi.manifold.Stiefel(num_ensemble, rank, dtype=self.cdtype)
-        self.manifold_psi = torch.nn.ModuleList([numqi.manifold.Sphere(x, batch_size=num_ensemble*CPrank, dtype=self.cdtype) for x in dim_list])
+        self.manifold_stiefel = numqi.manifold.Stiefel(num_ensemble, rank, batch_size=batch_size, dtype=self.cdtype)
+        self.manifold_psi = torch.nn.ModuleList([numqi.manifold.Sphere(x, batch_size=num_batch*num_ensemble*CPrank, dtype=self.cdtype) for x in dim_list])
+        N1 = len(dim_list)
         if CPrank>1:
-            self.manifold_coeff = numqi.manifold.PositiveReal(num_ensemble*CPrank, dtype=torch.float64)
-            N1 = len(dim_list)
-            tmp0 = [(num_ensemble,rank),(num_ensemble,rank)] + [(num_ensemble,rank,x) for x in dim_list] + [(num_ensemble,rank,x) for x in dim_list]
+            self.manifold_coeff = numqi.manifold.PositiveReal(num_batch*num_ensemble*CPrank, dtype=torch.float64)
+            # the last label is the batch index
+            tmp0 = [(num_ensemble,CPrank),(num_ensemble,CPrank)] + [(num_ensemble,CPrank,x) for x in dim_list]*2
             tmp1 = [(N1,N1+1),(N1,N1+2)] + [(N1,N1+1,x) for x in range(N1)] + [(N1,N1+2,x) for x in range(N1)]
-            self.contract_psi_psi = opt_einsum.contract_expression(*[y for x in zip(tmp0,tmp1) for y in x], [N1])
+            if batch_size is not None:
+                tmp0 = [(batch_size,)+x for x in tmp0]
+                tmp1 = [(N1+3,)+x for x in tmp1]
+            tmp2 = [N1] if (batch_size is None) else [N1+3,N1]
+            self.contract_psi_psi = opt_einsum.contract_expression(*[y for x in zip(tmp0,tmp1) for y in x], tmp2)
 
         self._sqrt_rho = None
         self.contract_expr = None
         self.contract_coeff = None
+        self.loss_batch = None
+        if batch_size is not None:
+            # one expression for all the targets, the sqrt of the density matrices is an operand instead of a constant
+            tmp0 = [(batch_size,)+self.dim_list+(self.rank,), (batch_size,num_ensemble,self.rank)]
+            tmp1 = [(N1+3,)+tuple(range(N1+1)), (N1+3,N1+1,N1)]
+            if CPrank==1:
+                tmp0 += [(batch_size,num_ensemble,x) for x in dim_list]
+                tmp1 += [(N1+3,N1+1,x) for x in range(N1)]
+            else:
+                tmp0 += [(batch_size,num_ensemble,CPrank)] + [(batch_size,num_ensemble,CPrank,x) for x in dim_list]
+                tmp1 += [(N1+3,N1+1,N1+2)] + [(N1+3,N1+1,N1+2,x) for x in range(N1)]
+            self.contract_expr = opt_einsum.contract_expression(*[y for x in zip(tmp0,tmp1) for y in x], (N1+3,N1+1))
 
     def set_density_matrix(self, rho:np.ndarray):
         r'''Set the density matrix.
 
         Parameters:
-            rho (np.ndarray): density matrix.
+            rho (np.ndarray): density matrix, `shape=(batch_size,N,N)` for the batched model
         '''
         N0 = np.prod(np.array(self.dim_list))
-        assert rho.shape == (N0, N0)
-        assert np.abs(rho-rho.T.conj()).max() < 1e-10
+        if self.batch_size is None:
+            assert rho.shape == (N0, N0)
+        else:
+            assert rho.shape == (self.batch_size, N0, N0)
+        assert np.abs(rho-rho.swapaxes(-2,-1).conj()).max() < 1e-10
         EVL,EVC = np.linalg.eigh(rho)
-        EVL = np.maximum(0, EVL[-self.rank:])
-        assert abs(EVL.sum()-1) < 1e-10
-        EVC = EVC[:,-self.rank:]
-        tmp0 = (EVC * np.sqrt(EVL)).reshape(*self.dim_list, self.rank)
+        EVL = np.maximum(0, EVL[...,-self.rank:])
+        assert np.abs(EVL.sum(axis=-1)-1).max() < 1e-10
+        EVC = EVC[...,-self.rank:]
+        tmp0 = (EVC * np.sqrt(EVL)[...,np.newaxis,:]).reshape(*rho.shape[:-2], *self.dim_list, self.rank)
         self._sqrt_rho = torch.tensor(tmp0, dtype=self.cdtype)
+        if self.batch_size is not None:
+            return
         N1 = len(self.dim_list)
         if self.CPrank==1:
             tmp0 = [(N1+1,x) for x in range(N1)]
@@ -102,44 +132,41 @@ class DensityMatrixGMEModel(torch.nn.Module):
         with torch.set_grad_enabled(tag_grad):
             matX = self.manifold_stiefel()
             psi_list = [x() for x in self.manifold_psi]
+            tmp0 = () if (self.batch_size is None) else (self.batch_size,)
             if self.CPrank>1:
-                coeff = self.manifold_coeff().reshape(self.num_ensemble, self.CPrank).to(psi_list[0].dtype)
-                psi_list = [x.reshape(self.num_ensemble,self.CPrank,-1) for x in psi_list]
+                coeff = self.manifold_coeff().reshape(*tmp0, self.num_ensemble, self.CPrank).to(psi_list[0].dtype)
+                psi_list = [x.reshape(*tmp0,self.num_ensemble,self.CPrank,-1) for x in psi_list]
                 psi_conj_list = [x.conj().resolve_conj() for x in psi_list]
                 psi_psi = self.contract_psi_psi(coeff, coeff, *psi_list, *psi_conj_list).real
-                coeff = coeff / torch.sqrt(psi_psi).reshape(-1,1)
+                coeff = coeff / torch.sqrt(psi_psi).unsqueeze(-1)
                 ret = matX,psi_list,coeff
             else:
+                psi_list = [x.reshape(*tmp0,self.num_ensemble,-1) for x in psi_list]
                 ret = matX,psi_list
         return ret
 
     def forward(self):
         if self.CPrank>1:
             matX,psi_list,coeff = self.get_state(tag_grad=True)
-            tmp2 = self.contract_expr(matX, coeff, *psi_list, backend='torch')
+            tmp0 = (matX, coeff, *psi_list)
         else:
             matX,psi_list = self.get_state(tag_grad=True)
-            tmp2 = self.contract_expr(matX, *psi_list, backend='torch')
-        loss = 1-torch.vdot(tmp2,tmp2).real
+            tmp0 = (matX, *psi_list)
+        if self.batch_size is None:
+            tmp2 = self.contract_expr(*tmp0, backend='torch')
+            loss = 1-torch.vdot(tmp2,tmp2).real
+        else:
+            tmp2 = self.contract_expr(self._sqrt_rho, *tmp0, backend='torch')
+            # the items are decoupled, so the gradient of the sum is the gradient of each item
+            tmp3 = 1-(tmp2.real**2 + tmp2.imag**2).sum(dim=1)
+            self.loss_batch = tmp3.detach()
+            loss = tmp3.sum()
         return loss
 
 
-def get_linear_entropy_entanglement_ppt(rho:np.ndarray, dim:tuple[int], use_tqdm:bool=False, return_info:bool=False):
-    r'''Calculate the linear entropy of entanglement for density matrix using PPT approximation.
-
-    Evaluating Convex Roof Entanglement Measures
-    [doi-link](http://dx.doi.org/10.1103/PhysRevLett.114.160501)
-
-    Parameters:
-        rho (np.ndarray): density matrix. support batch
-        dim (tuple[int]): dimension of the density matrix. must be length 2.
-        use_tqdm (bool): use tqdm for progress bar.
-        return_info (bool): return additional information.
-
-    Returns:
-        ret (float,np.ndarray,list): linear entropy of entanglement.
-    '''
-    rho,is_single_item,dimA,dimB,use_tqdm = _check_input_rho_SDP(rho, dim, use_tqdm)
+@functools.lru_cache(maxsize=4)
+def _get_linear_entropy_entanglement_ppt_problem(dimA:int, dimB:int):
+    # the parametrized problem is cached, repeated calls only update cvx_rho and skip the canonicalization
     cvx_rho = cvxpy.Parameter((dimA*dimB,dimA*dimB), complex=True)
     ind_sym = np.arange(dimA*dimB*dimA*dimB, dtype=np.int64).reshape(dimA*dimB,-1).T.reshape(-1)
     cvxW = cvxpy.Variable((dimA*dimB*dimA*dimB,dimA*dimB*dimA*dimB), hermitian=True)
@@ -157,11 +184,31 @@ def get_linear_entropy_entanglement_ppt(rho:np.ndarray, dim:tuple[int], use_tqdm
     tmp2 = np.ascontiguousarray(flip_op.reshape(dimA*dimA,-1).T)
     obj = cvxpy.Maximize(cvxpy.real(cvxpy.sum(cvxpy.multiply(tmp1,tmp2))))
     prob = cvxpy.Problem(obj, constraint)
+    return cvx_rho, cvxW, prob
+
+
+def get_linear_entropy_entanglement_ppt(rho:np.ndarray, dim:tuple[int], use_tqdm:bool=False, return_info:bool=False):
+    r'''Calculate the linear entropy of entanglement for density matrix using PPT approximation.
+
+    Evaluating Convex Roof Entanglement Measures
+    [doi-link](http://dx.doi.org/10.1103/PhysRevLett.114.160501)
+
+    Parameters:
+        rho (np.ndarray): density matrix. support batch
+        dim (tuple[int]): dimension of the density matrix. must be length 2.
+        use_tqdm (bool): use tqdm for progress bar.
+        return_info (bool): return additional information.
+
+    Returns:
+        ret (float,np.ndarray,list): linear entropy of entanglement.
+    '''
+    rho,is_single_item,dimA,dimB,use_tqdm = _check_input_rho_SDP(rho, dim, use_tqdm)
+    cvx_rho, cvxW, prob = _get_linear_entropy_entanglement_ppt_problem(int(dimA), int(dimB))
     ret = []
     for rho_i in (tqdm(rho) if use_tqdm else rho):
         cvx_rho.value = rho_i
         try:
-            prob.solve()
+            prob.solve(warm_start=False)
             tmp0 = max(0, 1 - prob.value)
         except cvxpy.error.SolverError: #sometimes error when fail to solve
             tmp0 = np.nan
@@ -2,7 +2,6 @@ import functools
 import itertools
 import numpy as np
 from tqdm.auto import tqdm
-import scipy.optimize
 import scipy.sparse.linalg
 import cvxpy
 import matplotlib.pyplot as plt
@@ -10,11 +9,32 @@ import matplotlib.pyplot as plt
 import numqi.gellmann
 import numqi.utils
 
-from ._misc import get_density_matrix_boundary, _sdp_ree_solve, _check_input_rho_SDP, hf_interpolate_dm
+from numqi.matrix_space._numerical_range import _cvx_numerical_range_solver
+from ._misc import get_density_matrix_boundary, _sdp_ree_solve, _ree_bisection_solve, _check_input_rho_SDP, hf_interpolate_dm
 
 cp_tableau = ['#4c72b0', '#dd8452', '#55a868', '#c44e52', '#8172b3', '#937860', '#da8bc3', '#8c8c8c', '#ccb974', '#64b5cd']
 
-def get_ppt_numerical_range(op_list, direction, dim, return_info=False, use_tqdm=True):
+def _ppt_numerical_range_setup(op_list, dim, return_info):
+    num_op = op_list.shape[0]
+    dimA,dimB = dim
+    N0 = dimA*dimB
+    assert op_list.shape[1]==dimA*dimB
+    cvx_rho = cvxpy.Variable((N0,N0), hermitian=True)
+    cvx_vec = cvxpy.Parameter(num_op)
+    cvx_beta = cvxpy.Variable()
+    cvx_op = cvxpy.real(op_list.transpose(0,2,1).reshape(-1, N0*N0, order='C') @ cvxpy.reshape(cvx_rho, N0*N0, order='F'))
+    constraints = [
+        cvx_rho>>0,
+        cvxpy.real(cvxpy.trace(cvx_rho))==1,
+        cvxpy.partial_transpose(cvx_rho, [dimA,dimB], 0)>>0,
+        cvx_beta*cvx_vec==cvx_op,
+    ]
+    prob = cvxpy.Problem(cvxpy.Maximize(cvx_beta), constraints)
+    ret = _cvx_numerical_range_solver(prob, cvx_vec, cvx_op, return_info)
+    return ret
+
+
+def get_ppt_numerical_range(op_list, direction, dim, return_info=False, use_tqdm=True, num_worker=1):
     r'''get the PPT (positive partial transpose) numerical range of a list of operators
 
     TODO bug, this is cross-section, not numerical range
@@ -29,6 +49,7 @@ def get_ppt_numerical_range(op_list, direction, dim, return_info=False, use_tqdm
         dim (tuple[int]): the dimension of the density matrix, e.g. (2,2) for 2 qubits, must be of length 2
         return_info (bool): if `True`, then return the boundary and the boundary's normal vector
         use_tqdm (bool): if `True`, then use tqdm to show the progress
+        num_worker (int): number of processes, the directions are sharded over the workers
 
     Returns:
         beta (np.ndarray): the distance from the origin to the boundary along the direction.
@@ -46,32 +67,9 @@ def get_ppt_numerical_range(op_list, direction, dim, return_info=False, use_tqdm
     direction = direction.reshape(-1,num_op)
     if direction.shape[0]==1:
         use_tqdm = False
-    dimA,dimB = dim
-    N0 = dimA*dimB
-    assert op_list.shape[1]==dimA*dimB
-    cvx_rho = cvxpy.Variable((N0,N0), hermitian=True)
-    cvx_vec = cvxpy.Parameter(num_op)
-    cvx_beta = cvxpy.Variable()
-    cvx_op = cvxpy.real(op_list.transpose(0,2,1).reshape(-1, N0*N0, order='C') @ cvxpy.reshape(cvx_rho, N0*N0, order='F'))
-    constraints = [
-        cvx_rho>>0,
-        cvxpy.real(cvxpy.trace(cvx_rho))==1,
-        cvxpy.partial_transpose(cvx_rho, [dimA,dimB], 0)>>0,
-        cvx_beta*cvx_vec==cvx_op,
-    ]
-    cvx_obj = cvxpy.Maximize(cvx_beta)
-    prob = cvxpy.Problem(cvx_obj, constraints)
-    obj_list = []
-    boundary_list = []
-    norm_vec_list = []
-    ret = []
-    for vec_i in (tqdm(direction) if use_tqdm else direction):
-        cvx_vec.value = vec_i
-        prob.solve()
-        obj_list.append(cvx_obj.value)
-        if return_info:
-            boundary_list.append(cvx_op.value.copy())
-            norm_vec_list.append(constraints[-1].dual_value.copy())
+    tmp0 = numqi.utils.run_parallel_sweep(_ppt_numerical_range_setup, (op_list, dim, return_info), list(direction),
+                num_worker=num_worker, use_tqdm=use_tqdm)
+    obj_list,boundary_list,norm_vec_list = zip(*tmp0)
     if is_single:
         if return_info:
             ret = (obj_list[0], boundary_list[0], norm_vec_list[0])
@@ -128,6 +126,15 @@ def get_ppt_boundary(dm, dim, dm_norm=None, within_dm=True):
     return beta_pt_l,beta_pt_u
 
 
+def _partial_transpose(rho:np.ndarray, dim:tuple[int], index:int):
+    # rho (batch,N,N), partial transpose on the index-th party via the strided view, copied only by the final reshape
+    N0 = rho.shape[-1]
+    tmp0 = int(np.prod(dim[:index]))
+    tmp1 = int(np.prod(dim[(index+1):]))
+    ret = rho.reshape(-1,tmp0,dim[index],tmp1,tmp0,dim[index],tmp1).transpose(0,1,5,3,4,2,6).reshape(-1,N0,N0)
+    return ret
+
+
 def is_ppt(rho:np.ndarray, dim:tuple[int], eps:float=-1e-7):
     '''Positive Partial Transpose (PPT)
 
@@ -136,24 +143,111 @@ def is_ppt(rho:np.ndarray, dim:tuple[int], eps:float=-1e-7):
     [wiki/Peres-Horodecki-criterion](https://en.wikipedia.org/wiki/Peres%E2%80%93Horodecki_criterion)
 
     Parameters:
-        rho (np.ndarray): density matrix
+        rho (np.ndarray): density matrix, `shape=(N,N)` or `shape=(batch,N,N)`
         dim (tuple[int]): tuple of integers
         eps (float): threshold for the eigenvalues, if min(eig(X))>=eps, then X is positive semi-definite
 
     Returns:
-        tag (bool): whether rho is PPT
+        tag (bool,np.ndarray): whether rho is PPT, bool array of `shape=(batch,)` for batch input
     '''
-    N0 = rho.shape[0]
-    assert (rho.ndim==2) and (rho.shape[0]==rho.shape[1]) and (np.abs(rho-rho.T.conj()).max()<=1e-10)
+    is_single = rho.ndim==2
+    rho = rho.reshape(-1, *rho.shape[-2:])
+    N0 = rho.shape[-1]
+    assert (rho.shape[1]==N0) and (np.abs(rho-rho.transpose(0,2,1).conj()).max()<=1e-10)
     dim = numqi.utils.hf_tuple_of_int(dim)
-    assert (len(dim)>1) and (np.prod(dim)==rho.shape[0]) and all(x>1 for x in dim)
-    def hf0(i):
-        tmp0 = np.prod(dim[:i]) if i>0 else 1
-        tmp1 = np.prod(dim[(i+1):]) if (i+1)<len(dim) else 1
-        rhoT = rho.reshape(tmp0,dim[i],tmp1,tmp0,dim[i],tmp1).transpose(0,4,2,3,1,5).reshape(N0,N0)
-        ret = numqi.utils.is_positive_semi_definite(rhoT, shift=-eps)
-        return ret
-    ret = all(hf0(i) for i in range(len(dim)))
+    assert (len(dim)>1) and (np.prod(dim)==N0) and all(x>1 for x in dim)
+    ret = np.ones(rho.shape[0], dtype=np.bool_)
+    for ind0 in range(len(dim)):
+        # only the states passing the previous parties are checked
+        ind1 = np.nonzero(ret)[0]
+        if len(ind1)==0:
+            break
+        ret[ind1] = np.linalg.eigvalsh(_partial_transpose(rho[ind1], dim, ind0))[:,0] >= eps
+    if is_single:
+        ret = bool(ret[0])
+    return ret
+
+
+def check_realignment_criterion(rho:np.ndarray, dim:tuple[int], eps:float=-1e-7):
+    r'''return whether the bipartite density matrix passes the realignment (computable cross norm) criterion,
+    i.e. the trace norm of the realigned matrix is not larger than one
+
+    A matrix realignment method for recognizing entanglement
+    [arxiv-link](https://arxiv.org/abs/quant-ph/0205017)
+
+    Parameters:
+        rho (np.ndarray): density matrix, `shape=(N,N)` or `shape=(batch,N,N)`
+        dim (tuple[int]): dimension of the density matrix, `(dimA,dimB)`
+        eps (float): threshold, pass if `1-norm>eps`
+
+    Returns:
+        ret (bool,np.ndarray): whether the density matrix passes the realignment criterion,
+            bool array of `shape=(batch,)` for batch input
+    '''
+    dimA,dimB = numqi.utils.hf_tuple_of_int(dim)
+    is_single = rho.ndim==2
+    rho = rho.reshape(-1, *rho.shape[-2:])
+    assert rho.shape[1:]==(dimA*dimB,dimA*dimB)
+    tmp0 = rho.reshape(-1,dimA,dimB,dimA,dimB).transpose(0,1,3,2,4).reshape(-1,dimA*dimA,dimB*dimB)
+    ret = (1 - np.linalg.svd(tmp0, compute_uv=False).sum(axis=1)) > eps
+    if is_single:
+        ret = bool(ret[0])
+    return ret
+
+
+def get_separability_prescreen(rho:np.ndarray, dim:tuple[int], eps:float=-1e-7, return_info:bool=False):
+    r'''cheap separability criteria on a batch of density matrices, applied in cascade: each stage only
+    handles the states undecided by the previous stages, so the expensive solvers (SDP, CHA, PureB)
+    are only needed for the undecided states
+
+    1. separable ball (bipartite): $\mathrm{Tr}(\rho^2)\leq 1/(N-1)$ implies separable
+        [doi-link](https://doi.org/10.1103/PhysRevA.66.062311)
+    2. PPT: NPT implies entangled, PPT implies separable for bipartite system with $N\leq 6$
+    3. realignment (bipartite): fail implies entangled
+
+    the reduction criterion is implied by PPT, so it's not included
+
+    Parameters:
+        rho (np.ndarray): density matrix, `shape=(batch,N,N)` or `shape=(N,N)`
+        dim (tuple[int]): dimension of the density matrix, `(dimA,dimB,...)`
+        eps (float): threshold for the criteria, see `is_ppt` and `check_realignment_criterion`
+        return_info (bool): whether to return the deciding criterion
+
+    Returns:
+        tag (np.ndarray): int8 array of `shape=(batch,)`, 1 for separable, -1 for entangled, 0 for undecided
+        info (np.ndarray): str array of `shape=(batch,)`, the deciding criterion 'ball', 'ppt', 'realignment',
+            or '' for undecided, only if `return_info=True`
+    '''
+    is_single = rho.ndim==2
+    rho = rho.reshape(-1, *rho.shape[-2:])
+    dim = numqi.utils.hf_tuple_of_int(dim)
+    N0 = rho.shape[-1]
+    is_bipartite = len(dim)==2
+    tag = np.zeros(rho.shape[0], dtype=np.int8)
+    info = np.zeros(rho.shape[0], dtype='<U11')
+    if is_bipartite:
+        tmp0 = rho.reshape(rho.shape[0], -1)
+        purity = np.einsum(tmp0, [0,1], tmp0.conj(), [0,1], [0], optimize=True).real
+        ind0 = purity <= 1/(N0-1)
+        tag[ind0] = 1
+        info[ind0] = 'ball'
+    ind0 = np.nonzero(tag==0)[0]
+    if len(ind0):
+        tmp0 = is_ppt(rho[ind0], dim, eps)
+        tag[ind0[~tmp0]] = -1
+        info[ind0[~tmp0]] = 'ppt'
+        if is_bipartite and (N0<=6):
+            tag[ind0[tmp0]] = 1
+            info[ind0[tmp0]] = 'ppt'
+    ind0 = np.nonzero(tag==0)[0]
+    if is_bipartite and len(ind0):
+        tmp0 = check_realignment_criterion(rho[ind0], dim, eps)
+        tag[ind0[~tmp0]] = -1
+        info[ind0[~tmp0]] = 'realignment'
+    if is_single:
+        tag = tag[0]
+        info = info[0]
+    ret = (tag,info) if return_info else tag
     return ret
 
 
@@ -173,32 +267,40 @@ def is_generalized_ppt(rho, dim, return_info=False):
     [doi-link](https://doi.org/10.1016/S0375-9601%2802%2901538-4)
 
     Parameters:
-        rho (np.ndarray): density matrix
+        rho (np.ndarray): density matrix, `shape=(N,N)` or `shape=(batch,N,N)`
         dim (tuple[int]): tuple of integers
         return_info (bool): whether to return the list of nuclear norms
 
     Returns:
-        tag (bool): whether rho is generalized PPT (superset of SEP)
-        info (list[float]): list of nuclear norms
+        tag (bool,np.ndarray): whether rho is generalized PPT (superset of SEP), bool array of `shape=(batch,)` for batch input
+        info (list[tuple]): list of `(dim0,dim1,nuclear_norm)`, `nuclear_norm` is float array of `shape=(batch,)` for batch input
     '''
-    assert (rho.ndim==2) and rho.shape[0]==rho.shape[1]
-    N0 = rho.shape[0]
+    is_single = rho.ndim==2
+    rho = rho.reshape(-1, *rho.shape[-2:])
+    N0 = rho.shape[-1]
+    assert rho.shape[1]==N0
     dim = tuple(int(x) for x in dim)
     assert (len(dim)>1) and (np.prod(dim)==N0) and all(x>1 for x in dim)
 
     dim_list = _is_generalized_ppt_dim_list(len(dim))
     shape = dim + dim
-    rho = rho.reshape(shape)
-    ret = []
+    rho = rho.reshape(rho.shape[0], *shape)
+    tag = np.ones(rho.shape[0], dtype=np.bool_)
+    info = []
     for dim0,dim1 in dim_list:
+        # only the states passing the previous partitions are checked if info is not required
+        ind0 = np.arange(rho.shape[0]) if return_info else np.nonzero(tag)[0]
+        if len(ind0)==0:
+            break
         tmp0 = 1 if len(dim0)==0 else np.prod([1]+[shape[x] for x in dim0])
-        tmp1 = rho.transpose(*dim0, *dim1).reshape(tmp0, -1)
+        tmp1 = rho[ind0].transpose(0, *[x+1 for x in dim0], *[x+1 for x in dim1]).reshape(len(ind0), tmp0, -1)
         # nuclear norm: sum of singular values
-        ret.append((dim0, dim1, np.linalg.norm(tmp1, ord='nuc')))
-        if (not return_info) and (ret[-1][2]>1):
-            break
-    tag = all(x[2]<=1 for x in ret)
-    ret = (tag,ret) if return_info else tag
+        tmp2 = np.linalg.svd(tmp1, compute_uv=False).sum(axis=1)
+        tag[ind0] = np.logical_and(tag[ind0], tmp2<=1)
+        info.append((dim0, dim1, (float(tmp2[0]) if is_single else tmp2)))
+    if is_single:
+        tag = bool(tag[0])
+    ret = (tag,info) if return_info else tag
     return ret
 
 
@@ -217,16 +319,17 @@ def get_generalized_ppt_boundary(dm, dim, threshold=1e-10, xtol=1e-5):
     def hf0(x):
         tmp0 = rho0 + x*dm_unit_vec
         tmp1 = is_generalized_ppt(tmp0, dim, return_info=True)[1]
-        ret = max([x[2] for x in tmp1]) - (1 + threshold)
+        ret = max([x[2] for x in tmp1]) - 1
         return ret
     dm_norm = numqi.gellmann.dm_to_gellmann_norm(dm)
     rho0 = np.eye(dm.shape[0])/dm.shape[0]
     dm_unit_vec = (dm - rho0) / dm_norm
     beta_dm = get_density_matrix_boundary(dm, dm_norm=dm_norm)[1]
-    if hf0(beta_dm)<0:
+    if hf0(beta_dm)<threshold:
         ret = beta_dm
     else:
-        ret = scipy.optimize.root_scalar(hf0, bracket=[0, beta_dm], xtol=xtol).root
+        # the nuclear norm is 1 before the boundary and grows linearly after it
+        ret = _ree_bisection_solve(hf0, 0, beta_dm, xtol, threshold, use_tqdm=False, order=1)[0]
     return ret
 
 
@@ -299,8 +402,9 @@ def cvx_matrix_mlogx(cvxX, sqrt_order=3, pade_order=3):
     return cvxP, constraint
 
 
-def get_ppt_ree(rho, dimA, dimB, return_info=False, sqrt_order=3, pade_order=3, use_tqdm=True):
-    rho,is_single_item,dimA,dimB,use_tqdm = _check_input_rho_SDP(rho, (dimA,dimB), use_tqdm)
+@functools.lru_cache(maxsize=4)
+def _get_ppt_ree_problem(dimA:int, dimB:int, sqrt_order:int, pade_order:int):
+    # the parametrized problem is cached, repeated calls only update cvx_rho and skip the canonicalization
     dim = dimA * dimB
     cvxX = cvxpy.Variable((dim,dim), hermitian=True)
     cvxP, constraint = cvx_matrix_mlogx(cvxX, sqrt_order=sqrt_order, pade_order=pade_order)
@@ -313,7 +417,13 @@ def get_ppt_ree(rho, dimA, dimB, return_info=False, sqrt_order=3, pade_order=3,
     cvx_rho = cvxpy.Parameter((dimA*dimB,dimA*dimB), hermitian=True)
     obj = cvxpy.Minimize(cvxpy.real(cvxpy.trace(cvx_rho @ cvxP['mlogX'])))
     prob = cvxpy.Problem(obj, constraint)
-    ret = _sdp_ree_solve(rho, use_tqdm, cvx_rho, cvxP, prob, obj, return_info, is_single_item)
+    return cvx_rho, cvxP, prob, obj
+
+
+def get_ppt_ree(rho, dimA, dimB, return_info=False, sqrt_order=3, pade_order=3, use_tqdm=True, num_worker=1):
+    rho,is_single_item,dimA,dimB,use_tqdm = _check_input_rho_SDP(rho, (dimA,dimB), use_tqdm)
+    tmp0 = int(dimA), int(dimB), int(sqrt_order), int(pade_order)
+    ret = _sdp_ree_solve(rho, use_tqdm, _get_ppt_ree_problem, tmp0, return_info, is_single_item, num_worker)
     return ret
 
 
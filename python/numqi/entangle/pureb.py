@@ -1,6 +1,5 @@
 import torch
 import numpy as np
-from tqdm.auto import tqdm
 
 import numqi.utils
 import numqi.dicke
@@ -9,12 +8,12 @@ import numqi.optimize
 import numqi.gellmann
 import numqi.manifold
 
-from ._misc import get_density_matrix_boundary, hf_interpolate_dm, _ree_bisection_solve
+from ._misc import get_density_matrix_boundary, hf_interpolate_dm, _ree_bisection_solve, _model_numerical_range_setup
 
 
 class PureBosonicExt(torch.nn.Module):
     r'''Approximate the relative entropy of entanglement via Pure Bosonic Extension'''
-    def __init__(self, dimA:int, dimB:int, kext:int, distance_kind:str='ree'):
+    def __init__(self, dimA:int, dimB:int, kext:int, distance_kind:str='ree', batch_size:int|None=None):
         r'''Initialize the module
 
         Parameters:
@@ -22,48 +21,60 @@ class PureBosonicExt(torch.nn.Module):
             dimB (int): The dimension of the system B
             kext (int): extension value for system B
             distance_kind (str): The kind of distance, either 'ree' or 'gellmann'
+            batch_size (int|None): If not None, `batch_size` independent extensions are optimized jointly
+                against a stack of targets, the loss is the sum of the distances and the distance of each item
+                is stored in `.loss_batch`
         '''
         super().__init__()
         distance_kind = distance_kind.lower()
         assert distance_kind in {'ree','gellmann'}
         self.distance_kind = distance_kind
-        Bij = numqi.dicke.get_partial_trace_ABk_to_AB_index(kext, dimB)
+        Bij = numqi.dicke.get_partial_trace_ABk_to_AB_index(kext, dimB, fused=True)
         num_dicke = numqi.dicke.get_dicke_number(kext, dimB)
-        tmp0 = [torch.int64,torch.int64,torch.complex128]
-        self.Bij = [[torch.tensor(y0,dtype=y1) for y0,y1 in zip(x,tmp0)] for x in Bij]
-        self.manifold = numqi.manifold.Sphere(dimA*num_dicke, dtype=torch.complex128, method='quotient')
+        self.Bij = (Bij[0], torch.tensor(Bij[1], dtype=torch.int64), torch.tensor(Bij[2], dtype=torch.int64),
+                    torch.tensor(Bij[3], dtype=torch.complex128))
+        self.manifold = numqi.manifold.Sphere(dimA*num_dicke, batch_size=batch_size, dtype=torch.complex128, method='quotient')
         self.dimA = dimA
         self.dimB = dimB
+        self.batch_size = batch_size
 
         self.dm_torch = None
         self.dm_target = None
         self.tr_rho_log_rho = None
         self.expect_op_T_vec = None
+        self.loss_batch = None
         self._torch_logm = ('pade',6,8) #set it by user
 
     def set_dm_target(self, rho:np.ndarray):
         r'''Set the target density matrix
 
         Parameters:
-            rho (np.ndarray): The target density matrix
+            rho (np.ndarray): The target density matrix, `shape=(batch_size,N,N)` for the batched model
         '''
-        assert (rho.ndim==2) and (rho.shape[0]==rho.shape[1]) #drop support for pure state
-        # rho = rho[:,np.newaxis] * rho.conj() #pure
+        N0 = self.dimA*self.dimB
+        if self.batch_size is None:
+            assert rho.shape==(N0,N0) #drop support for pure state
+            # rho = rho[:,np.newaxis] * rho.conj() #pure
+            self.tr_rho_log_rho = -numqi.utils.get_von_neumann_entropy(rho)
+        else:
+            assert rho.shape==(self.batch_size,N0,N0)
+            self.tr_rho_log_rho = torch.tensor([-numqi.utils.get_von_neumann_entropy(x) for x in rho], dtype=torch.float64)
         self.dm_target = torch.tensor(rho, dtype=torch.complex128)
-        self.tr_rho_log_rho = -numqi.utils.get_von_neumann_entropy(rho)
 
     def set_expectation_op(self, op:np.ndarray):
         r'''Set the expectation operator
 
         Parameters:
-            op (np.ndarray): Hermitian expectation operator
+            op (np.ndarray): Hermitian expectation operator, `shape=(N,N)`, or `shape=(batch_size,N,N)` for the batched model
         '''
         self.dm_target = None
         self.tr_rho_log_rho = None
-        self.expect_op_T_vec = torch.tensor(op.T.reshape(-1), dtype=torch.complex128)
+        tmp0 = np.asarray(op).swapaxes(-2,-1)
+        self.expect_op_T_vec = torch.tensor(tmp0.reshape(*tmp0.shape[:-2], -1), dtype=torch.complex128)
 
     def forward(self):
-        tmp1 = self.manifold().reshape(self.dimA,-1)
+        tmp0 = self.manifold()
+        tmp1 = tmp0.reshape(*tmp0.shape[:-1], self.dimA, -1)
         dm_torch = numqi.dicke.partial_trace_ABk_to_AB(tmp1, self.Bij)
         self.dm_torch = dm_torch.detach()
         if self.dm_target is not None:
@@ -72,11 +83,34 @@ class PureBosonicExt(torch.nn.Module):
             else:
                 loss = numqi.utils.get_relative_entropy(self.dm_target, dm_torch, self.tr_rho_log_rho, self._torch_logm)
         else:
-            loss = torch.dot(dm_torch.view(-1), self.expect_op_T_vec).real
+            loss = (dm_torch.reshape(*dm_torch.shape[:-2], -1) * self.expect_op_T_vec).sum(dim=-1).real
+        if self.batch_size is not None:
+            # the items are decoupled, so the gradient of the sum is the gradient of each item
+            self.loss_batch = loss.detach()
+            loss = loss.sum()
         return loss
 
+    def minimize_batch(self, rho:np.ndarray, num_repeat:int=1, tol:float=1e-10, seed:int|None=None, **kwargs):
+        r'''Minimize the distance of all the targets jointly, the best point of each item over the repeats is kept
+
+        Parameters:
+            rho (np.ndarray): The target density matrices, `shape=(batch_size,N,N)`
+            num_repeat (int): The number of random restarts
+            tol (float): The convergence tolerance for optimization
+            seed (int|None): The random seed
+            kwargs (dict): other arguments passed to `numqi.optimize.minimize`
+
+        Returns:
+            ret (np.ndarray): The distance of each target, `shape=(batch_size,)`
+        '''
+        assert self.batch_size is not None
+        self.set_dm_target(rho)
+        ret = numqi.optimize.minimize_batch(self, theta0='uniform', num_repeat=num_repeat, tol=tol, seed=seed, **kwargs)
+        return ret
+
     def get_boundary(self, dm0:np.ndarray, xtol:float=1e-4, converge_tol:float=1e-10, threshold:float=1e-7,
-                    num_repeat:int=1, use_tqdm:bool=True, return_info:bool=False, seed:int|None=None):
+                    num_repeat:int=1, use_tqdm:bool=True, return_info:bool=False, seed:int|None=None, checkpoint:str|None=None,
+                    warm_start:bool=False):
         r'''Get the boundary of Pure Bosonic Extension
 
         Parameters:
@@ -88,27 +122,39 @@ class PureBosonicExt(torch.nn.Module):
             use_tqdm (bool): Whether to use tqdm
             return_info (bool): Whether to return the history information
             seed (int|None): The random seed
+            checkpoint (str|None): The checkpoint file, completed points are saved to and skipped after restart
+            warm_start (bool): Whether to start each step from the optimum of the nearest evaluated beta, random restarts are used
+                only if the warm solution is above threshold
 
         Returns:
             beta (float): length of the boundary
             history_info (list): The history information, only if return_info is True
         '''
+        assert self.batch_size is None, 'use minimize_batch for the batched model'
         beta_u = get_density_matrix_boundary(dm0)[1]
         dm0_norm = numqi.gellmann.dm_to_gellmann_norm(dm0)
         np_rng = numqi.random.get_numpy_rng(seed)
+        theta_warm = []
         def hf0(beta):
             # use alpha to avoid time-consuming gellmann conversion
             tmp0 = hf_interpolate_dm(dm0, alpha=beta/dm0_norm)
             self.set_dm_target(tmp0)
-            theta_optim = numqi.optimize.minimize(self, theta0='uniform',
-                        tol=converge_tol, num_repeat=num_repeat, seed=np_rng, print_every_round=0)
+            # the loss is an upper bound of the minimum, so the warm solution below threshold is safe to accept
+            # the secant probes come in close pairs, start from the optimum of the nearest evaluated beta
+            tmp1 = min(theta_warm, key=lambda x: abs(x[0]-beta))[1] if theta_warm else None
+            theta_optim = numqi.optimize.minimize_warm_start(self, tmp1, threshold,
+                        theta0='uniform', tol=converge_tol, num_repeat=num_repeat, seed=np_rng, print_every_round=0)
+            if warm_start:
+                theta_warm.append((beta, theta_optim.x))
             return float(theta_optim.fun)
+        hf0 = numqi.optimize.SweepCheckpoint(checkpoint, np_rng).wrap(hf0)
         beta,history_info = _ree_bisection_solve(hf0, 0, beta_u, xtol, threshold, use_tqdm=use_tqdm)
         ret = (beta,history_info) if return_info else beta
         return ret
 
     def get_numerical_range(self, op0:np.ndarray, op1:np.ndarray, num_theta:int=400, converge_tol:float=1e-5,
-                            num_repeat:int=1, use_tqdm:bool=True, seed:int|None=None):
+                            num_repeat:int=1, use_tqdm:bool=True, seed:int|None=None, checkpoint:str|None=None,
+                            warm_start_tol:float|None=None, num_worker:int=1):
         r'''Get the numerical range of Pure Bosonic Extension
 
         Parameters:
@@ -119,23 +165,31 @@ class PureBosonicExt(torch.nn.Module):
             num_repeat (int): The number of repeat for optimization
             use_tqdm (bool): Whether to use tqdm
             seed (int|None): The random seed
+            checkpoint (str|None): The checkpoint file, completed points are saved to and skipped after restart
+            warm_start_tol (float|None): If not None, each theta is started from the optimum of the previous theta, random
+                restarts are used only if the loss increases by more than `warm_start_tol`
+            num_worker (int): The number of processes, the directions are sharded over the workers
 
         Returns:
             ret (np.ndarray): The numerical range, `shape=(num_theta,2)`
+
+        If `num_worker>1`, the model is pickled to the workers, and `self.dm_torch` is not the last solution after the call
         '''
+        assert self.batch_size is None
         np_rng = numqi.random.get_numpy_rng(seed)
         N0 = self.dimA*self.dimB
         assert (op0.shape==(N0,N0)) and (op1.shape==(N0,N0))
         theta_list = np.linspace(0, 2*np.pi, num_theta)
-        ret = []
-        kwargs = dict(num_repeat=num_repeat, seed=np_rng, print_every_round=0, tol=converge_tol)
-        for theta_i in (tqdm(theta_list) if use_tqdm else theta_list):
-            # see numqi.entangle.get_ppt_numerical_range, we use the maximization there
-            self.set_expectation_op(-np.cos(theta_i)*op0 - np.sin(theta_i)*op1)
-            numqi.optimize.minimize(self, **kwargs)
-            rho = self.dm_torch.detach().numpy()
-            ret.append([np.trace(x @ rho).real for x in [op0,op1]])
-        ret = np.array(ret)
+        kwargs = dict(num_repeat=num_repeat, print_every_round=0, tol=converge_tol)
+        sweep_ckpt = numqi.optimize.SweepCheckpoint(checkpoint, np_rng)
+        ind_list = [x for x in range(num_theta) if x not in sweep_ckpt]
+        # each worker needs its own random generator
+        rng_list = [np_rng]*len(ind_list) if (num_worker==1) else np_rng.spawn(len(ind_list))
+        def hf_callback(ind0, ret_i):
+            sweep_ckpt[ind_list[ind0]] = ret_i
+        numqi.utils.run_parallel_sweep(_model_numerical_range_setup, (self, op0, op1, kwargs, warm_start_tol),
+                [(theta_list[x],y) for x,y in zip(ind_list,rng_list)], num_worker=num_worker, use_tqdm=use_tqdm, hf_callback=hf_callback)
+        ret = np.array([sweep_ckpt[x] for x in range(num_theta)])
         return ret
 
 # TODO
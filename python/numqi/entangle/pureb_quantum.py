@@ -136,9 +136,9 @@ class QuantumPureBosonicExt(torch.nn.Module):
         self.weylH = torch.tensor(get_qudit_H(dimB), dtype=torch.complex128)
 
         self.binom_term = torch.tensor(np.sqrt(get_klist_binom_term(klist_np)), dtype=torch.float64)
-        Bij = numqi.dicke.get_partial_trace_ABk_to_AB_index(num_kext, dimB)
-        tmp0 = [torch.int64,torch.int64,torch.complex128]
-        self.Bij = [[torch.tensor(y0,dtype=y1) for y0,y1 in zip(x,tmp0)] for x in Bij]
+        Bij = numqi.dicke.get_partial_trace_ABk_to_AB_index(num_kext, dimB, fused=True)
+        self.Bij = (Bij[0], torch.tensor(Bij[1], dtype=torch.int64), torch.tensor(Bij[2], dtype=torch.int64),
+                    torch.tensor(Bij[3], dtype=torch.complex128))
         self.dm_torch = None
         self.dm_target = None
         self.tr_rho_log_rho = None
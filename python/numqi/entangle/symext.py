@@ -4,11 +4,13 @@ import cvxpy
 import torch
 from tqdm.auto import tqdm
 
+import numqi.utils
 import numqi.dicke
 import numqi.group
 import numqi.gellmann
 
 from .ppt import cvx_matrix_mlogx
+from numqi.matrix_space._numerical_range import _cvx_numerical_range_solver
 from ._misc import _sdp_ree_solve, _check_input_rho_SDP
 
 
@@ -73,7 +75,8 @@ def get_cvxpy_transpose0213_indexing(N0, N1, N2=None, N3=None):
     return ret
 
 
-def get_ABk_symmetric_extension_ree(rho, dim, kext, use_ppt=False, use_boson=False, return_info=False, sqrt_order=3, pade_order=3, use_tqdm=False):
+def get_ABk_symmetric_extension_ree(rho, dim, kext, use_ppt=False, use_boson=False, return_info=False, sqrt_order=3, pade_order=3,
+            use_tqdm=False, num_worker=1):
     r'''get the relative entropy of entanglement of k-symmetric extension on B-party
 
     Parameters:
@@ -86,6 +89,7 @@ def get_ABk_symmetric_extension_ree(rho, dim, kext, use_ppt=False, use_boson=Fal
         sqrt_order (int): the order of sqrtm approximation
         pade_order (int): the order of Pade approximation
         use_tqdm (bool): if True, use tqdm to show progress bar
+        num_worker (int): number of processes for the batch input, each worker compiles the problem once
 
     Returns:
         ret0 (float,np.array):  `ret` is a float indicates relative entropy of entanglement.
@@ -96,7 +100,14 @@ def get_ABk_symmetric_extension_ree(rho, dim, kext, use_ppt=False, use_boson=Fal
     if kext==1:
         assert use_ppt, 'kext=1 with use_ppt=False is meaningless'
     rho,is_single_item,dimA,dimB,use_tqdm = _check_input_rho_SDP(rho, dim, use_tqdm)
+    tmp0 = int(dimA), int(dimB), int(kext), bool(use_ppt), bool(use_boson), int(sqrt_order), int(pade_order)
+    ret = _sdp_ree_solve(rho, use_tqdm, _get_ABk_symmetric_extension_ree_problem, tmp0, return_info, is_single_item, num_worker)
+    return ret
+
 
+@functools.lru_cache(maxsize=4)
+def _get_ABk_symmetric_extension_ree_problem(dimA:int, dimB:int, kext:int, use_ppt:bool, use_boson:bool, sqrt_order:int, pade_order:int):
+    # the parametrized problem is cached, repeated calls only update cvx_rho and skip the canonicalization
     coeffB_list,multiplicity_list = numqi.group.symext.get_symmetric_extension_irrep_coeff(dimB, kext)
     if use_boson:
         assert numqi.dicke.get_dicke_number(kext, dimB)==coeffB_list[0].shape[0]
@@ -120,7 +131,7 @@ def get_ABk_symmetric_extension_ree(rho, dim, kext, use_ppt=False, use_boson=Fal
     cvx_rdm = cvxpy.reshape(cvxpy.reshape(tmp0, tmp0.size, order='F')[index0213_ab], (dimA*dimB,dimA*dimB), order='F')
     constraints = [x>>0 for x in cvxP_list]
     if use_ppt:
-        constraints = +[cvxpy.partial_transpose(x, [dimA,x.shape[0]//dimA], [1])>>0 for x in cvxP_list]
+        constraints += [cvxpy.partial_transpose(x, [dimA,x.shape[0]//dimA], axis=1)>>0 for x in cvxP_list]
     constraints += [sum(cvxpy.trace(x)*y for x,y in zip(cvxP_list,multiplicity_list))==1]
     cvxP, tmp0 = cvx_matrix_mlogx(cvx_rdm, sqrt_order=sqrt_order, pade_order=pade_order)
     constraints += tmp0
@@ -128,8 +139,7 @@ def get_ABk_symmetric_extension_ree(rho, dim, kext, use_ppt=False, use_boson=Fal
     cvx_rho = cvxpy.Parameter((dimA*dimB,dimA*dimB), hermitian=True)
     obj = cvxpy.Minimize(cvxpy.real(cvxpy.trace(cvx_rho @ cvxP['mlogX'])))
     prob = cvxpy.Problem(obj, constraints)
-    ret = _sdp_ree_solve(rho, use_tqdm, cvx_rho, cvxP, prob, obj, return_info, is_single_item)
-    return ret
+    return cvx_rho, cvxP, prob, obj
 
 
 def _ABk_symmetric_extension_setup(dimA, dimB, kext, use_boson, use_ppt, cvx_rho=None):
@@ -162,7 +172,34 @@ def _ABk_symmetric_extension_setup(dimA, dimB, kext, use_boson, use_ppt, cvx_rho
     return ret
 
 
-def is_ABk_symmetric_ext(rho, dim, kext, use_ppt=False, use_boson=False, use_tqdm=False, return_info=False):
+@functools.lru_cache(maxsize=4)
+def _get_ABk_symmetric_ext_problem(dimA:int, dimB:int, kext:int, use_ppt:bool, use_boson:bool):
+    cvx_rho = cvxpy.Parameter((dimA*dimA,dimB*dimB), complex=True)
+    cvxP_list, constraints = _ABk_symmetric_extension_setup(dimA, dimB, kext, use_boson, use_ppt, cvx_rho)
+    prob = cvxpy.Problem(cvxpy.Minimize(1), constraints)
+    return cvx_rho, cvxP_list, prob
+
+
+def _is_ABk_symmetric_ext_setup(dimA, dimB, kext, use_ppt, use_boson, return_info):
+    # solver of one density matrix, see numqi.utils.run_parallel_sweep
+    cvx_rho, cvxP_list, prob = _get_ABk_symmetric_ext_problem(dimA, dimB, kext, use_ppt, use_boson)
+    def hf0(rho_i):
+        cvx_rho.value = rho_i
+        try:
+            prob.solve(warm_start=False)
+            tmp0 = not np.isinf(prob.value)
+        except cvxpy.error.SolverError: #sometimes error when fail to solve
+            tmp0 = False
+        if return_info:
+            tmp1 = [np.ascontiguousarray(x.value) for x in cvxP_list] if tmp0 else None
+            ret = tmp0,tmp1
+        else:
+            ret = tmp0
+        return ret
+    return hf0
+
+
+def is_ABk_symmetric_ext(rho, dim, kext, use_ppt=False, use_boson=False, use_tqdm=False, return_info=False, num_worker=1):
     '''check if rho has symmetric extension of kext copies on B-party
 
     Parameters:
@@ -173,6 +210,7 @@ def is_ABk_symmetric_ext(rho, dim, kext, use_ppt=False, use_boson=False, use_tqd
         use_boson (bool): if True, use bosonic symmetry
         use_tqdm (bool): if True, use tqdm to show progress bar
         return_info (bool): if True, return information of the SDP solver
+        num_worker (int): number of processes for the batch input, each worker compiles the problem once
 
     Returns:
         ret (bool): If `return_info=False` and rho is single density matrix, `ret` is a bool indicates if rho has symmetric extension.
@@ -184,22 +222,8 @@ def is_ABk_symmetric_ext(rho, dim, kext, use_ppt=False, use_boson=False, use_tqd
     '''
     rho,is_single_item,dimA,dimB,use_tqdm = _check_input_rho_SDP(rho, dim, use_tqdm)
     rho = rho.reshape(-1,dimA,dimB,dimA,dimB).transpose(0,1,3,2,4).reshape(-1,dimA*dimA,dimB*dimB)
-    cvx_rho = cvxpy.Parameter((dimA*dimA,dimB*dimB), complex=True)
-    cvxP_list, constraints = _ABk_symmetric_extension_setup(dimA, dimB, kext, use_boson, use_ppt, cvx_rho)
-    prob = cvxpy.Problem(cvxpy.Minimize(1), constraints)
-    ret = []
-    for rho_i in (tqdm(rho) if use_tqdm else rho):
-        cvx_rho.value = rho_i
-        try:
-            prob.solve()
-            tmp0 = not np.isinf(prob.value)
-        except cvxpy.error.SolverError: #sometimes error when fail to solve
-            tmp0 = False
-        if return_info:
-            tmp1 = [np.ascontiguousarray(x.value) for x in cvxP_list] if tmp0 else None
-            ret.append((tmp0,tmp1))
-        else:
-            ret.append(tmp0)
+    tmp0 = int(dimA), int(dimB), int(kext), bool(use_ppt), bool(use_boson), return_info
+    ret = numqi.utils.run_parallel_sweep(_is_ABk_symmetric_ext_setup, tmp0, list(rho), num_worker=num_worker, use_tqdm=use_tqdm)
     if not return_info:
         ret = np.array(ret)
     if is_single_item:
@@ -208,7 +232,24 @@ def is_ABk_symmetric_ext(rho, dim, kext, use_ppt=False, use_boson=False, use_tqd
 
 
 
-def get_ABk_extension_numerical_range(op_list, direction, dim, kext, use_ppt=False, use_boson=False, use_tqdm=True, return_info=False):
+def _ABk_extension_numerical_range_setup(op_list, dim, kext, use_ppt, use_boson, return_info):
+    num_op = op_list.shape[0]
+    dimA,dimB = dim
+    N0 = dimA*dimB
+    cvx_vec = cvxpy.Parameter(num_op)
+    cvx_beta = cvxpy.Variable()
+    cvxP_list,constraints,cvx_rho = _ABk_symmetric_extension_setup(dimA, dimB, kext, use_boson, use_ppt)
+    # cvx_rho is of shape (dimA*dimA,dimB*dimB)
+    tmp0 = op_list.reshape(-1,dimA,dimB,dimA,dimB).transpose(0,4,2,3,1).reshape(-1,dimA*dimB*dimA*dimB, order='C')
+    cvx_op = cvxpy.real(tmp0 @ cvxpy.reshape(cvx_rho, N0*N0, order='F'))
+    constraints.append(cvx_beta*cvx_vec==cvx_op)
+    prob = cvxpy.Problem(cvxpy.Maximize(cvx_beta), constraints)
+    ret = _cvx_numerical_range_solver(prob, cvx_vec, cvx_op, return_info)
+    return ret
+
+
+def get_ABk_extension_numerical_range(op_list, direction, dim, kext, use_ppt=False, use_boson=False, use_tqdm=True,
+            return_info=False, num_worker=1):
     r'''get the symmetric extension numerical range of a list of operators
 
     $$ \max\;\beta $$
@@ -224,6 +265,7 @@ def get_ABk_extension_numerical_range(op_list, direction, dim, kext, use_ppt=Fal
         use_boson (bool): if `True`, then use bosonic symmetrical extension
         return_info (bool): if `True`, then return the boundary and the boundary's normal vector
         use_tqdm (bool): if `True`, then use tqdm to show the progress
+        num_worker (int): number of processes, the directions are sharded over the workers
 
     Returns:
         beta (np.ndarray): the distance from the origin to the boundary along the direction.
@@ -241,28 +283,10 @@ def get_ABk_extension_numerical_range(op_list, direction, dim, kext, use_ppt=Fal
     direction = direction.reshape(-1,num_op)
     if direction.shape[0]==1:
         use_tqdm = False
-    dimA,dimB = dim
-    N0 = dimA*dimB
-    cvx_vec = cvxpy.Parameter(num_op)
-    cvx_beta = cvxpy.Variable()
-    cvxP_list,constraints,cvx_rho = _ABk_symmetric_extension_setup(dimA, dimB, kext, use_boson, use_ppt)
-    # cvx_rho is of shape (dimA*dimA,dimB*dimB)
-    tmp0 = op_list.reshape(-1,dimA,dimB,dimA,dimB).transpose(0,4,2,3,1).reshape(-1,dimA*dimB*dimA*dimB, order='C')
-    cvx_op = cvxpy.real(tmp0 @ cvxpy.reshape(cvx_rho, N0*N0, order='F'))
-    constraints.append(cvx_beta*cvx_vec==cvx_op)
-    cvx_obj = cvxpy.Maximize(cvx_beta)
-    prob = cvxpy.Problem(cvx_obj, constraints)
-    obj_list = []
-    boundary_list = []
-    norm_vec_list = []
-    ret = []
-    for vec_i in (tqdm(direction) if use_tqdm else direction):
-        cvx_vec.value = vec_i
-        prob.solve()
-        obj_list.append(cvx_obj.value)
-        if return_info:
-            boundary_list.append(cvx_op.value.copy())
-            norm_vec_list.append(constraints[-1].dual_value.copy())
+    tmp0 = (op_list, dim, kext, use_ppt, use_boson, return_info)
+    tmp0 = numqi.utils.run_parallel_sweep(_ABk_extension_numerical_range_setup, tmp0, list(direction),
+                num_worker=num_worker, use_tqdm=use_tqdm)
+    obj_list,boundary_list,norm_vec_list = zip(*tmp0)
     if is_single:
         if return_info:
             ret = (obj_list[0], boundary_list[0], norm_vec_list[0])
@@ -277,6 +301,17 @@ def get_ABk_extension_numerical_range(op_list, direction, dim, kext, use_ppt=Fal
     return ret
 
 
+@functools.lru_cache(maxsize=4)
+def _get_ABk_symmetric_extension_boundary_problem(dimA:int, dimB:int, kext:int, use_ppt:bool, use_boson:bool):
+    cvx_rho = cvxpy.Parameter((dimA*dimA,dimB*dimB), complex=True)
+    cvx_beta = cvxpy.Variable()
+    tmp0 = np.eye(dimA*dimB).reshape(dimA,dimB,dimA,dimB).transpose(0,2,1,3).reshape(dimA*dimA,dimB*dimB)/(dimA*dimB)
+    cvx_sigma = tmp0 + cvx_beta * cvx_rho
+    _,constraints = _ABk_symmetric_extension_setup(dimA, dimB, kext, use_boson, use_ppt, cvx_sigma)
+    prob = cvxpy.Problem(cvxpy.Maximize(cvx_beta), constraints)
+    return cvx_rho, cvx_beta, constraints, prob
+
+
 def get_ABk_symmetric_extension_boundary(rho, dim, kext, use_ppt=False, use_boson=False, use_tqdm=False, return_info=False):
     '''get the boundary (in Euclidean space) of k-ext symmetric extension on B-party along rho direction
 
@@ -300,18 +335,14 @@ def get_ABk_symmetric_extension_boundary(rho, dim, kext, use_ppt=False, use_boso
     tmp0 = (rho - np.eye(dimA*dimB)/(dimA*dimB))/dm_norm.reshape(-1,1,1)
     rho_vec_list = tmp0.reshape(-1,dimA,dimB,dimA,dimB).transpose(0,1,3,2,4).reshape(-1,dimA*dimA,dimB*dimB)
 
-    cvx_rho = cvxpy.Parameter((dimA*dimA,dimB*dimB), complex=True)
-    cvx_beta = cvxpy.Variable()
-    tmp0 = np.eye(dimA*dimB).reshape(dimA,dimB,dimA,dimB).transpose(0,2,1,3).reshape(dimA*dimA,dimB*dimB)/(dimA*dimB)
-    cvx_sigma = tmp0 + cvx_beta * cvx_rho
-    cvxP_list,constraints = _ABk_symmetric_extension_setup(dimA, dimB, kext, use_boson, use_ppt, cvx_sigma)
-    prob = cvxpy.Problem(cvxpy.Maximize(cvx_beta), constraints)
+    cvx_rho, cvx_beta, constraints, prob = _get_ABk_symmetric_extension_boundary_problem(int(dimA), int(dimB),
+                int(kext), bool(use_ppt), bool(use_boson))
     beta_list = []
     vecA_list = []
     vecN_list = []
     for ind0 in (tqdm(range(len(rho))) if use_tqdm else range(len(rho))):
         cvx_rho.value = rho_vec_list[ind0]
-        prob.solve()
+        prob.solve(warm_start=False)
         beta = cvx_beta.value
         beta_list.append(beta)
         if return_info:
@@ -3,6 +3,8 @@ import functools
 import itertools
 import torch
 
+import numqi._disk_cache
+
 def gellmann_matrix(i:int, j:int, d:int):
     r'''get the Gell-Mann matrix
     [wiki-link/Gell-Mann-matrices](https://en.wikipedia.org/wiki/Gell-Mann_matrices)
@@ -45,19 +47,27 @@ def gellmann_matrix(i:int, j:int, d:int):
 
 @functools.lru_cache
 def _all_gellmann_matrix_cache(d, tensor_n, with_I):
-    sym_mat = [gellmann_matrix(i,j,d) for i in range(d) for j in range(i+1,d)]
-    antisym_mat = [gellmann_matrix(j,i,d) for i in range(d) for j in range(i+1,d)]
-    diag_mat = [gellmann_matrix(i,i,d) for i in range(1,d)]
-    tmp0 = [gellmann_matrix(0, 0, d)]
-    ret = np.stack(sym_mat+antisym_mat+diag_mat+tmp0, axis=0)
     if tensor_n>1:
-        tmp0 = [list(range(d**2))]*tensor_n
-        ret = np.stack([functools.reduce(np.kron, [ret[y] for y in x]) for x in itertools.product(*tmp0)])
+        ret = _all_gellmann_matrix_tensor(d, tensor_n)
+    else:
+        sym_mat = [gellmann_matrix(i,j,d) for i in range(d) for j in range(i+1,d)]
+        antisym_mat = [gellmann_matrix(j,i,d) for i in range(d) for j in range(i+1,d)]
+        diag_mat = [gellmann_matrix(i,i,d) for i in range(1,d)]
+        tmp0 = [gellmann_matrix(0, 0, d)]
+        ret = np.stack(sym_mat+antisym_mat+diag_mat+tmp0, axis=0)
     if not with_I:
         ret = ret[:-1]
     return ret
 
 
+@numqi._disk_cache.disk_cache('gellmann_tensor')
+def _all_gellmann_matrix_tensor(d:int, tensor_n:int):
+    ret = _all_gellmann_matrix_cache(d, 1, True)
+    tmp0 = [list(range(d**2))]*tensor_n
+    ret = np.stack([functools.reduce(np.kron, [ret[y] for y in x]) for x in itertools.product(*tmp0)])
+    return ret
+
+
 def all_gellmann_matrix(d:int, /, tensor_n:int=1, with_I:bool=True):
     r'''get all Gell-Mann matrices
 
@@ -245,19 +255,18 @@ def get_density_matrix_distance2(rho:np.ndarray, sigma:np.ndarray):
     Equivalent to the Frobenius distance over 2.
 
     Parameters:
-        rho (np.ndarray): density matrix, 2d array
-        sigma (np.ndarray): density matrix, 2d array
+        rho (np.ndarray): density matrix, 2d array, the leading dimensions (if any) are batch dimensions
+        sigma (np.ndarray): density matrix, 2d array or with the same batch dimensions as `rho`
 
     Returns:
-        ret (float): distance
+        ret (float,np.ndarray): distance, of the batch shape if batched
     '''
-    # not support batch
-    tmp0 = (rho - sigma).reshape(-1)
-    if isinstance(rho, torch.Tensor):
-        ret = torch.vdot(tmp0, tmp0).real / 2
-        # factor 1/2 is due to the normalization of Gell-Mann basis
+    tmp0 = rho - sigma
+    # factor 1/2 is due to the normalization of Gell-Mann basis
+    if isinstance(tmp0, torch.Tensor):
+        ret = (tmp0.conj()*tmp0).real.sum(dim=(-2,-1)) / 2
     else:
-        ret = np.vdot(tmp0, tmp0).real / 2
+        ret = (tmp0.conj()*tmp0).real.sum(axis=(-2,-1)) / 2
     ## equivalent to below
     # tmp0 = dm_to_gellmann_basis(rho)
     # tmp1 = dm_to_gellmann_basis(sigma)
@@ -6,6 +6,7 @@ import sympy.combinatorics
 import numpy as np
 
 import numqi.utils
+import numqi._disk_cache
 
 # def get_symmetric_group_matrix(n):
 #     # TODO seems not correct, we need regular form, this seems to be permutation group
@@ -358,6 +359,14 @@ def get_all_young_tableaux(young:tuple[int], check:bool=True):
     young = np.asarray(young, dtype=np.int64)
     if check:
         check_young_diagram(young)
+    ret = _get_all_young_tableaux_cache(tuple(young.tolist())).copy()
+    return ret
+
+
+@functools.lru_cache(maxsize=16)
+@numqi._disk_cache.disk_cache('young_tableaux')
+def _get_all_young_tableaux_cache(young:tuple[int]):
+    young = np.array(young, dtype=np.int64)
     index = np.arange(young.sum(), dtype=np.int64)
     lower_bound = [0]*(young[0]-1)
     ret = _get_all_young_tableaux_hf0(young, index, lower_bound)
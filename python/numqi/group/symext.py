@@ -2,9 +2,12 @@ import math
 import itertools
 import functools
 import numpy as np
+import scipy.sparse
 
 import numqi.dicke
-from ._symmetric import get_all_young_tableaux, get_young_diagram_mask, young_tableau_to_young_symmetrizer, get_sym_group_young_diagram
+import numqi._disk_cache
+from ._symmetric import (get_all_young_tableaux, get_young_diagram_mask, young_tableau_to_young_symmetrizer,
+                get_sym_group_young_diagram, get_young_diagram_transpose, get_hook_length)
 
 
 def _ABk_permutate(mat, ind0, ind1, dimA, dimB, kext, kind):
@@ -33,6 +36,13 @@ def get_ABk_symmetry_index(dimA:int, dimB:int, kext:int, use_boson:bool=False):
         index_skew (np.ndarray): the index of the skew-symmetric term, shape=(dimA*dimB**kext, dimA*dimB**kext)
         factor_skew (np.ndarray): the factor of the skew-symmetric term, shape=(dimA*dimB**kext, dimA*dimB**kext)
     '''
+    tmp0 = _get_ABk_symmetry_index_cache(int(dimA), int(dimB), int(kext), bool(use_boson))
+    index_sym,index_skew,factor_skew = [x.copy() for x in tmp0]
+    return index_sym,index_skew,factor_skew
+
+
+@numqi._disk_cache.disk_cache('ABk_symmetry_index')
+def _get_ABk_symmetry_index_cache(dimA:int, dimB:int, kext:int, use_boson:bool):
     index_to_set = np.arange((dimA*dimB**kext)**2, dtype=np.int64).reshape(dimA*dimB**kext, -1)
     tmp0 = [(x,y) for x in range(kext) for y in range(x+1,kext)]
     for ind0,ind1 in tmp0:
@@ -154,67 +164,157 @@ def get_3qutrit_irrep_basis():
     return basis3,basis21a,basis21b,basis111
 
 
-def get_sud_symmetric_irrep_basis(dim:int, kext:int, zero_eps:float=1e-7):
-    r'''Get the basis of the symmetric extension irrep (irreducible representation) for (B1B2...Bk) system.
+@functools.lru_cache(maxsize=8)
+def _get_weight_sector(dim:int, kext:int):
+    # the permutation of (B1B2...Bk) keeps the occupation number of each level, so all the symmetrizers
+    # are block-diagonal in the weight sectors, of size multinomial(kext; n0,n1,...) instead of dim**kext
+    multi_index = np.stack(np.unravel_index(np.arange(dim**kext, dtype=np.int64), [dim]*kext), axis=1)
+    occupation = (multi_index[:,:,np.newaxis]==np.arange(dim)).sum(axis=1)
+    _,sector_id = np.unique(occupation @ ((kext+1)**np.arange(dim, dtype=np.int64)), return_inverse=True)
+    sector_id = sector_id.reshape(-1)
+    tmp1 = np.argsort(sector_id, kind='stable')
+    sector_list = np.split(tmp1, np.nonzero(np.diff(sector_id[tmp1]))[0]+1)
+    position = np.zeros(dim**kext, dtype=np.int64)
+    for x in sector_list:
+        position[x] = np.arange(len(x))
+    sector_weight = -np.sort(-occupation[[x[0] for x in sector_list]], axis=1) #sorted in descending order
+    multi_index = multi_index.astype(np.float64) #exact integer, for the BLAS matmul below
+    return multi_index, position, sector_list, sector_weight
+
+
+def _weight_sector_permute(dim:int, kext:int, op:np.ndarray):
+    # the same permutation as np.transpose(x, op.tolist()+[kext]), the basis a is mapped to b with b[op[i]]=a[i]
+    multi_index,position,_,_ = _get_weight_sector(dim, kext)
+    tmp0 = (dim**np.arange(kext-1, -1, -1)).astype(np.float64)
+    ret = position[(multi_index @ tmp0[op]).astype(np.int64)]
+    return ret
 
-    Parameters:
-        dim (int): dimension of the Hilbert space
-        kext (int): the number of extension
-        zero_eps (float): the zero threshold, default is 1e-7
 
-    Returns:
-        basis_list (list[list[np.ndarray]]): list of list of basis, the first list indexing is for Young diagram,
-                the second list indexing is for Young tableaux. np.ndarray are of shape (#basis,dim)
-    '''
+@functools.lru_cache
+def _get_kostka_number(young:tuple[int], weight:tuple[int]):
+    # number of semistandard Young tableaux of shape young and content weight, by removing horizontal strips
+    if len(weight)==0:
+        return int(sum(young)==0)
+    young = tuple(young) + (0,)
+    tmp0 = [range(young[x+1], young[x]+1) for x in range(len(young)-1)]
+    ret = 0
+    for x in itertools.product(*tmp0):
+        if sum(young)-sum(x)==weight[-1]:
+            ret += _get_kostka_number(tuple(y for y in x if y>0), weight[:-1])
+    return ret
+
+
+def _apply_sector_young_symmetrizer(Ydiagram:tuple[int], Ytableau:np.ndarray, dim:int, kext:int, mat_list:list[np.ndarray]):
+    # apply the normalized Young symmetrizer (row symmetrizer times column anti-symmetrizer) to the blocks on the weight sectors.
+    # The sum over the permutation group of {t0,...,tm} is factorized along the cosets, S_{m+1} = S_m (e + sum_j (tj,tm)),
+    # so only O(kext^2) permutations are used instead of |R|*|C| ones in young_tableau_to_young_symmetrizer
+    YdiagramT = get_young_diagram_transpose(Ydiagram)
+    row_list = [Ytableau[x,:y] for x,y in enumerate(Ydiagram) if y>1]
+    column_list = [Ytableau[:y,x] for x,y in enumerate(YdiagramT) if y>1]
+    sector_list = _get_weight_sector(dim, kext)[2]
+    factor_list = [(x[:(ind0+1)],1) for x in row_list for ind0 in range(1,len(x))]
+    factor_list += [(x[:(ind0+1)],-1) for x in column_list for ind0 in range(1,len(x))]
+    scale = get_hook_length(*Ydiagram) / math.factorial(kext) #make a projector
+    ret = [x*scale for x in mat_list]
+    for group,sign in reversed(factor_list):
+        tmp0 = [x.copy() for x in ret]
+        for ind0 in range(len(group)-1):
+            op = np.arange(kext)
+            op[[group[-1],group[ind0]]] = group[ind0],group[-1]
+            tmp1 = _weight_sector_permute(dim, kext, op)
+            # P[a,b]=1 if a is mapped to b, (P @ X)[a] = X[b(a)]
+            for x,y,z in zip(tmp0, ret, sector_list):
+                if y.size:
+                    x += sign*y[tmp1[z]]
+        ret = tmp0
+    return ret
+
+
+def _get_sud_symmetric_irrep_basis_sparse(dim:int, kext:int, zero_eps:float=1e-7):
+    # same as get_sud_symmetric_irrep_basis, but the basis are scipy.sparse.csr_array of shape (#basis,dim**kext)
     assert dim >= 2
     Ydiagram_list = [tuple(y for y in x if y>0) for x in get_sym_group_young_diagram(kext).tolist()]
-    # TODO sparse
-    eye_reshape = np.eye(dim**kext).reshape([dim]*kext+[dim**kext])
+    _,_,sector_list,sector_weight = _get_weight_sector(dim, kext)
+    np_rng = np.random.default_rng(0) #fixed seed, the basis is deterministic
 
     basis_list = []
     valid_Ydiagram_list = [x for x in Ydiagram_list if len(x)<=dim]
     for Ydiagram_i in valid_Ydiagram_list:
         Ytableaux = get_all_young_tableaux(Ydiagram_i)
         Ymask = get_young_diagram_mask(Ydiagram_i).astype(np.bool_)
-        Yop,coeff = young_tableau_to_young_symmetrizer(Ydiagram_i, Ytableaux[0])
-        coeff = coeff * (Ytableaux.shape[0]/math.factorial(kext)) #make a normalized projector, not necessary here
-        tmp0 = 0
-        for x,y in zip(Yop, coeff):
-            tmp0 = tmp0 + np.transpose(eye_reshape, x.tolist() + [len(x)])*y
-        projector = tmp0.reshape(dim**kext, -1)
-        if Ytableaux.shape[0]==1:
-            EVL,EVC = np.linalg.eigh(projector)
-            assert np.abs(EVL[EVL>zero_eps]-1).max() < zero_eps #should all be 1 or 0
-            basis_list.append([EVC[:,EVL>zero_eps]])
-        else:
-            EVL,EVC = np.linalg.eigh(projector @ projector.T)
-            basis_i = [EVC[:,EVL>zero_eps]]
+        # the normalized Young symmetrizer P is idempotent, and its rank in the weight sector is the Kostka number,
+        # so range(P) is spanned by P@G for random G of that width (instead of the eigen-decomposition of P@P.T)
+        rank_list = [_get_kostka_number(Ydiagram_i, tuple(x for x in y if x>0)) for y in sector_weight.tolist()]
+        tmp0 = [np_rng.normal(size=(len(x),y)) for x,y in zip(sector_list,rank_list)]
+        tmp1 = _apply_sector_young_symmetrizer(Ydiagram_i, Ytableaux[0], dim, kext, tmp0)
+        # each basis is stored as the list of its (disjoint) blocks on the weight sectors
+        basis_i0 = [np.linalg.qr(x)[0] for x in tmp1]
+        tmp2 = _apply_sector_young_symmetrizer(Ydiagram_i, Ytableaux[0], dim, kext, basis_i0)
+        assert all(np.abs(x-y).max() < zero_eps for x,y in zip(tmp2,basis_i0) if x.size) #P@Q=Q
+        basis_i = [basis_i0]
+        if Ytableaux.shape[0]>1:
             assert np.all(Ytableaux[0, Ymask]==np.arange(kext))
-            basis_i0 = basis_i[0].reshape([dim]*kext+[-1])
+            # all the previous basis in each sector
+            basis_cat = [np.zeros((x.shape[0], x.shape[1]*len(Ytableaux)), dtype=np.float64) for x in basis_i0]
+            for x,y in zip(basis_cat, basis_i0):
+                x[:,:y.shape[1]] = y
             for ind_tab in range(1,len(Ytableaux)):
-                tmp0 = np.argsort(Ytableaux[ind_tab, Ymask]).tolist() + [kext]
-                # np.transpose(eye_reshape, tmp0).reshape(dim**kext,-1) @ basis_i[0]
-                tmp1 = np.transpose(basis_i0, tmp0).reshape(dim**kext, -1)
-                for x in basis_i:
-                    tmp1 = tmp1 - x @ (x.T.conj() @ tmp1)
-                tmp2 = np.linalg.norm(tmp1, axis=0)
-                assert np.min(tmp2) > zero_eps
-                basis_i.append(tmp1/tmp2)
-            basis_list.append(basis_i)
-    basis_list = [[y.T for y in x] for x in basis_list]
-    return basis_list
+                # np.transpose(basis_i0, np.argsort(Ytableaux[ind_tab, Ymask]).tolist()+[kext])
+                tmp0 = _weight_sector_permute(dim, kext, np.argsort(Ytableaux[ind_tab, Ymask]))
+                tmp1 = []
+                for x,y,sector in zip(basis_i0, basis_cat, sector_list):
+                    tmp2 = x[tmp0[sector]]
+                    if tmp2.size:
+                        tmp3 = y[:,:(ind_tab*x.shape[1])]
+                        tmp2 = tmp2 - tmp3 @ (tmp3.T @ tmp2)
+                        tmp4 = np.linalg.norm(tmp2, axis=0)
+                        assert np.min(tmp4) > zero_eps
+                        tmp2 = tmp2 / tmp4
+                        y[:,(ind_tab*x.shape[1]):((ind_tab+1)*x.shape[1])] = tmp2
+                    tmp1.append(tmp2)
+                basis_i.append(tmp1)
+        basis_list.append(basis_i)
+    ret = []
+    for basis_i in basis_list:
+        ret.append([])
+        for x in basis_i:
+            tmp0 = np.cumsum([0]+[y.shape[1] for y in x])
+            tmp1 = np.concatenate([np.repeat(np.arange(z0,z1).reshape(1,-1), len(y), axis=0).reshape(-1) for z0,z1,y in zip(tmp0[:-1],tmp0[1:],x)])
+            tmp2 = np.concatenate([np.repeat(z, y.shape[1]) for z,y in zip(sector_list,x)])
+            tmp3 = np.concatenate([y.reshape(-1) for y in x])
+            ret[-1].append(scipy.sparse.csr_array((tmp3, (tmp1,tmp2)), shape=(tmp0[-1], dim**kext)))
+    return ret
+
+
+def get_sud_symmetric_irrep_basis(dim:int, kext:int, zero_eps:float=1e-7):
+    r'''Get the basis of the symmetric extension irrep (irreducible representation) for (B1B2...Bk) system.
+    The Young symmetrizers are diagonalized in each weight sector (fixed occupation number of each level)
+    separately, so no `dim**kext x dim**kext` matrix is constructed.
+
+    Parameters:
+        dim (int): dimension of the Hilbert space
+        kext (int): the number of extension
+        zero_eps (float): the zero threshold, default is 1e-7
+
+    Returns:
+        basis_list (list[list[np.ndarray]]): list of list of basis, the first list indexing is for Young diagram,
+                the second list indexing is for Young tableaux. np.ndarray are of shape (#basis,dim)
+    '''
+    ret = [[y.toarray() for y in x] for x in _get_sud_symmetric_irrep_basis_sparse(dim, kext, zero_eps)]
+    return ret
 
 
 def _basis_partial_trace(basis, dim):
-    tmp0 = basis.reshape(basis.shape[0], dim, -1)
-    ret = np.einsum(tmp0, [0,1,2], tmp0.conj(), [3,4,2], [0,3,1,4], optimize=True)
+    # basis (scipy.sparse.csr_array) of shape (#basis,dim**kext), trace out (B2...Bk)
+    tmp0 = scipy.sparse.coo_array(basis)
+    tmp1 = basis.shape[1]//dim
+    tmp2 = scipy.sparse.csr_array((tmp0.data, (tmp0.row*dim + tmp0.col//tmp1, tmp0.col%tmp1)), shape=(basis.shape[0]*dim, tmp1))
+    ret = (tmp2 @ tmp2.T.conj()).toarray().reshape(basis.shape[0], dim, basis.shape[0], dim).transpose(0,2,1,3)
     return ret
 
 
-@functools.lru_cache
-def _get_symmetric_extension_irrep_coeff_internal(dim:int, kext:int):
-    dim = int(dim)
-    kext = int(kext)
+@numqi._disk_cache.disk_cache('symext_irrep_coeff')
+def _symmetric_extension_irrep_coeff_compute(dim:int, kext:int):
     if dim==2:
         tmp0 = numqi.dicke.get_partial_trace_ABk_to_AB_index(kext, dim=2, return_tensor=True).transpose(2,3,0,1).copy()
         # a00,a01,a10,a11 = numqi.dicke.dicke_state_partial_trace(kext)
@@ -222,16 +322,24 @@ def _get_symmetric_extension_irrep_coeff_internal(dim:int, kext:int):
         coeff_list = [tmp0]
         multiplicity_list = 1, #all sym-ext are bosonic-ext, so we only use Dicke state
     else:
-        basis_part = get_sud_symmetric_irrep_basis(dim, kext)
+        basis_part = _get_sud_symmetric_irrep_basis_sparse(dim, kext)
         multiplicity_list = tuple(len(x) for x in basis_part)
         coeff_list = [sum(_basis_partial_trace(y,dim) for y in x) for x in basis_part]
+    return coeff_list,multiplicity_list
+
+
+@functools.lru_cache
+def _get_symmetric_extension_irrep_coeff_internal(dim:int, kext:int):
+    coeff_list,multiplicity_list = _symmetric_extension_irrep_coeff_compute(int(dim), int(kext))
     for x in coeff_list:
         x.flags.writeable = False
-    return coeff_list,multiplicity_list
+    return list(coeff_list),tuple(multiplicity_list)
 
 
 def get_symmetric_extension_irrep_coeff(dim:int, kext:int):
     r'''Get the coefficients of the symmetric extension irrep. If dim=2, only Dicke state is used.
+    The result is cached in memory, and also on disk if the cache directory is set by `numqi.utils.set_cache_dir`
+    (or `export NUMQI_CACHE_DIR=~/.cache/numqi`), which saves the construction for large `kext` across processes.
 
     Parameters:
         dim (int): dimension of the Hilbert space
@@ -1,4 +1,5 @@
 import itertools
+import functools
 import numpy as np
 import scipy.sparse
 import torch
@@ -6,53 +7,102 @@ import collections
 
 import numqi.group.symext
 
+
+@functools.lru_cache(maxsize=8)
+def _get_ABk_hermitian_index(dimA:int, dimB:int, kext:int):
+    # the sign of the skew-symmetric part is folded into the index, the parameter vector is [0, theta, -theta]
+    index_sym,index_skew,factor_skew = numqi.group.symext.get_ABk_symmetry_index(dimA, dimB, kext, use_boson=False)
+    num_skew = index_skew.max()
+    index_skew = np.where(factor_skew<0, index_skew+num_skew, index_skew)
+    num_sym = index_sym.max()+1
+    index_sym = torch.tensor(index_sym, dtype=torch.int64)
+    index_skew = torch.tensor(index_skew, dtype=torch.int64)
+    return index_sym, index_skew, num_sym, num_skew
+
+
+@functools.lru_cache(maxsize=8)
+def _get_ABk_2local_index(dimA:int, dimB:int, kext:int, is_skew:bool):
+    # coeff is kept as a sparse COO tensor, the dense one is of size (#unique element, (dimA*dimB)**2)
+    hf0 = ABk_2local_skew_symmetry_index if is_skew else ABk_2local_symmetry_index
+    coeff,index = hf0(dimA, dimB, kext)
+    coeff = coeff.tocoo()
+    tmp0 = torch.tensor(np.stack([coeff.row,coeff.col]), dtype=torch.int64)
+    coeff = torch.sparse_coo_tensor(tmp0, torch.tensor(coeff.data, dtype=torch.float64), coeff.shape, check_invariants=True).coalesce()
+    index = torch.tensor(index, dtype=torch.int64)
+    return coeff, index
+
+
 class ABkHermitian(torch.nn.Module):
-    def __init__(self, dimA, dimB, kext, dtype=torch.float64, device='cpu'):
+    def __init__(self, dimA:int, dimB:int, kext:int, batch_size:(int|None)=None, dtype=torch.float64, device='cpu'):
+        r'''Hermitian matrix on the (AB1B2...Bk) system, symmetric under the permutation of the B systems
+
+        Parameters:
+            dimA (int): dimension of the A system
+            dimB (int): dimension of the B system
+            kext (int): the number of extension
+            batch_size (int,None): if not None, the leading dimension of the output is `batch_size`
+            dtype (torch.dtype): data type of the parameters, torch.float32 or torch.float64
+            device (torch.device): device of the parameters
+        '''
         super().__init__()
-        index_sym,index_skew,factor_skew = numqi.group.symext.get_ABk_symmetry_index(dimA, dimB, kext, use_boson=False)
-        self.index_sym = torch.tensor(index_sym, dtype=torch.int64, device=device)
-        self.index_skew = torch.tensor(index_skew, dtype=torch.int64, device=device)
-        self.factor_skew = torch.tensor(factor_skew, dtype=dtype, device=device)
+        index_sym,index_skew,num_sym,num_skew = _get_ABk_hermitian_index(dimA, dimB, kext)
+        self.index_sym = index_sym.to(device)
+        self.index_skew = index_skew.to(device)
         np_rng = np.random.default_rng()
-        hf0 = lambda *x: torch.nn.Parameter(torch.tensor(np_rng.uniform(-1, 1, size=x), dtype=dtype, device=device))
-        self.theta_sym = hf0(index_sym.max()+1)
-        self.theta_skew_sym = hf0(index_skew.max())
+        tmp0 = () if (batch_size is None) else (batch_size,)
+        hf0 = lambda x: torch.nn.Parameter(torch.tensor(np_rng.uniform(-1, 1, size=tmp0+(x,)), dtype=dtype, device=device))
+        self.theta_sym = hf0(num_sym)
+        self.theta_skew_sym = hf0(num_skew)
+        self.batch_size = batch_size
 
     def forward(self):
-        zero0 = torch.zeros([1], dtype=self.theta_skew_sym.dtype, device=self.theta_skew_sym.device)
-        tmp1 = torch.concat([zero0, self.theta_skew_sym], dim=0)
-        ret = (1j*tmp1)[self.index_skew]*self.factor_skew + self.theta_sym[self.index_sym]
+        theta = self.theta_skew_sym
+        zero0 = torch.zeros(theta.shape[:-1]+(1,), dtype=theta.dtype, device=theta.device)
+        tmp1 = torch.concat([zero0, theta, -theta], dim=-1)
+        ret = torch.complex(self.theta_sym[...,self.index_sym], tmp1[...,self.index_skew])
         return ret
 
 class ABk2localHermitian(torch.nn.Module):
-    def __init__(self, dimA, dimB, kext, dtype=torch.float64, device='cpu'):
+    def __init__(self, dimA:int, dimB:int, kext:int, batch_size:(int|None)=None, dtype=torch.float64, device='cpu'):
+        r'''Hermitian matrix $\sum_i H_{AB_i}$ on the (AB1B2...Bk) system, the sum of the same 2-local term
+        over all the B systems. The linear map from the 2-local parameters is a sparse matrix
+
+        Parameters:
+            dimA (int): dimension of the A system
+            dimB (int): dimension of the B system
+            kext (int): the number of extension
+            batch_size (int,None): if not None, the leading dimension of the output is `batch_size`
+            dtype (torch.dtype): data type of the parameters, torch.float32 or torch.float64
+            device (torch.device): device of the parameters
+        '''
         super().__init__()
         np_rng = np.random.default_rng()
-        tmp0 = np_rng.uniform(-1, 1, size=(dimA*dimB, dimA*dimB))
+        tmp0 = () if (batch_size is None) else (batch_size,)
+        tmp0 = np_rng.uniform(-1, 1, size=tmp0+(dimA*dimB, dimA*dimB))
         self.matAB_real = torch.nn.Parameter(torch.tensor(tmp0, dtype=dtype, device=device))
-        coeff_sym,index_sym = ABk_2local_symmetry_index(dimA, dimB, kext)
-        self.coeff_sym = torch.tensor(coeff_sym.toarray(), dtype=dtype, device=device)#.to_sparse_csr()
-        self.index_sym = torch.tensor(index_sym, dtype=torch.int64, device=device)
-        coeff_skew_sym,index_skew_sym = ABk_2local_skew_symmetry_index(dimA, dimB, kext)
-        self.coeff_skew_sym = torch.tensor(coeff_skew_sym.toarray(), dtype=dtype, device=device)#.to_sparse_csr()
-        self.index_skew_sym = torch.tensor(index_skew_sym, dtype=torch.int64, device=device)
+        coeff_sym,index_sym = _get_ABk_2local_index(dimA, dimB, kext, is_skew=False)
+        self.coeff_sym = coeff_sym.to(dtype=dtype, device=device)
+        self.index_sym = index_sym.to(device)
+        coeff_skew_sym,index_skew_sym = _get_ABk_2local_index(dimA, dimB, kext, is_skew=True)
+        self.coeff_skew_sym = coeff_skew_sym.to(dtype=dtype, device=device)
+        self.index_skew_sym = index_skew_sym.to(device)
         self.tril_index0 = torch.triu_indices(dimA*dimB, dimA*dimB, offset=0, device=device)
         self.tril_index1 = torch.triu_indices(dimA*dimB, dimA*dimB, offset=1, device=device)
-        self.c_dtype = torch.complex64 if dtype==torch.float32 else torch.complex128
+        self.batch_size = batch_size
 
     def forward(self):
-        tmp0 = self.matAB_real[self.tril_index0[0], self.tril_index0[1]]
-        tmp1 = ABk_2local_index_to_full(tmp0, self.coeff_sym, self.index_sym).to(self.c_dtype)
-        tmp2 = self.matAB_real.T[self.tril_index1[0], self.tril_index1[1]]
-        tmp3 = ABk_2local_index_to_full(tmp2, self.coeff_skew_sym, self.index_skew_sym).to(self.c_dtype)
-        ret = tmp1 + tmp3*1j
+        tmp0 = self.matAB_real[...,self.tril_index0[0], self.tril_index0[1]]
+        tmp1 = ABk_2local_index_to_full(tmp0, self.coeff_sym, self.index_sym)
+        tmp2 = self.matAB_real.transpose(-1,-2)[...,self.tril_index1[0], self.tril_index1[1]]
+        tmp3 = ABk_2local_index_to_full(tmp2, self.coeff_skew_sym, self.index_skew_sym)
+        ret = torch.complex(tmp1, tmp3)
         return ret
 
     def to_AB(self):
         tmp0 = self.matAB_real.detach().cpu().numpy().copy()
         tmp2 = np.triu(tmp0)
-        tmp3 = np.tril(tmp0, k=-1).T
-        ret = tmp2 + tmp2.T - np.diag(np.diag(tmp2)) + 1j*(tmp3 - tmp3.T)
+        tmp3 = np.tril(tmp0, k=-1).swapaxes(-1,-2)
+        ret = tmp2 + tmp2.swapaxes(-1,-2) - np.triu(np.tril(tmp2)) + 1j*(tmp3 - tmp3.swapaxes(-1,-2))
         return ret
 
 def ABk_permutate(mat, ind0, ind1, dimA, dimB, kext):
@@ -121,7 +171,13 @@ def ABk_2local_symmetry_index(dimA, dimB, kext):
     return coeff, index
 
 def ABk_2local_index_to_full(parameter, coeff, index):
-    ret = (coeff @ parameter)[index]
+    if isinstance(parameter, torch.Tensor) and coeff.is_sparse:
+        # torch.sparse.mm only takes 2d dense operand, the batch dimensions are moved to the columns
+        tmp0 = parameter.reshape(-1, parameter.shape[-1]).T
+        tmp1 = torch.sparse.mm(coeff, tmp0).T.reshape(*parameter.shape[:-1], -1)
+        ret = tmp1[...,index]
+    else:
+        ret = (coeff @ parameter)[index]
     return ret
 
 
@@ -136,11 +192,10 @@ def ABk_2local_skew_symmetry_index(dimA, dimB, kext):
 
     if kext==1:
         tmp0 = index_to_set_AB.reshape(-1)
-        coeff = np.zeros((num_row**2, index_to_set_AB.max()), dtype=np.int32)
         tmp1 = tmp0!=0
         tmp2 = tmp0[tmp1]
-        coeff[np.arange(num_row**2)[tmp1], np.abs(tmp2)-1] = 2*(tmp2>0)-1
-        coeff = scipy.sparse.csr_matrix(coeff)
+        tmp3 = (2*(tmp2>0)-1, (np.arange(num_row**2)[tmp1], np.abs(tmp2)-1))
+        coeff = scipy.sparse.csr_matrix(tmp3, shape=(num_row**2, index_to_set_AB.max()), dtype=np.int32)
         index = np.arange(num_row**2).reshape(num_row,num_row)
         coeff = -coeff
     else:
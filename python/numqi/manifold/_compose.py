@@ -28,7 +28,7 @@ def quantum_state(dim, batch_size:(int|None)=None, method:str='quotient',
 
 
 def density_matrix(dim:int, rank:(int|None)=None, batch_size:(int|None)=None, method:str='cholesky',
-            requires_grad:bool=True, dtype:torch.dtype=torch.complex128, device:torch.device=_CPU):
+            requires_grad:bool=True, dtype:torch.dtype=torch.complex128, device:torch.device=_CPU, return_factor:bool=False):
     r'''manifold of density matrix, wrapper of numqi.manifold.Trace1PSD
 
     Parameters:
@@ -39,12 +39,13 @@ def density_matrix(dim:int, rank:(int|None)=None, batch_size:(int|None)=None, me
         requires_grad (bool): whether to require gradient
         dtype (torch.dtype): data type of density matrix
         device (torch.device): device of density matrix
+        return_factor (bool): if True, the manifold returns the factored form `(matY,prob)`, see `numqi.manifold.Trace1PSD`
 
     Returns:
         ret (numqi.manifold.Trace1PSD): manifold of density matrix.
     '''
     assert dtype in {torch.complex64,torch.complex128}
-    ret = Trace1PSD(dim, rank, batch_size, method, requires_grad, dtype, device)
+    ret = Trace1PSD(dim, rank, batch_size, method, requires_grad, dtype, device, return_factor)
     return ret
 
 
@@ -52,7 +53,12 @@ def density_matrix(dim:int, rank:(int|None)=None, batch_size:(int|None)=None, me
 class SeparableDensityMatrix(torch.nn.Module):
     def __init__(self, dimA:int, dimB:int, num_cha:(int|None)=None, batch_size:(int|None)=None,
                  requires_grad:bool=True, dtype:torch.dtype=torch.complex128, device:torch.device=_CPU):
-        r'''manifold of separable density matrix
+        r'''manifold of separable density matrix $\rho=\sum_i p_i |a_ib_i\rangle\langle a_ib_i|$
+
+        The product states $|a_ib_i\rangle$ are stacked into a matrix $X$ of shape `(num_cha,dimA*dimB)` and
+        $\rho=X^T\mathrm{diag}(p)X^*$ is one (batched) matrix multiplication, so the forward and the backward use
+        $O(\mathrm{num\_cha}\cdot d_Ad_B+(d_Ad_B)^2)$ memory per item instead of the
+        `(num_cha,dimA*dimB,dimA*dimB)` intermediate of the outer products
 
         Parameters:
             dimA (int): dimension of the first subsystem
@@ -66,7 +72,7 @@ class SeparableDensityMatrix(torch.nn.Module):
         super().__init__()
         if num_cha is None:
             num_cha = 2*dimA*dimB
-        tmp0 = torch.float32 if (dtype==[torch.complex64,torch.float32]) else torch.float64
+        tmp0 = torch.float32 if (dtype in [torch.complex64,torch.float32]) else torch.float64
         self.manifold_p = DiscreteProbability(num_cha, batch_size, 'softmax', requires_grad=requires_grad, dtype=tmp0, device=device)
         tmp0 = num_cha if (batch_size is None) else (batch_size*num_cha)
         self.manifold_psiA = Sphere(dimA, tmp0, 'quotient', requires_grad, dtype=dtype, device=device)
@@ -80,16 +86,11 @@ class SeparableDensityMatrix(torch.nn.Module):
         prob = self.manifold_p()
         psiA = self.manifold_psiA()
         psiB = self.manifold_psiB()
-        if self.batch_size is None:
-            psiA_conj = psiA.conj()
-            psiB_conj = psiB.conj()
-            ret = torch.einsum(prob, [0], psiA, [0,1], psiA_conj, [0,3], psiB, [0,2], psiB_conj, [0,4], [1,2,3,4])
-        else:
-            psiA = psiA.reshape(self.batch_size, self.num_cha, self.dimA)
-            psiB = psiB.reshape(self.batch_size, self.num_cha, self.dimB)
-            psiA_conj = psiA.conj()
-            psiB_conj = psiB.conj()
-            ret = torch.einsum(prob, [5,0], psiA, [5,0,1], psiA_conj, [5,0,3], psiB, [5,0,2], psiB_conj, [5,0,4], [5,1,2,3,4])
+        tmp0 = () if (self.batch_size is None) else (self.batch_size,)
+        # (...,num_cha,dimA*dimB) product states, rho = X^T diag(p) X^*
+        psiAB = (psiA.reshape(*tmp0, self.num_cha, self.dimA, 1) * psiB.reshape(*tmp0, self.num_cha, 1, self.dimB)).reshape(*tmp0, self.num_cha, -1)
+        ret = (psiAB * prob.unsqueeze(-1).to(psiAB.dtype)).transpose(-2,-1) @ psiAB.conj()
+        ret = ret.reshape(*tmp0, self.dimA, self.dimB, self.dimA, self.dimB)
         return ret
 
 
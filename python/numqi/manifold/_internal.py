@@ -1,3 +1,4 @@
+import functools
 import numpy as np
 import scipy.special
 import torch
@@ -5,6 +6,8 @@ import torch
 import numqi.gellmann
 import numqi._torch_op
 
+from ._riemann import SphereGeometry, StiefelGeometry
+
 _CPU = torch.device('cpu')
 
 def _hf_para(dtype, requires_grad, *size):
@@ -12,6 +15,42 @@ def _hf_para(dtype, requires_grad, *size):
     ret = torch.nn.Parameter(torch.rand(*size, dtype=dtype)-0.5, requires_grad=requires_grad)
     return ret
 
+
+def _memoize_forward(forward):
+    # memoize the output of the manifold on theta, e.g. get_state() after forward(), or the loss-only re-evaluation
+    # in numqi.optimize. The cached output is reused only when no gradient is required, so the autograd graph is never shared.
+    # numqi.optimize writes theta through .data and the flat buffer which bypass the version counter,
+    # so the version counter is only a fast reject and theta is compared by value.
+    # The grad-enabled forward cannot hit the cache but still populates it (one copy of theta, into the
+    # buffer of the previous entry), that's the entry hit by the no-grad get_state() after the optimization.
+    # A hit returns a clone, and the entry is dropped if the caller modified the returned output in-place
+    # (the detached output shares the version counter)
+    @functools.wraps(forward)
+    def hf0(self):
+        theta = self.theta
+        if torch._C._functorch.is_functorch_wrapped_tensor(theta):
+            # inside torch.func transforms (e.g. numqi.optimize.get_model_hessian), never cache the wrapped tensors
+            return forward(self)
+        # the public attributes changing the output, e.g. Trace1PSD.return_factor, SpecialOrthogonal.cayley_order
+        tmp0 = getattr(self, 'return_factor', None), getattr(self, 'cayley_order', None)
+        key = (theta._version, self.method, theta.device, theta.dtype, theta.shape) + tmp0
+        cache = self.__dict__.get('_numqi_forward_cache', None)
+        if (not (torch.is_grad_enabled() and theta.requires_grad)) and (cache is not None) \
+                and (cache[0]==key) and all(x._version==y for x,y in zip(cache[2],cache[3])) \
+                and torch.equal(cache[1], theta.detach()):
+            ret = tuple(x.clone() for x in cache[2])
+            return ret if cache[4] else ret[0]
+        ret = forward(self)
+        is_tuple = isinstance(ret, tuple)
+        tmp0 = tuple(x.detach() for x in (ret if is_tuple else (ret,)))
+        if (cache is not None) and (cache[1].shape==theta.shape) and (cache[1].dtype==theta.dtype) and (cache[1].device==theta.device):
+            tmp1 = cache[1].copy_(theta.detach())
+        else:
+            tmp1 = theta.detach().clone()
+        self.__dict__['_numqi_forward_cache'] = (key, tmp1, tmp0, tuple(x._version for x in tmp0), is_tuple)
+        return ret
+    return hf0
+
 class PositiveReal(torch.nn.Module):
     def __init__(self, batch_size:(int|None)=None, method:str='softplus',
                 requires_grad:bool=True, dtype:torch.dtype=torch.float64, device:torch.device=_CPU):
@@ -122,7 +161,8 @@ def to_open_interval(theta, lower:float, upper:float):
 
 class Trace1PSD(torch.nn.Module):
     def __init__(self, dim:int, rank:(int|None)=None, batch_size:(int|None)=None,
-                method:str='cholesky', requires_grad:bool=True, dtype:torch.dtype=torch.float64, device:torch.device=_CPU):
+                method:str='cholesky', requires_grad:bool=True, dtype:torch.dtype=torch.float64, device:torch.device=_CPU,
+                return_factor:bool=False):
         r'''positive semi-definite (PSD) matrix with trace 1 of rank `rank` using Cholesky decomposition
 
         Parameters:
@@ -132,14 +172,20 @@ class Trace1PSD(torch.nn.Module):
             method (str): method to map real vector to a PSD matrix.
                 'cholesky': Cholesky decomposition.
                 'ensemble': ensemble decomposition.
+                'riemann': `Y Y^dagger` with `Y` on the sphere (Frobenius norm 1) directly, optimized by Riemannian optimizer,
+                    see `numqi.optimize.minimize(method='riemann-lbfgs')`
             requires_grad (bool): whether to track the gradients of the parameters.
             dtype (torch.dtype): data type of the parameters
                 torch.float32 / torch.float64: real PSD matrix
                 torch.complex64 / torch.complex128: complex PSD matrix
             device (torch.device): device of the parameters.
+            return_factor (bool): if True, return the factored form `(matY,prob)` with $\rho=Y\mathrm{diag}(p)Y^\dagger$,
+                `matY.shape=(...,dim,rank)` and `prob.shape=(...,rank)`, instead of the dense `(...,dim,dim)` matrix.
+                The factored form is accepted by `numqi.utils.get_von_neumann_entropy`, `numqi.utils.get_purity`
+                and `numqi.utils.get_relative_entropy` (as `rho`), which then cost $O(dim\cdot rank^2)$ instead of $O(dim^3)$
         '''
         super().__init__()
-        assert method in {'cholesky','ensemble'}
+        assert method in {'cholesky','ensemble','riemann'}
         assert dim>=2
         assert dtype in {torch.float32,torch.float64,torch.complex64,torch.complex128}
         assert (batch_size is None) or (batch_size>0)
@@ -151,8 +197,10 @@ class Trace1PSD(torch.nn.Module):
         if method=='cholesky':
             N0 = (rank*(2*dim-rank+1))//2
             tmp1 = N0 if is_real else (2*N0-rank)
-        else: #ensemble
+        elif method=='ensemble':
             tmp1 = (rank+dim*rank) if is_real else (rank+2*dim*rank)
+        else: #riemann
+            tmp1 = dim*rank if is_real else 2*dim*rank
         tmp2 = (tmp1,) if (batch_size is None) else (batch_size, tmp1)
         self.theta = _hf_para(tmp0, requires_grad, *tmp2).to(device)
         self.dim = int(dim)
@@ -160,14 +208,73 @@ class Trace1PSD(torch.nn.Module):
         self.dtype = dtype
         self.method = method
         self.batch_size = batch_size
+        self.return_factor = bool(return_factor)
+        if method=='riemann':
+            _riemann_init_theta(self)
 
+    @_memoize_forward
     def forward(self):
         if self.method=='cholesky':
-            ret = to_trace1_psd_cholesky(self.theta, self.dim, self.rank)
-        else: #ensemble
-            ret = to_trace1_psd_ensemble(self.theta, self.dim, self.rank)
+            ret = to_trace1_psd_cholesky(self.theta, self.dim, self.rank, return_factor=self.return_factor)
+        elif self.method=='ensemble':
+            ret = to_trace1_psd_ensemble(self.theta, self.dim, self.rank, return_factor=self.return_factor)
+        else: #riemann
+            tmp0 = to_sphere_quotient(self.theta, is_real=True)
+            mat = _riemann_theta_to_matrix(tmp0, self.dim, self.rank, self.dtype)
+            if self.return_factor:
+                ret = mat, torch.ones(mat.shape[:-2]+(self.rank,), dtype=self.theta.dtype, device=mat.device)
+            else:
+                ret = mat @ mat.transpose(-1,-2).conj()
+        return ret
+
+    def get_riemann_geometry(self):
+        assert self.method=='riemann'
+        ret = SphereGeometry(self.theta.shape[-1])
         return ret
 
+    def set_riemann_method(self, retraction:str='qr'):
+        r'''switch to `method='riemann'` in-place, the current PSD matrix is kept (truncated to `rank`)'''
+        with torch.no_grad():
+            tmp0 = self.forward()
+            if self.return_factor:
+                tmp0 = (tmp0[0]*tmp0[1].unsqueeze(-2).to(tmp0[0].dtype)) @ tmp0[0].transpose(-1,-2).conj()
+            tmp0 = tmp0.reshape(-1, self.dim, self.dim)
+            EVL,EVC = torch.linalg.eigh(tmp0)
+            tmp1 = EVC[:,:,-self.rank:] * torch.sqrt(torch.clamp(EVL[:,-self.rank:], min=0)).reshape(-1,1,self.rank).to(EVC.dtype)
+            tmp1 = _riemann_matrix_to_theta(tmp1, self.dtype).reshape(*self.theta.shape[:-1], -1)
+        self.method = 'riemann'
+        _riemann_set_theta(self, tmp1)
+
+
+def _riemann_set_theta(module, theta):
+    module.theta = torch.nn.Parameter(theta.detach().clone(), requires_grad=module.theta.requires_grad)
+    _riemann_init_theta(module)
+
+
+def _riemann_init_theta(module):
+    # project the parameter onto the manifold
+    with torch.no_grad():
+        tmp0 = module.get_riemann_geometry().to_manifold(module.theta.detach().cpu().numpy().reshape(-1))
+        module.theta.data.copy_(torch.tensor(tmp0, dtype=module.theta.dtype).reshape(module.theta.shape))
+
+
+def _riemann_theta_to_matrix(theta, dim:int, rank:int, dtype:torch.dtype):
+    if dtype in {torch.float32,torch.float64}:
+        ret = theta.reshape(*theta.shape[:-1], dim, rank)
+    else:
+        tmp0 = theta.reshape(*theta.shape[:-1], 2, dim, rank)
+        ret = torch.complex(tmp0[...,0,:,:], tmp0[...,1,:,:])
+    return ret
+
+
+def _riemann_matrix_to_theta(mat, dtype:torch.dtype):
+    if dtype not in {torch.float32,torch.float64}:
+        mat = torch.stack([mat.real, mat.imag], dim=-3)
+        ret = mat.reshape(*mat.shape[:-3], -1)
+    else:
+        ret = mat.reshape(*mat.shape[:-2], -1)
+    return ret
+
 
 def _np_softplus(x):
     tmp0 = np.sign(x)
@@ -175,7 +282,7 @@ def _np_softplus(x):
     return ret
 
 
-def to_trace1_psd_ensemble(theta, dim:int, rank:(int|None)=None):
+def to_trace1_psd_ensemble(theta, dim:int, rank:(int|None)=None, return_factor:bool=False):
     r'''map real vector to a positive semi-definite (PSD) matrix with trace 1 using ensemble method
 
     Parameters:
@@ -183,9 +290,11 @@ def to_trace1_psd_ensemble(theta, dim:int, rank:(int|None)=None):
                 and the rest dimensions will be batch dimensions
         dim (int): dimension of the matrix.
         rank (int): rank of the matrix.
+        return_factor (bool): if True, return the factored form `(matY,prob)` with $\rho=Y\mathrm{diag}(p)Y^\dagger$
 
     Returns:
-        ret (np.ndarray,torch.Tensor): array of shape `theta.shape[:-1]+(dim,dim)`
+        ret (np.ndarray,torch.Tensor): array of shape `theta.shape[:-1]+(dim,dim)`, or the tuple of
+            `matY.shape=theta.shape[:-1]+(dim,rank)` (unit columns) and `prob.shape=theta.shape[:-1]+(rank,)`
     '''
     if rank is None:
         rank = dim
@@ -198,6 +307,9 @@ def to_trace1_psd_ensemble(theta, dim:int, rank:(int|None)=None):
     theta = theta.reshape(-1, shape[-1])
     theta_p = to_discrete_probability_softmax(theta[:,:rank])
     theta_psi = to_sphere_quotient(theta[:,rank:].reshape(theta.shape[0]*rank, -1), is_real).reshape(-1, rank, dim)
+    if return_factor:
+        ret = theta_psi.transpose(*((1,2) if isinstance(theta, torch.Tensor) else (0,2,1))).reshape(*shape[:-1], dim, rank)
+        return ret, theta_p.reshape(*shape[:-1], rank)
     if isinstance(theta, torch.Tensor):
         ret = torch.einsum(theta_p, [0,1], theta_psi, [0,1,2], theta_psi.conj(), [0,1,3], [0,2,3])
     else:
@@ -207,7 +319,7 @@ def to_trace1_psd_ensemble(theta, dim:int, rank:(int|None)=None):
 
 # TODO exponential map
 
-def to_trace1_psd_cholesky(theta, dim:int, rank:(int|None)=None):
+def to_trace1_psd_cholesky(theta, dim:int, rank:(int|None)=None, return_factor:bool=False):
     r'''map real vector to a positive semi-definite (PSD) matrix with trace 1 of rank `rank` using Cholesky decomposition
 
     Parameters:
@@ -215,9 +327,11 @@ def to_trace1_psd_cholesky(theta, dim:int, rank:(int|None)=None):
                 and the rest dimensions will be batch dimensions.
         dim (int): dimension of the matrix.
         rank (int): rank of the matrix.
+        return_factor (bool): if True, return the factored form `(matY,prob)` with $\rho=Y\mathrm{diag}(p)Y^\dagger$
 
     Returns:
-        ret (np.ndarray,torch.Tensor): array of shape `theta.shape[:-1]+(dim,dim)`
+        ret (np.ndarray,torch.Tensor): array of shape `theta.shape[:-1]+(dim,dim)`, or the tuple of the lower-triangular
+            `matY.shape=theta.shape[:-1]+(dim,rank)` and `prob.shape=theta.shape[:-1]+(rank,)` (all ones)
     '''
     if rank is None:
         rank = dim
@@ -245,6 +359,9 @@ def to_trace1_psd_cholesky(theta, dim:int, rank:(int|None)=None):
             tmp3[:,indexL[0],indexL[1]] = tmp0 / norm_factor
         else:
             tmp3[:,indexL[0],indexL[1]] = torch.complex(tmp0[:,:(N0-rank)], tmp0[:,(N0-rank):]) / norm_factor
+        if return_factor:
+            tmp4 = torch.ones(*shape[:-1], rank, dtype=theta.dtype, device=theta.device)
+            return tmp3.reshape(*shape[:-1], dim, rank), tmp4
         ret = tmp3 @ tmp3.transpose(1,2).conj()
     else:
         assert (theta.dtype.type==np.float32) or (theta.dtype.type==np.float64)
@@ -260,6 +377,8 @@ def to_trace1_psd_cholesky(theta, dim:int, rank:(int|None)=None):
             tmp3[:,indexL[0],indexL[1]] = tmp0 / norm_factor
         else:
             tmp3[:,indexL[0],indexL[1]] = (tmp0[:,:(N0-rank)] + 1j* tmp0[:,(N0-rank):]) / norm_factor
+        if return_factor:
+            return tmp3.reshape(*shape[:-1], dim, rank), np.ones(shape[:-1]+(rank,), dtype=theta.dtype)
         ret = tmp3 @ tmp3.transpose(0,2,1).conj()
     ret = ret.reshape(*shape[:-1], dim, dim)
     return ret
@@ -454,6 +573,8 @@ class Sphere(torch.nn.Module):
             method (str): method to map real vector to a point on the sphere.
                 'quotient': quotient map.
                 'coordinate': cosine and sine functions.
+                'riemann': quotient map with the parameter kept on the sphere by Riemannian optimizer,
+                    see `numqi.optimize.minimize(method='riemann-lbfgs')`
             requires_grad (bool): whether to track the gradients of the parameters.
             dtype (torch.dtype): data type of the parameters, either torch.float32 or torch.float64
             device (torch.device): device of the parameters.
@@ -462,30 +583,47 @@ class Sphere(torch.nn.Module):
         assert dim>=2
         assert dtype in {torch.float32,torch.float64,torch.complex64,torch.complex128}
         assert (batch_size is None) or (batch_size>0)
-        assert method in {'quotient','coordinate'}
+        assert method in {'quotient','coordinate','riemann'}
         assert isinstance(device, torch.device)
         if dtype in {torch.float32,torch.float64}:
             self.is_real = True
             tmp0 = torch.float32 if (dtype==torch.float32) else torch.float64
-            tmp1 = dim if (method=='quotient') else (dim-1)
+            tmp1 = (dim-1) if (method=='coordinate') else dim
         else:
             self.is_real = False
             tmp0 = torch.float32 if (dtype==torch.complex64) else torch.float64
-            tmp1 = 2*dim if (method=='quotient') else (2*dim-1)
+            tmp1 = (2*dim-1) if (method=='coordinate') else 2*dim
         tmp2 = (tmp1,) if (batch_size is None) else (batch_size, tmp1)
         self.theta = _hf_para(tmp0, requires_grad, *tmp2).to(device)
         self.dim = int(dim)
         self.batch_size = batch_size
         self.dtype = dtype
         self.method = method
+        if method=='riemann':
+            _riemann_init_theta(self)
 
     def forward(self):
-        if self.method=='quotient':
-            ret = to_sphere_quotient(self.theta, self.is_real)
-        else:
+        if self.method=='coordinate':
             ret = to_sphere_coordinate(self.theta, self.is_real)
+        else: #quotient riemann
+            # for riemann, the gradient of quotient map at the unit sphere is the projected gradient
+            ret = to_sphere_quotient(self.theta, self.is_real)
+        return ret
+
+    def get_riemann_geometry(self):
+        assert self.method=='riemann'
+        ret = SphereGeometry(self.theta.shape[-1])
         return ret
 
+    def set_riemann_method(self, retraction:str='qr'):
+        r'''switch to `method='riemann'` in-place, the current point on the sphere is kept'''
+        with torch.no_grad():
+            tmp0 = self.forward()
+            if not self.is_real:
+                tmp0 = torch.concat([tmp0.real, tmp0.imag], dim=-1)
+        self.method = 'riemann'
+        _riemann_set_theta(self, tmp0)
+
 
 def to_sphere_quotient(theta, is_real:bool=True):
     r'''map real vector to a point on the sphere via quotient
@@ -637,6 +775,9 @@ class SpecialOrthogonal(torch.nn.Module):
             method (str): method to map real vector to an orthogonal matrix.
                 'exp': exponential map.
                 'cayley': cayley transformation
+                'riemann': the matrix itself is the parameter, optimized by Riemannian optimizer,
+                    see `numqi.optimize.minimize(method='riemann-lbfgs')`. For complex case, the global phase
+                    is only kept to second order of the step size
             requires_grad (bool): whether to track the gradients of the parameters.
             dtype (torch.dtype): data type of the parameters
                 torch.float32 / torch.float64: SO(d) manifold,
@@ -644,7 +785,7 @@ class SpecialOrthogonal(torch.nn.Module):
             device (torch.device): device of the parameters.
         '''
         super().__init__()
-        assert method in {'exp', 'cayley'}
+        assert method in {'exp', 'cayley', 'riemann'}
         assert dim>=2
         assert dtype in {torch.float32,torch.float64,torch.complex64,torch.complex128}
         assert cayley_order>=1
@@ -652,7 +793,10 @@ class SpecialOrthogonal(torch.nn.Module):
         is_real = dtype in {torch.float32,torch.float64}
         assert (batch_size is None) or (batch_size>0)
         tmp0 = torch.float32 if (dtype in {torch.float32,torch.complex64}) else torch.float64
-        tmp1 = (dim*(dim-1)//2) if is_real else dim*dim-1
+        if method=='riemann':
+            tmp1 = dim*dim if is_real else 2*dim*dim
+        else:
+            tmp1 = (dim*(dim-1)//2) if is_real else dim*dim-1
         tmp2 = (tmp1,) if (batch_size is None) else (batch_size, tmp1)
         self.theta = _hf_para(tmp0, requires_grad, *tmp2).to(device)
         self.dim = int(dim)
@@ -660,16 +804,42 @@ class SpecialOrthogonal(torch.nn.Module):
         self.cayley_order = cayley_order
         self.dtype = dtype
         self.batch_size = batch_size
+        self.retraction = 'qr'
+        if method=='riemann':
+            _riemann_init_theta(self)
 
+    @_memoize_forward
     def forward(self):
         if self.method=='exp':
             ret = to_special_orthogonal_exp(self.theta, self.dim)
-        else:
+        elif self.method=='cayley':
             ret = to_special_orthogonal_cayley(self.theta, self.dim, self.cayley_order)
+        else: #riemann
+            ret = _riemann_theta_to_matrix(self.theta, self.dim, self.dim, self.dtype)
+        return ret
+
+    def get_riemann_geometry(self):
+        assert self.method=='riemann'
+        is_real = self.dtype in {torch.float32,torch.float64}
+        ret = StiefelGeometry(self.dim, self.dim, is_real, retraction=self.retraction, is_unitary=True)
         return ret
 
+    def set_riemann_method(self, retraction:str='qr'):
+        r'''switch to `method='riemann'` in-place, the current matrix is kept
+
+        Parameters:
+            retraction (str): 'qr' or 'cayley'
+        '''
+        with torch.no_grad():
+            tmp0 = _riemann_matrix_to_theta(self.forward(), self.dtype)
+        self.method = 'riemann'
+        self.retraction = retraction
+        _riemann_set_theta(self, tmp0)
+
 def to_special_orthogonal_exp(theta, dim:int):
-    r'''map real vector to a special orthogonal (unitary) manifold via exponential map
+    r'''map real vector to a special orthogonal (unitary) manifold via exponential map. The generator is skew-Hermitian,
+    so the exponential is evaluated by the eigen-decomposition of the Hermitian matrix $H$, $e^{iH}=Ve^{i\Lambda}V^\dagger$
+    (batched, and the eigen-decomposition is reused in the backward, see `numqi._torch_op.HermitianMatrixExp`)
 
     Parameters:
         theta (np.ndarray,torch.Tensor): if `ndim>1`, then the last dimension will be expanded to the matrix
@@ -700,8 +870,9 @@ def to_special_orthogonal_exp(theta, dim:int):
         else:
             tmp0 = torch.zeros(N1, 1, dtype=theta.dtype, device=device)
             mat = 1j*numqi.gellmann.gellmann_basis_to_matrix(torch.concat([theta, tmp0], axis=1))
-        # batch-version matrix-exp is memory-consuming in pytorch
-        ret = torch.stack([torch.linalg.matrix_exp(mat[x]) for x in range(len(mat))])
+        ret = numqi._torch_op.HermitianMatrixExp.apply(-1j*mat)[0]
+        if is_real:
+            ret = ret.real
     else: #numpy
         if is_real:
             tmp0 = np.zeros((N1, N0), dtype=theta.dtype)
@@ -710,8 +881,10 @@ def to_special_orthogonal_exp(theta, dim:int):
         else:
             tmp0 = np.zeros((N1, 1), dtype=theta.dtype)
             mat = 1j*numqi.gellmann.gellmann_basis_to_matrix(np.concatenate([theta, tmp0], axis=1))
-        ret = np.stack([scipy.linalg.expm(x) for x in mat])
-        # ret = scipy.linalg.expm(mat) #TODO scipy-v1.9 https://github.com/scipy/scipy/issues/12838
+        EVL,EVC = np.linalg.eigh(-1j*mat)
+        ret = (EVC*np.exp(1j*EVL)[:,np.newaxis]) @ EVC.transpose(0,2,1).conj()
+        if is_real:
+            ret = ret.real
     ret = ret.reshape(*shape[:-1], dim, dim)
     return ret
 
@@ -0,0 +1,201 @@
+import numpy as np
+import torch
+
+# embedded geometry (real inner product) of the manifolds, acting on the real parameter vector `theta`
+# of the manifold module with `method='riemann'`. used by numqi.optimize.minimize(method='riemann-lbfgs')
+
+def _qr_positive(mat):
+    # QR decomposition with positive diagonal of R, so that the Q factor is unique and continuous
+    Q,R = np.linalg.qr(mat)
+    tmp0 = np.diagonal(R, axis1=-2, axis2=-1)
+    tmp1 = np.abs(tmp0)
+    tmp1[tmp1==0] = 1
+    ret = Q * (tmp0/tmp1)[...,np.newaxis,:]
+    return ret
+
+
+class SphereGeometry:
+    def __init__(self, dim:int):
+        r'''unit sphere in $\mathbb{R}^{dim}$ (complex sphere is viewed as real sphere of dimension `2*dim`),
+        the leading dimensions of the parameter are batch dimensions
+
+        Parameters:
+            dim (int): size of the last dimension of the (real) parameter
+        '''
+        self.dim = int(dim)
+
+    def to_manifold(self, x):
+        x = x.reshape(-1, self.dim)
+        ret = (x / np.linalg.norm(x, axis=1, keepdims=True)).reshape(-1)
+        return ret
+
+    def proj(self, x, v):
+        x = x.reshape(-1, self.dim)
+        v = v.reshape(-1, self.dim)
+        ret = (v - np.sum(x*v, axis=1, keepdims=True)*x).reshape(-1)
+        return ret
+
+    def retract(self, x, v):
+        ret = self.to_manifold(x + v)
+        return ret
+
+    def transport(self, x, y, v):
+        ret = self.proj(y, v)
+        return ret
+
+
+class StiefelGeometry:
+    def __init__(self, dim:int, rank:int, is_real:bool, retraction:str='qr', is_unitary:bool=False):
+        r'''Stiefel manifold $\{X\in\mathbb{K}^{dim\times rank}:X^\dagger X=I\}$ with the embedded metric $\mathrm{Re}\,\mathrm{Tr}(A^\dagger B)$.
+        The parameter layout is `(batch,dim,rank)` for real case and `(batch,2,dim,rank)` (real and imaginary part) for complex case
+
+        Parameters:
+            dim (int): dimension of the matrix.
+            rank (int): rank of the matrix.
+            is_real (bool): whether the matrix is real
+            retraction (str): 'qr' (Q factor of X+V) or 'cayley' (Cayley transform of the skew-Hermitian generator)
+            is_unitary (bool): if True (`dim==rank`), the tangent vector of complex matrix is also projected to
+                traceless generator, keep the determinant to second order (special unitary group)
+        '''
+        assert retraction in {'qr','cayley'}
+        assert rank<=dim
+        self.dim = int(dim)
+        self.rank = int(rank)
+        self.is_real = bool(is_real)
+        self.retraction = retraction
+        self.is_unitary = bool(is_unitary) and (dim==rank)
+
+    def _to_matrix(self, x):
+        if self.is_real:
+            ret = x.reshape(-1, self.dim, self.rank)
+        else:
+            tmp0 = x.reshape(-1, 2, self.dim, self.rank)
+            ret = tmp0[:,0] + 1j*tmp0[:,1]
+        return ret
+
+    def _from_matrix(self, mat):
+        if self.is_real:
+            ret = mat.reshape(-1)
+        else:
+            ret = np.stack([mat.real, mat.imag], axis=1).reshape(-1)
+        return ret
+
+    def to_manifold(self, x):
+        ret = self._from_matrix(_qr_positive(self._to_matrix(x)))
+        return ret
+
+    def _proj(self, X, V):
+        tmp0 = X.transpose(0,2,1).conj() @ V
+        tmp0 = (tmp0 + tmp0.transpose(0,2,1).conj())/2
+        ret = V - X @ tmp0
+        if self.is_unitary and (not self.is_real):
+            # V = X Omega, remove the trace of Omega
+            tmp1 = np.trace(X.transpose(0,2,1).conj() @ ret, axis1=1, axis2=2) / self.dim
+            ret = ret - X * tmp1.reshape(-1,1,1)
+        return ret
+
+    def proj(self, x, v):
+        ret = self._from_matrix(self._proj(self._to_matrix(x), self._to_matrix(v)))
+        return ret
+
+    def retract(self, x, v):
+        X = self._to_matrix(x)
+        V = self._to_matrix(v)
+        if self.retraction=='qr':
+            ret = _qr_positive(X + V)
+        else: #cayley, Wen-Yin arXiv:1208.4298, W X = V for tangent V
+            XH = X.transpose(0,2,1).conj()
+            PV = V - X @ (XH @ V)/2
+            W = PV @ XH
+            W = W - W.transpose(0,2,1).conj()
+            eye = np.eye(self.dim)
+            ret = np.linalg.solve(eye - W/2, X + (W @ X)/2)
+        ret = self._from_matrix(ret)
+        return ret
+
+    def transport(self, x, y, v):
+        ret = self.proj(y, v)
+        return ret
+
+
+class ProductGeometry:
+    def __init__(self, num_parameter:int, geometry_list:list):
+        r'''product of the manifold geometries over the flat parameter vector, the part not covered by
+        `geometry_list` is the Euclidean space
+
+        Parameters:
+            num_parameter (int): total number of parameters
+            geometry_list (list[tuple[int,int,object]]): list of `(start,end,geometry)`
+        '''
+        self.num_parameter = int(num_parameter)
+        self.geometry_list = sorted(geometry_list, key=lambda x: x[0])
+
+    def _apply(self, hf0, x, *args):
+        ret = x.copy() if (len(args)==0) else args[-1].copy()
+        for ind0,ind1,geometry in self.geometry_list:
+            ret[ind0:ind1] = hf0(geometry)(x[ind0:ind1], *[y[ind0:ind1] for y in args])
+        return ret
+
+    def to_manifold(self, x):
+        return self._apply(lambda g: g.to_manifold, x)
+
+    def proj(self, x, v):
+        return self._apply(lambda g: g.proj, x, v)
+
+    def retract(self, x, v):
+        ret = x + v
+        for ind0,ind1,geometry in self.geometry_list:
+            ret[ind0:ind1] = geometry.retract(x[ind0:ind1], v[ind0:ind1])
+        return ret
+
+    def transport(self, x, y, v):
+        ret = v.copy()
+        for ind0,ind1,geometry in self.geometry_list:
+            ret[ind0:ind1] = geometry.transport(x[ind0:ind1], y[ind0:ind1], v[ind0:ind1])
+        return ret
+
+
+def get_model_riemann_geometry(model:torch.nn.Module):
+    r'''collect the geometry of all the manifold submodules with `method='riemann'`,
+    the offset follows the sorted parameter order used in `numqi.optimize`
+
+    Parameters:
+        model (torch.nn.Module): the model
+
+    Returns:
+        ret (ProductGeometry,None): None if there is no riemann manifold in the model
+    '''
+    tmp0 = sorted([(k,v) for k,v in model.named_parameters() if v.requires_grad], key=lambda x:x[0])
+    name_to_offset = dict()
+    offset = 0
+    for k,v in tmp0:
+        name_to_offset[k] = (offset, offset+v.numel())
+        offset += v.numel()
+    geometry_list = []
+    for name,module in model.named_modules():
+        if (getattr(module, 'method', None)=='riemann') and hasattr(module, 'get_riemann_geometry'):
+            key = (name + '.theta') if name else 'theta'
+            if key in name_to_offset: #requires_grad=False is skipped
+                geometry_list.append((*name_to_offset[key], module.get_riemann_geometry()))
+    ret = ProductGeometry(offset, geometry_list) if len(geometry_list) else None
+    return ret
+
+
+def set_riemann_method(model:torch.nn.Module, retraction:str='qr'):
+    r'''switch all the `Sphere`, `Stiefel`, `SpecialOrthogonal` and `Trace1PSD` submodules of the model
+    to `method='riemann'` in-place, the current point on the manifold is kept. After that, the model
+    should be optimized with `numqi.optimize.minimize(model, method='riemann-lbfgs')` (or 'riemann-cg')
+
+    Parameters:
+        model (torch.nn.Module): the model
+        retraction (str): 'qr' or 'cayley', retraction for `Stiefel` and `SpecialOrthogonal`
+
+    Returns:
+        model (torch.nn.Module): the same model
+    '''
+    from ._internal import Sphere, SpecialOrthogonal, Trace1PSD
+    from ._stiefel import Stiefel
+    for module in list(model.modules()):
+        if isinstance(module, (Sphere, SpecialOrthogonal, Trace1PSD, Stiefel)) and (module.method!='riemann'):
+            module.set_riemann_method(retraction)
+    return model
@@ -1,8 +1,10 @@
 import numpy as np
 import torch
 
-from ._internal import _CPU, _hf_para
+from ._internal import _CPU, _hf_para, _memoize_forward
 from ._internal import to_special_orthogonal_exp, to_special_orthogonal_cayley
+from ._internal import _riemann_init_theta, _riemann_set_theta, _riemann_theta_to_matrix, _riemann_matrix_to_theta
+from ._riemann import StiefelGeometry
 import numqi._torch_op
 
 
@@ -20,8 +22,11 @@ class Stiefel(torch.nn.Module):
                 'euler': Euler-Hurwitz angles.
                 'qr': QR decomposition.
                 'polar': square root of a matrix.
+                'cayley': Cayley transform of the Stiefel generator, cheaper than 'polar' (no eigendecomposition)
                 'so-exp': exponential map of special orthogonal group.
                 'so-cayley': Cayley transform of special orthogonal group.
+                'riemann': the matrix itself is the parameter, optimized by Riemannian optimizer,
+                    see `numqi.optimize.minimize(method='riemann-lbfgs')`
             euler_with_phase(bool): whether to append phase for `method='euler'`.
             requires_grad (bool): whether to track the gradients of the parameters.
             dtype (torch.dtype): data type of the parameters
@@ -36,11 +41,13 @@ class Stiefel(torch.nn.Module):
         assert (batch_size is None) or (batch_size>0)
         assert isinstance(device, torch.device)
         # choleskyL is really bad
-        assert method in {'choleskyL','qr','so-exp','so-cayley','polar','euler'}
-        if method in {'qr','polar'}:
+        assert method in {'choleskyL','qr','so-exp','so-cayley','polar','euler','riemann','cayley'}
+        if method in {'qr','polar','riemann'}:
             tmp0 = dim*rank if (dtype in {torch.float32,torch.float64}) else 2*dim*rank
         elif method=='choleskyL':
             tmp0 = (dim*rank-((rank*(rank+1))//2)) * (1 if (dtype in {torch.float32,torch.float64}) else 2)
+        elif method=='cayley':
+            tmp0 = (dim*rank-((rank*(rank+1))//2)) if (dtype in {torch.float32,torch.float64}) else (2*dim*rank-rank*rank)
         elif method in {'so-exp','so-cayley'}: #special orthogonal (SO)
             tmp0 = ((dim*(dim-1))//2) if (dtype in {torch.float32,torch.float64}) else (dim*dim-1)
         else: #euler
@@ -57,10 +64,16 @@ class Stiefel(torch.nn.Module):
         self.dtype = dtype
         self.method = method
         self.batch_size = batch_size
+        self.retraction = 'qr'
+        if method=='riemann':
+            _riemann_init_theta(self)
 
+    @_memoize_forward
     def forward(self):
         if self.method=='choleskyL':
             ret = to_stiefel_choleskyL(self.theta, self.dim, self.rank)
+        elif self.method=='cayley':
+            ret = to_stiefel_cayley(self.theta, self.dim, self.rank)
         elif self.method=='qr': #qr
             ret = to_stiefel_qr(self.theta, self.dim, self.rank)
         elif self.method=='polar':
@@ -69,10 +82,30 @@ class Stiefel(torch.nn.Module):
             ret = to_special_orthogonal_exp(self.theta, self.dim)[...,:self.rank]
         elif self.method=='so-cayley':
             ret = to_special_orthogonal_cayley(self.theta, self.dim)[...,:self.rank]
+        elif self.method=='riemann':
+            ret = _riemann_theta_to_matrix(self.theta, self.dim, self.rank, self.dtype)
         else: #euler
             ret = to_stiefel_euler(self.theta, self.dim, self.rank, self.euler_with_phase)
         return ret
 
+    def get_riemann_geometry(self):
+        assert self.method=='riemann'
+        is_real = self.dtype in {torch.float32,torch.float64}
+        ret = StiefelGeometry(self.dim, self.rank, is_real, retraction=self.retraction)
+        return ret
+
+    def set_riemann_method(self, retraction:str='qr'):
+        r'''switch to `method='riemann'` in-place, the current matrix is kept
+
+        Parameters:
+            retraction (str): 'qr' or 'cayley'
+        '''
+        with torch.no_grad():
+            tmp0 = _riemann_matrix_to_theta(self.forward(), self.dtype)
+        self.method = 'riemann'
+        self.retraction = retraction
+        _riemann_set_theta(self, tmp0)
+
 def to_stiefel_polar(theta, dim:int, rank:int):
     r'''map real vector to a Stiefel manifold via polar decomposition
 
@@ -229,6 +262,80 @@ def to_stiefel_qr(theta, dim:int, rank:int):
     return ret
 
 
+def to_stiefel_cayley(theta, dim:int, rank:int):
+    r'''map real vector to a Stiefel manifold via Cayley transform of the skew-Hermitian generator
+
+    $$ X=\left(I-W/2\right)^{-1}\left(I+W/2\right)E,\quad W=\begin{pmatrix}S&-K^\dagger\\K&0\end{pmatrix},
+    \quad E=\begin{pmatrix}I_{rank}\\0\end{pmatrix}$$
+
+    with $S$ skew-Hermitian. The generator is of rank $2\cdot rank$, and the Woodbury identity reduces the inverse to
+    one `(rank,rank)` linear solve
+
+    $$ Z=\left(4I-2S+K^\dagger K\right)^{-1}\left(4I+2S-K^\dagger K\right),\quad X=\begin{pmatrix}Z\\K(Z+I)/2\end{pmatrix}$$
+
+    so the forward and backward cost $O(dim\cdot rank^2)$ without eigendecomposition (compared with `to_stiefel_polar`)
+
+    Parameters:
+        theta (np.ndarray,torch.Tensor): the last dimension will be expanded to the matrix
+                and the rest dimensions will be batch dimensions. For real case, the last dimension
+                should be `dim*rank-(rank*(rank+1))//2`, and for complex case, the last dimension should be `2*dim*rank-rank*rank`.
+        dim (int): dimension of the matrix.
+        rank (int): rank of the matrix.
+
+    Returns:
+        ret (np.ndarray,torch.Tensor): array of shape `theta.shape[:-1]+(dim,rank)`
+    '''
+    assert rank<=dim
+    N0 = (rank*(rank-1))//2
+    shape = theta.shape
+    if shape[-1]==dim*rank-N0-rank:
+        is_real = True
+    else:
+        assert shape[-1]==2*dim*rank-rank*rank
+        is_real = False
+    theta = theta.reshape(-1, shape[-1])
+    N1 = theta.shape[0]
+    is_torch = isinstance(theta, torch.Tensor)
+    if is_torch:
+        indexL = torch.tril_indices(rank, rank, -1, device=theta.device)
+        matS = torch.zeros(N1, rank, rank, dtype=theta.dtype, device=theta.device)
+        matS[:,indexL[0],indexL[1]] = theta[:,:N0]
+        if is_real:
+            matK = theta[:,N0:].reshape(N1, dim-rank, rank)
+        else:
+            tmp0 = torch.zeros(N1, rank, rank, dtype=theta.dtype, device=theta.device)
+            tmp0[:,indexL[0],indexL[1]] = theta[:,N0:(2*N0)]
+            tmp0 = tmp0 + torch.diag_embed(theta[:,(2*N0):(2*N0+rank)])/2
+            matS = torch.complex(matS, tmp0)
+            tmp0 = theta[:,(2*N0+rank):].reshape(N1, 2, dim-rank, rank)
+            matK = torch.complex(tmp0[:,0], tmp0[:,1])
+        matS = matS - matS.transpose(1,2).conj()
+        eye = torch.eye(rank, dtype=matS.dtype, device=theta.device)
+        tmp0 = matK.transpose(1,2).conj() @ matK
+        tmp1 = torch.linalg.solve(4*eye - 2*matS + tmp0, 4*eye + 2*matS - tmp0)
+        ret = torch.concat([tmp1, matK @ (tmp1 + eye)/2], dim=1)
+    else:
+        indexL = np.tril_indices(rank, -1)
+        matS = np.zeros((N1, rank, rank), dtype=theta.dtype)
+        matS[:,indexL[0],indexL[1]] = theta[:,:N0]
+        if is_real:
+            matK = theta[:,N0:].reshape(N1, dim-rank, rank)
+        else:
+            tmp0 = np.zeros((N1, rank, rank), dtype=theta.dtype)
+            tmp0[:,indexL[0],indexL[1]] = theta[:,N0:(2*N0)]
+            tmp0[:,np.arange(rank),np.arange(rank)] = theta[:,(2*N0):(2*N0+rank)]/2
+            matS = matS + 1j*tmp0
+            tmp0 = theta[:,(2*N0+rank):].reshape(N1, 2, dim-rank, rank)
+            matK = tmp0[:,0] + 1j*tmp0[:,1]
+        matS = matS - matS.transpose(0,2,1).conj()
+        eye = np.eye(rank, dtype=matS.dtype)
+        tmp0 = matK.transpose(0,2,1).conj() @ matK
+        tmp1 = np.linalg.solve(4*eye - 2*matS + tmp0, 4*eye + 2*matS - tmp0)
+        ret = np.concatenate([tmp1, matK @ (tmp1 + eye)/2], axis=1)
+    ret = ret.reshape(*shape[:-1], dim, rank)
+    return ret
+
+
 def _to_stiefel_euler_real(theta, dim, rank):
     batch = theta.shape[0]
     tmp0 = np.cumsum(np.arange(dim-rank, dim)).tolist()
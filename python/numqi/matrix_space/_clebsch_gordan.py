@@ -3,6 +3,8 @@ import functools
 import sympy
 import sympy.physics.quantum
 
+import numqi._disk_cache
+
 
 def get_angular_momentum_op(j_double:int):
     # https://en.wikipedia.org/wiki/Clebsch%E2%80%93Gordan_coefficients
@@ -29,6 +31,7 @@ def get_clebsch_gordan_coeffient(j1_double:int, j2_double:int):
 
 
 @functools.lru_cache
+@numqi._disk_cache.disk_cache('clebsch_gordan')
 def _get_clebsch_gordan_coeffient_cache(j1_double:int, j2_double:int):
     # https://en.wikipedia.org/wiki/Table_of_Clebsch%E2%80%93Gordan_coefficients
     jmax_double = j1_double + j2_double
@@ -45,6 +48,7 @@ def _get_clebsch_gordan_coeffient_cache(j1_double:int, j2_double:int):
                 n2 = n + int_shift - n1
                 tmp0 = sympy.physics.quantum.cg.CG(j1_sym, -j1_sym+n1, j2_sym, -j2_sym+n2, j_sym, -j_sym+n)
                 coeff[j_double-n, j1_double-n1, j2_double-n2] = float(tmp0.doit().evalf())
+        coeff.flags.writeable = False
         ret.append((j_double, coeff))
     return ret
 
@@ -2,7 +2,8 @@ import numpy as np
 import scipy.sparse.linalg
 import scipy.optimize
 import cvxpy
-from tqdm.auto import tqdm
+
+import numqi.utils
 
 from ._misc import get_matrix_orthogonal_basis
 
@@ -179,7 +180,37 @@ def detect_real_matrix_subspace_rank_one(matrix_subspace):
     return tag_rank_one, upper_bound
 
 
-def get_joint_algebraic_numerical_range(op_list, direction, return_info=False, use_tqdm=True):
+def _cvx_numerical_range_solver(prob, cvx_vec, cvx_op, return_info):
+    # solver of one direction, `prob` maximizes beta with the last constraint `beta*cvx_vec==cvx_op`,
+    # shared by the numerical range functions, see numqi.utils.run_parallel_sweep
+    def hf0(vec_i):
+        cvx_vec.value = vec_i
+        prob.solve(warm_start=False)
+        if return_info:
+            ret = prob.value, cvx_op.value.copy(), prob.constraints[-1].dual_value.copy()
+        else:
+            ret = prob.value, None, None
+        return ret
+    return hf0
+
+
+def _joint_algebraic_numerical_range_setup(op_list, return_info):
+    num_op,dim,_ = op_list.shape
+    cvx_rho = cvxpy.Variable((dim,dim), hermitian=True)
+    cvx_vec = cvxpy.Parameter(num_op)
+    cvx_beta = cvxpy.Variable()
+    cvx_op = cvxpy.real(op_list.transpose(0,2,1).reshape(-1, dim*dim, order='C') @ cvxpy.reshape(cvx_rho, dim*dim, order='F'))
+    constraints = [
+        cvx_rho>>0,
+        cvxpy.real(cvxpy.trace(cvx_rho))==1,
+        cvx_beta*cvx_vec==cvx_op,
+    ]
+    prob = cvxpy.Problem(cvxpy.Maximize(cvx_beta), constraints)
+    ret = _cvx_numerical_range_solver(prob, cvx_vec, cvx_op, return_info)
+    return ret
+
+
+def get_joint_algebraic_numerical_range(op_list, direction, return_info=False, use_tqdm=True, num_worker=1):
     r'''get the joint algebraic numerical range (JANR) of a list of operators along a direction
 
     $$ L(A_{1},A_{2},\cdots,A_{r})=\left\{ a\in\mathbb{C}^{r}:\rho\in\mathbb{C}^{d\times d},\rho\succeq0,\mathrm{Tr}[\rho]=1,a_{i}=\mathrm{Tr}[A_{i}\rho]\right\} $$
@@ -193,6 +224,7 @@ def get_joint_algebraic_numerical_range(op_list, direction, return_info=False, u
         direction (np.ndarrray): the boundary along the direction will be calculated, if 2d, then each row is a direction
         return_info (bool): if `True`, then return the boundary and the boundary's normal vector
         use_tqdm (bool): if `True`, then use tqdm to show the progress
+        num_worker (int): number of processes, the directions are sharded over the workers
 
     Returns:
         beta (np.ndarray): the distance from the origin to the boundary along the direction.
@@ -210,28 +242,9 @@ def get_joint_algebraic_numerical_range(op_list, direction, return_info=False, u
     direction = direction.reshape(-1,num_op)
     if direction.shape[0]==1:
         use_tqdm = False
-    cvx_rho = cvxpy.Variable((dim,dim), hermitian=True)
-    cvx_vec = cvxpy.Parameter(num_op)
-    cvx_beta = cvxpy.Variable()
-    cvx_op = cvxpy.real(op_list.transpose(0,2,1).reshape(-1, dim*dim, order='C') @ cvxpy.reshape(cvx_rho, dim*dim, order='F'))
-    constraints = [
-        cvx_rho>>0,
-        cvxpy.real(cvxpy.trace(cvx_rho))==1,
-        cvx_beta*cvx_vec==cvx_op,
-    ]
-    cvx_obj = cvxpy.Maximize(cvx_beta)
-    prob = cvxpy.Problem(cvx_obj, constraints)
-    obj_list = []
-    boundary_list = []
-    norm_vec_list = []
-    ret = []
-    for vec_i in (tqdm(direction) if use_tqdm else direction):
-        cvx_vec.value = vec_i
-        prob.solve()
-        obj_list.append(cvx_obj.value)
-        if return_info:
-            boundary_list.append(cvx_op.value.copy())
-            norm_vec_list.append(constraints[-1].dual_value.copy())
+    tmp0 = numqi.utils.run_parallel_sweep(_joint_algebraic_numerical_range_setup, (op_list, return_info), list(direction),
+                num_worker=num_worker, use_tqdm=use_tqdm)
+    obj_list,boundary_list,norm_vec_list = zip(*tmp0)
     if is_single:
         if return_info:
             ret = (obj_list[0], boundary_list[0], norm_vec_list[0])
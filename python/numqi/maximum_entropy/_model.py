@@ -7,7 +7,7 @@ import numqi.manifold
 from ._internal import eigvalsh_largest_power_iteration#, NANGradientToNumber
 
 class MaximumEntropyModel(torch.nn.Module):
-    def __init__(self, term_list, use_full=False):
+    def __init__(self, term_list, use_full=False, rank=None):
         super().__init__()
         term_np = np.stack(term_list)
         assert (term_np.ndim==3) and (term_np.shape[1]==term_np.shape[2])
@@ -15,7 +15,8 @@ class MaximumEntropyModel(torch.nn.Module):
         self.term = torch.tensor(term_np, dtype=torch.complex128)
         num_term,dim,_ = self.term.shape
         if use_full:
-            self.manifold_PSD = numqi.manifold.Trace1PSD(dim, dtype=torch.complex128)
+            # rank-limited cholesky factor, the dense contraction with the terms is cheaper than the factored one
+            self.manifold_PSD = numqi.manifold.Trace1PSD(dim, rank=rank, dtype=torch.complex128)
         else:
             self.theta = torch.nn.Parameter(torch.rand(num_term, dtype=torch.float64))
 
@@ -1,3 +1,5 @@
 from ._internal import (get_model_flat_parameter, get_model_flat_grad, set_model_flat_parameter,
-        hf_model_wrapper, check_model_gradient, minimize, minimize_adam, get_model_hessian,
-        MinimizeCallback, finite_difference_central)
+        hf_model_wrapper, check_model_gradient, minimize, minimize_warm_start, minimize_batch, minimize_adam, get_model_hessian,
+        get_model_hessian_vector_product, hf_model_hessp_wrapper,
+        register_model_flat_buffer, MinimizeCallback, MinimizeProfiler, SweepCheckpoint, finite_difference_central)
+from ._riemann import minimize_riemann
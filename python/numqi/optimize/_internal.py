@@ -1,29 +1,91 @@
+import os
 import time
+import json
+import pickle
 import contextlib
 import numpy as np
 import scipy.optimize
 from tqdm.auto import tqdm
 import torch
 
+from ._riemann import minimize_riemann
+
 def _get_sorted_parameter(model):
     tmp0 = sorted([(k,v) for k,v in model.named_parameters() if v.requires_grad], key=lambda x:x[0])
     ret = [x[1] for x in tmp0]
     return ret
 
 
+def register_model_flat_buffer(model):
+    r'''store all the (sorted) parameters and their gradients of the model as views into two contiguous float64 buffers,
+    so that `set_model_flat_parameter`, `get_model_flat_grad` and `hf_model_wrapper` become a single memcpy
+    instead of per-parameter copy and concatenation. Only cpu float64 parameters are supported
+
+    Parameters:
+        model (torch.nn.Module): the model, modified in-place
+
+    Returns:
+        theta (np.ndarray): shape (num_parameter,), numpy view of the parameter buffer (shared memory)
+    '''
+    parameter_sorted = _get_sorted_parameter(model)
+    assert len(parameter_sorted)>0
+    assert all((x.dtype==torch.float64) and (x.device.type=='cpu') and (x.layout==torch.strided) for x in parameter_sorted)
+    numel_list = [x.numel() for x in parameter_sorted]
+    theta = torch.cat([x.detach().reshape(-1) for x in parameter_sorted])
+    grad = torch.zeros_like(theta)
+    theta_view = [y.view(x.shape) for x,y in zip(parameter_sorted, torch.split(theta, numel_list))]
+    grad_view = [y.view(x.shape) for x,y in zip(parameter_sorted, torch.split(grad, numel_list))]
+    for x,y,z in zip(parameter_sorted, theta_view, grad_view):
+        x.data = y
+        x.grad = z
+    model._numqi_flat_buffer = dict(parameter=parameter_sorted, theta=theta, grad=grad,
+                theta_view=theta_view, grad_view=grad_view, theta_np=theta.numpy(), grad_np=grad.numpy())
+    return model._numqi_flat_buffer['theta_np']
+
+
+def _get_model_flat_buffer(model, check_parameter=True):
+    # return None if the model does not register a flat buffer (or the parameter list is changed)
+    ret = getattr(model, '_numqi_flat_buffer', None)
+    if ret is not None:
+        if check_parameter:
+            tmp0 = _get_sorted_parameter(model)
+            if (len(tmp0)!=len(ret['parameter'])) or any((x is not y) for x,y in zip(tmp0, ret['parameter'])):
+                model._numqi_flat_buffer = None
+                return None
+        for x,y,z in zip(ret['parameter'], ret['theta_view'], ret['grad_view']):
+            if x.data_ptr()!=y.data_ptr(): #x.data is re-assigned
+                y.copy_(x.detach())
+                x.data = y
+            if (x.grad is None) or (x.grad.data_ptr()!=z.data_ptr()): #e.g. optimizer.zero_grad(set_to_none=True)
+                if x.grad is not None:
+                    z.copy_(x.grad)
+                x.grad = z
+    return ret
+
+
 def get_model_flat_parameter(model):
+    tmp0 = _get_model_flat_buffer(model)
+    if tmp0 is not None:
+        return tmp0['theta_np'].copy()
     tmp0 = _get_sorted_parameter(model)
     ret = np.concatenate([x.detach().cpu().numpy().reshape(-1) for x in tmp0])
     return ret
 
 
 def get_model_flat_grad(model):
+    tmp0 = _get_model_flat_buffer(model)
+    if tmp0 is not None:
+        return tmp0['grad_np'].copy()
     tmp0 = _get_sorted_parameter(model)
     ret = np.concatenate([x.grad.detach().cpu().numpy().reshape(-1) for x in tmp0])
     return ret
 
 
 def set_model_flat_parameter(model, theta, index01=None):
+    tmp0 = _get_model_flat_buffer(model)
+    if tmp0 is not None:
+        tmp0['theta_np'][:] = theta
+        return
     theta = torch.tensor(theta)
     parameter_sorted = _get_sorted_parameter(model)
     if index01 is None:
@@ -36,15 +98,59 @@ def set_model_flat_parameter(model, theta, index01=None):
         parameter_sorted[ind0].data.copy_(tmp0)
 
 
-def hf_model_wrapper(model):
+def _hf_model_wrapper_flat_buffer(model, profiler=None):
+    def hf0(theta, tag_grad=True):
+        t0 = time.perf_counter()
+        buffer = _get_model_flat_buffer(model, check_parameter=False)
+        buffer['theta_np'][:] = theta
+        t1 = time.perf_counter()
+        if tag_grad:
+            loss = model()
+            t2 = time.perf_counter()
+            buffer['grad'].zero_()
+            if hasattr(model, 'grad_backward'):
+                model.grad_backward(loss)
+            else:
+                loss.backward()
+            # scipy may keep a reference to the returned gradient, so the buffer cannot be returned directly
+            grad = buffer['grad_np'].copy()
+        else:
+            with torch.no_grad():
+                loss = model()
+            t2 = time.perf_counter()
+            grad = None
+        fval = loss.item()
+        if profiler is not None:
+            profiler.update(fval, t1-t0, t2-t1, time.perf_counter()-t2, tag_grad)
+        ret = (fval,grad) if tag_grad else fval
+        return ret
+    return hf0
+
+
+def hf_model_wrapper(model, profiler=None):
+    r'''wrap the model into `hf(theta, tag_grad=True)` for scipy.optimize.minimize
+
+    Parameters:
+        model (torch.nn.Module): the model
+        profiler (None, MinimizeProfiler): if not None, record the evaluation count and the time of
+            setting parameter, forward and backward
+
+    Returns:
+        hf0 (callable): `hf0(theta)` returns `(fval,grad)`, `hf0(theta, tag_grad=False)` returns `fval`
+    '''
+    if _get_model_flat_buffer(model) is not None:
+        return _hf_model_wrapper_flat_buffer(model, profiler)
     parameter_sorted = _get_sorted_parameter(model)
     tmp0 = np.cumsum(np.array([0] + [x.numel() for x in parameter_sorted])).tolist()
     index01 = list(zip(tmp0[:-1],tmp0[1:]))
     def hf0(theta, tag_grad=True):
         # tag_grad=False, return fval only, not (fval,None)
+        t0 = time.perf_counter()
         set_model_flat_parameter(model, theta, index01)
+        t1 = time.perf_counter()
         if tag_grad:
             loss = model()
+            t2 = time.perf_counter()
             for x in parameter_sorted:
                 if x.grad is not None:
                     x.grad.zero_()
@@ -57,12 +163,108 @@ def hf_model_wrapper(model):
         else:
             with torch.no_grad():
                 loss = model()
+            t2 = time.perf_counter()
             grad = None
-        ret = (loss.item(),grad) if tag_grad else loss.item()
+        fval = loss.item()
+        if profiler is not None:
+            profiler.update(fval, t1-t0, t2-t1, time.perf_counter()-t2, tag_grad)
+        ret = (fval,grad) if tag_grad else fval
         return ret
     return hf0
 
 
+class MinimizeProfiler:
+    def __init__(self, tag_trace:bool=False):
+        r'''record the evaluation count and the time breakdown of `minimize` and `minimize_adam`
+
+        time of each round is split into `time_set_parameter`, `time_forward`, `time_backward`, `time_hessp`,
+        `time_callback` and `time_overhead` (scipy or torch.optim, everything else)
+
+        Parameters:
+            tag_trace (bool): if True, record the loss of every evaluation in `fval_trace`
+        '''
+        self.tag_trace = tag_trace
+        self.round_list = []
+        self.state = None
+        self._time_start = None
+
+    def start_round(self, name:str=''):
+        self.state = dict(name=name, round=len(self.round_list), nfev=0, ngev=0, nhev=0, time_set_parameter=0.0,
+                    time_forward=0.0, time_backward=0.0, time_hessp=0.0, time_callback=0.0, time_overhead=0.0, time_total=0.0)
+        if self.tag_trace:
+            self.state['fval_trace'] = []
+        self._time_start = time.perf_counter()
+
+    def update(self, fval:float, time_set_parameter:float, time_forward:float, time_backward:float, tag_grad:bool=True):
+        state = self.state
+        if state is None: #evaluation outside start_round()/end_round() is not recorded
+            return
+        state['nfev'] += 1
+        state['ngev'] += int(tag_grad)
+        state['time_set_parameter'] += time_set_parameter
+        state['time_forward'] += time_forward
+        if tag_grad:
+            state['time_backward'] += time_backward
+        else:
+            state['time_forward'] += time_backward
+        if self.tag_trace:
+            state['fval_trace'].append(fval)
+
+    def update_hessp(self, time_hessp:float):
+        if self.state is None:
+            return
+        self.state['nhev'] += 1
+        self.state['time_hessp'] += time_hessp
+
+    def wrap_callback(self, hf_callback):
+        if hf_callback is None:
+            return None
+        def hf0(*args, **kwargs):
+            t0 = time.perf_counter()
+            ret = hf_callback(*args, **kwargs)
+            self.state['time_callback'] += time.perf_counter() - t0
+            return ret
+        return hf0
+
+    def end_round(self, **kwargs):
+        state = self.state
+        state['time_total'] = time.perf_counter() - self._time_start
+        tmp0 = sum(state[x] for x in ['time_set_parameter', 'time_forward', 'time_backward', 'time_hessp', 'time_callback'])
+        state['time_overhead'] = state['time_total'] - tmp0
+        state.update({k:(v.item() if isinstance(v,np.generic) else v) for k,v in kwargs.items()})
+        self.round_list.append(state)
+        self.state = None
+
+    def report(self):
+        r'''summary of all the recorded rounds
+
+        Returns:
+            ret (dict): total `nfev`, `ngev`, time breakdown over all rounds, `round` is the list of per-round record
+        '''
+        key_list = ['nfev', 'ngev', 'nhev', 'time_set_parameter', 'time_forward', 'time_backward', 'time_hessp',
+                    'time_callback', 'time_overhead', 'time_total']
+        ret = {k:sum(x[k] for x in self.round_list) for k in key_list}
+        ret['num_round'] = len(self.round_list)
+        ret['round'] = self.round_list
+        return ret
+
+    def save_jsonl(self, filepath:str, mode:str='a'):
+        r'''write the per-round records as JSON lines
+
+        Parameters:
+            filepath (str): path of the file
+            mode (str): 'a' to append, 'w' to overwrite
+        '''
+        assert mode in {'a','w'}
+        with open(filepath, mode, encoding='utf-8') as fid:
+            for x in self.round_list:
+                fid.write(json.dumps(x) + '\n')
+
+    def reset(self):
+        self.round_list = []
+        self.state = None
+
+
 class MinimizeCallback:
     def __init__(self, print_freq:int=1, extra_key=None, tag_print:bool=True):
         if extra_key is None:
@@ -189,9 +391,79 @@ def _get_hf_theta(np_rng, key=None):
     return hf_theta
 
 
+def _save_checkpoint(file:str, data:dict):
+    # write to a temporary file first, so that an interrupted write never corrupts the previous checkpoint
+    tmp0 = file + '.tmp'
+    with open(tmp0, 'wb') as fid:
+        pickle.dump(data, fid)
+    os.replace(tmp0, file)
+
+
+def _load_checkpoint(file:str|None):
+    if (file is None) or (not os.path.exists(file)):
+        return None
+    with open(file, 'rb') as fid:
+        ret = pickle.load(fid)
+    return ret
+
+
+class SweepCheckpoint:
+    def __init__(self, file:str|None, np_rng:np.random.Generator|None=None):
+        r'''on-disk record of the completed points of a long sweep (numerical range, bisection, etc.),
+        the file is rewritten after every completed point, and the completed points are skipped after restart
+
+        Parameters:
+            file (str,None): path of the checkpoint file, if None, nothing is saved
+            np_rng (np.random.Generator,None): if not None, its state is saved together with each point and
+                restored when loading, so that the resumed sweep draws the same random numbers
+        '''
+        self.file = file
+        self.np_rng = np_rng
+        self.data = dict()
+        tmp0 = _load_checkpoint(file)
+        if tmp0 is not None:
+            self.data = tmp0['data']
+            if (np_rng is not None) and (tmp0['np_rng_state'] is not None):
+                np_rng.bit_generator.state = tmp0['np_rng_state']
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        if self.file is not None:
+            tmp0 = None if (self.np_rng is None) else self.np_rng.bit_generator.state
+            _save_checkpoint(self.file, dict(data=self.data, np_rng_state=tmp0))
+
+    def wrap(self, hf0):
+        r'''memoize the function `hf0(x)` on disk, `x` must be hashable'''
+        def hf1(x):
+            if x not in self.data:
+                self[x] = hf0(x)
+            return self.data[x]
+        return hf1
+
+
+def _hf_checkpoint_callback(hf_callback, checkpoint_freq, hf_save):
+    step = [0]
+    def hf0(theta):
+        if hf_callback is not None:
+            hf_callback(theta)
+        step[0] += 1
+        if (checkpoint_freq>0) and (step[0]%checkpoint_freq==0):
+            hf_save(theta.copy())
+    return hf0
+
+
+_HESSP_METHOD = {'Newton-CG', 'trust-ncg', 'trust-krylov', 'trust-constr'}
+_RIEMANN_METHOD = {'riemann-lbfgs':'lbfgs', 'riemann-cg':'cg'}
+
 def minimize(model, theta0=None, num_repeat=1, tol=1e-7, print_freq=0, method='L-BFGS-B',
             print_every_round=1, maxiter=None, early_stop_threshold=None,
-            callback=None, seed=None):
+            callback=None, seed=None, profiler=None, checkpoint=None, checkpoint_freq=10):
     r'''gradient-based optimization
 
     Parameters:
@@ -221,6 +493,19 @@ def minimize(model, theta0=None, num_repeat=1, tol=1e-7, print_freq=0, method='L
         early_stop_threshold (float): if the loss is less than this value, the optimization will stop
         callback (None, MinimizeCallback): callback function, if None, MinimizeCallback(print_freq=print_freq) will be used
         seed (None, int): random seed
+        profiler (None, MinimizeProfiler): if not None, record evaluation count and time breakdown of each round
+        checkpoint (None, str): if not None, path of the checkpoint file. The best result, the finished round
+            and the random state are saved after every round, the current iterate is saved every `checkpoint_freq`
+            iterations. If the file exists, the optimization resumes from it (the unfinished round restarts from
+            the saved iterate, the internal state of scipy optimizer is not saved). If all the rounds are finished,
+            the saved result is returned directly. It's user's duty to use different files for different problems
+        checkpoint_freq (int): number of iterations between two saves of the current iterate
+
+    for the second-order methods ('Newton-CG', 'trust-ncg', 'trust-krylov', 'trust-constr'), the Hessian-vector
+    product is evaluated with `torch.func` (double backward as fallback), see `get_model_hessian_vector_product`
+
+    for the Riemannian methods ('riemann-lbfgs', 'riemann-cg'), the manifold submodules must use `method='riemann'`
+    (see `numqi.manifold.set_riemann_method`), the other parameters are treated as Euclidean, see `minimize_riemann`
 
     Returns:
         ret (scipy.optimize.OptimizeResult): the result of scipy.optimize.minimize
@@ -234,15 +519,55 @@ def minimize(model, theta0=None, num_repeat=1, tol=1e-7, print_freq=0, method='L
     np_rng = np.random.default_rng(seed)
     hf_theta = _get_hf_theta(np_rng, theta0)
     num_parameter = len(get_model_flat_parameter(model))
-    hf_model = hf_model_wrapper(model)
+    hf_model = hf_model_wrapper(model, profiler)
     theta_optim_best = None
+    index_best = None
+    ind_start = 0
+    theta_current = None
+    tmp0 = _load_checkpoint(checkpoint)
+    if tmp0 is not None:
+        assert tmp0['num_parameter']==num_parameter, f'checkpoint "{checkpoint}" does not match the model'
+        np_rng.bit_generator.state = tmp0['np_rng_state']
+        ind_start = tmp0['round']
+        index_best = tmp0['index_best']
+        theta_optim_best = tmp0['theta_optim_best']
+        theta_current = tmp0['theta_current']
+        if tmp0['is_finished']:
+            hf_model(theta_optim_best.x, tag_grad=False)
+            return theta_optim_best
+    from numqi.manifold._riemann import get_model_riemann_geometry #avoid circular import
+    geometry = get_model_riemann_geometry(model)
+    if method in _RIEMANN_METHOD:
+        assert geometry is not None, 'no manifold with method="riemann" in the model, see numqi.manifold.set_riemann_method'
+    else:
+        assert geometry is None, 'manifold with method="riemann" requires method="riemann-lbfgs" or "riemann-cg"'
     kwargs = dict(tol=tol, method=method, jac=True)
+    if method in _HESSP_METHOD:
+        kwargs['hessp'] = hf_model_hessp_wrapper(model, profiler)
     if maxiter is not None:
         kwargs['options'] = {'maxiter':maxiter}
-    for ind0 in range(num_repeat):
+    hf_save = lambda **x: _save_checkpoint(checkpoint, dict(num_parameter=num_parameter, index_best=index_best,
+                theta_optim_best=theta_optim_best, np_rng_state=np_rng_state, **x))
+    for ind0 in range(ind_start, num_repeat):
+        np_rng_state = np_rng.bit_generator.state
         theta0 = hf_theta(num_parameter)
-        hf_callback = callback.to_callable(hf_model) if (callback is not None) else None
-        theta_optim = scipy.optimize.minimize(hf_model, theta0, callback=hf_callback, **kwargs)
+        if theta_current is not None: #resume from the unfinished round
+            theta0 = theta_current
+            theta_current = None
+        hf_callback = callback.to_callable(hf_model_wrapper(model)) if (callback is not None) else None
+        if checkpoint is not None:
+            hf_callback = _hf_checkpoint_callback(hf_callback, checkpoint_freq,
+                        lambda x: hf_save(round=ind0, theta_current=x, is_finished=False))
+        if profiler is not None:
+            hf_callback = profiler.wrap_callback(hf_callback)
+            profiler.start_round(type(model).__name__)
+        if method in _RIEMANN_METHOD:
+            theta_optim = minimize_riemann(hf_model, theta0, geometry, method=_RIEMANN_METHOD[method],
+                        tol=tol, maxiter=maxiter, callback=hf_callback)
+        else:
+            theta_optim = scipy.optimize.minimize(hf_model, theta0, callback=hf_callback, **kwargs)
+        if profiler is not None:
+            profiler.end_round(fun=theta_optim.fun, nit=theta_optim.get('nit',-1), success=theta_optim.success)
         if (theta_optim_best is None) or (theta_optim.fun<theta_optim_best.fun):
             index_best = ind0
             theta_optim_best = theta_optim
@@ -250,17 +575,98 @@ def minimize(model, theta0=None, num_repeat=1, tol=1e-7, print_freq=0, method='L
             print(f'[round={ind0}] min(f)={theta_optim_best.fun}, current(f)={theta_optim.fun}')
         if callback is not None:
             callback.reset(save_history=True)
-        if (early_stop_threshold is not None) and (theta_optim_best.fun<=early_stop_threshold):
+        is_finished = (ind0==num_repeat-1) or ((early_stop_threshold is not None) and (theta_optim_best.fun<=early_stop_threshold))
+        if checkpoint is not None:
+            np_rng_state = np_rng.bit_generator.state
+            hf_save(round=ind0+1, theta_current=None, is_finished=is_finished)
+        if is_finished:
             break
     hf_model(theta_optim_best.x, tag_grad=False) #set theta and model.property
-    if callback is not None:
-        callback.state = callback.history_state[index_best]
+    if (callback is not None) and (index_best>=ind_start): #history before resuming is not saved
+        callback.state = callback.history_state[index_best-ind_start]
     return theta_optim_best
 
 
+def minimize_warm_start(model, theta_warm=None, fval_accept=None, theta0=None, num_repeat=1, **kwargs):
+    r'''warm-started optimization for the continuation sweeps (numerical range, boundary bisection). The first round
+    starts from `theta_warm` (usually the optimum of the neighbouring point), the random restarts are used only if
+    the loss of the warm solution is larger than `fval_accept`
+
+    Parameters:
+        model (torch.nn.Module): the model to be optimized
+        theta_warm (None, np.ndarray): the warm start point, if None, same as `minimize(model, theta0, num_repeat)`
+        fval_accept (None, float): accept the warm solution if its loss is not larger than this value,
+            if None, the warm solution is always accepted
+        theta0 (None, str, np.ndarray, callable): the initial value of the random restarts, see `minimize`
+        num_repeat (int): number of random restarts
+        **kwargs: other arguments passed to `minimize` (`early_stop_threshold` is used internally)
+
+    Returns:
+        ret (scipy.optimize.OptimizeResult): the best result
+    '''
+    if theta_warm is None:
+        ret = minimize(model, theta0=theta0, num_repeat=num_repeat, **kwargs)
+        return ret
+    assert 'early_stop_threshold' not in kwargs
+    theta_warm = np.asarray(theta_warm, dtype=np.float64)
+    hf_theta = []
+    def hf0(size, np_rng):
+        if len(hf_theta)==0:
+            hf_theta.append(_get_hf_theta(np_rng, theta0))
+            return theta_warm.copy()
+        return hf_theta[0](size)
+    num_repeat = 1 if (fval_accept is None) else (num_repeat+1)
+    ret = minimize(model, theta0=hf0, num_repeat=num_repeat, early_stop_threshold=fval_accept, **kwargs)
+    return ret
+
+
+def minimize_batch(model, theta0=None, num_repeat=1, batch_size:int|None=None, **kwargs):
+    r'''multi-start optimization of a batched model whose loss is the sum of decoupled items. All the items are
+    optimized jointly in each round, and the best point of each item over the rounds is kept (instead of the best sum)
+
+    The model should store the loss of each item in `model.loss_batch` (shape=(batch_size,)) in `forward`,
+    and the parameters of the items should be contiguous along the first dimension of each parameter
+
+    Parameters:
+        model (torch.nn.Module): the model to be optimized
+        theta0 (None, str, np.ndarray, callable): the initial value of theta, see `minimize`
+        num_repeat (int): number of random restarts
+        batch_size (int,None): number of items, if None, `model.batch_size` is used
+        **kwargs: other arguments passed to `minimize`
+
+    Returns:
+        ret (np.ndarray): the loss of each item, shape=(batch_size,)
+    '''
+    batch_size = model.batch_size if (batch_size is None) else batch_size
+    kwargs = {'print_every_round':0, **kwargs}
+    kwargs['seed'] = np.random.default_rng(kwargs.get('seed', None))
+    parameter_list = _get_sorted_parameter(model)
+    assert all(x.numel()%batch_size==0 for x in parameter_list)
+    loss_best = None
+    for _ in range(num_repeat):
+        minimize(model, theta0=theta0, num_repeat=1, **kwargs)
+        loss = model.loss_batch.detach().cpu().numpy().copy()
+        theta = [x.detach().clone() for x in parameter_list]
+        if loss_best is None:
+            loss_best,theta_best = loss,theta
+        else:
+            ind0 = torch.from_numpy(loss < loss_best)
+            loss_best = np.minimum(loss_best, loss)
+            for x,y in zip(theta_best, theta):
+                x.view(batch_size,-1)[ind0.to(x.device)] = y.view(batch_size,-1)[ind0.to(x.device)]
+    with torch.no_grad():
+        for x,y in zip(parameter_list, theta_best):
+            x.copy_(y)
+        model()
+    return loss_best
+
+
 def minimize_adam(model, num_step, theta0='no-init', optim_args=('adam',0.01),
-            seed=None, tqdm_update_freq=20, early_stop_threshold=None, tag_return_history=False):
+            seed=None, tqdm_update_freq=20, early_stop_threshold=None, tag_return_history=False, profiler=None,
+            checkpoint=None, checkpoint_freq=100):
     # TODO num_repeat
+    # checkpoint(str,None): parameter, optimizer/lr_scheduler state and random state are saved every checkpoint_freq steps,
+    #   resume from the file if it exists
     assert optim_args[0] in {'sgd', 'adam'}
     use_tqdm = tqdm_update_freq>0
     np_rng = np.random.default_rng(seed)
@@ -277,16 +683,46 @@ def minimize_adam(model, num_step, theta0='no-init', optim_args=('adam',0.01),
         lr_scheduler = torch.optim.lr_scheduler.ExponentialLR(optimizer, gamma=tmp0)
     else:
         lr_scheduler = None
-    tmp0 = tqdm(range(num_step)) if use_tqdm else contextlib.nullcontext(range(num_step))
     loss_best = None
     theta_best = None
     loss_history = []
-    with tmp0 as pbar:
+    step_start = 0
+    is_finished = False
+    tmp0 = _load_checkpoint(checkpoint)
+    if tmp0 is not None:
+        assert tmp0['num_parameter']==num_parameter, f'checkpoint "{checkpoint}" does not match the model'
+        step_start = tmp0['step']
+        loss_best = tmp0['loss_best']
+        theta_best = tmp0['theta_best']
+        loss_history = tmp0['loss_history']
+        is_finished = tmp0['is_finished']
+        set_model_flat_parameter(model, tmp0['theta'])
+        optimizer.load_state_dict(tmp0['optimizer'])
+        if lr_scheduler is not None:
+            lr_scheduler.load_state_dict(tmp0['lr_scheduler'])
+        np_rng.bit_generator.state = tmp0['np_rng_state']
+        torch.set_rng_state(tmp0['torch_rng_state'])
+    def hf_save(step, is_finished):
+        tmp0 = dict(num_parameter=num_parameter, step=step, theta=get_model_flat_parameter(model),
+                optimizer=optimizer.state_dict(), lr_scheduler=(None if (lr_scheduler is None) else lr_scheduler.state_dict()),
+                loss_best=loss_best, theta_best=theta_best, loss_history=loss_history, is_finished=is_finished,
+                np_rng_state=np_rng.bit_generator.state, torch_rng_state=torch.get_rng_state())
+        _save_checkpoint(checkpoint, tmp0)
+    tmp0 = range(step_start, (step_start if is_finished else num_step))
+    tmp1 = tqdm(tmp0) if use_tqdm else contextlib.nullcontext(tmp0)
+    if profiler is not None:
+        profiler.start_round(type(model).__name__)
+    ind0 = step_start - 1
+    with tmp1 as pbar:
         for ind0 in pbar:
             optimizer.zero_grad()
+            t0 = time.perf_counter()
             loss = model()
+            t1 = time.perf_counter()
             loss.backward()
             loss_i = loss.item()
+            if profiler is not None:
+                profiler.update(loss_i, 0, t1-t0, time.perf_counter()-t1)
             if tag_return_history:
                 loss_history.append(loss_i)
             if (loss_best is None) or (loss_i<loss_best):
@@ -299,6 +735,12 @@ def minimize_adam(model, num_step, theta0='no-init', optim_args=('adam',0.01),
                 pbar.set_postfix(loss=f'{loss_i:.12f}')
             if (early_stop_threshold is not None) and (loss_i<=early_stop_threshold):
                 break
+            if (checkpoint is not None) and (checkpoint_freq>0) and ((ind0+1)%checkpoint_freq==0):
+                hf_save(ind0+1, is_finished=False)
+    if profiler is not None:
+        profiler.end_round(fun=loss_best, nit=ind0+1-step_start)
+    if (checkpoint is not None) and (not is_finished):
+        hf_save(ind0+1, is_finished=True)
     # set theta and model.property (sometimes)
     set_model_flat_parameter(model, theta_best)
     with torch.no_grad():
@@ -312,7 +754,8 @@ def _hf_zero_grad(parameter_list):
         if x.grad is not None:
             x.grad.zero_()
 
-def get_model_hessian(model):
+
+def _get_model_hessian_autograd(model):
     parameter_sorted = _get_sorted_parameter(model)
     _hf_zero_grad(parameter_sorted)
     loss = model()
@@ -327,3 +770,122 @@ def get_model_hessian(model):
             _hf_zero_grad(parameter_sorted)
     ret = np.stack(ret)
     return ret
+
+
+def _get_model_functional(model):
+    # loss as a pure function of the flat parameter vector, used by torch.func transforms
+    assert not hasattr(model, 'grad_backward'), 'torch.func does not support custom .grad_backward()'
+    tmp0 = sorted([(k,v) for k,v in model.named_parameters() if v.requires_grad], key=lambda x:x[0])
+    name_list = [x[0] for x in tmp0]
+    shape_list = [x[1].shape for x in tmp0]
+    numel_list = [x[1].numel() for x in tmp0]
+    theta = torch.cat([x[1].detach().reshape(-1) for x in tmp0])
+    def hf0(theta):
+        tmp0 = {k:v.reshape(s) for k,v,s in zip(name_list, torch.split(theta, numel_list), shape_list)}
+        ret = torch.func.functional_call(model, tmp0, ())
+        return ret
+    return hf0, theta
+
+
+def _hf_restore_model(model):
+    # model.forward() may cache (functorch-wrapped) intermediate tensors as attributes, recompute them
+    with torch.no_grad():
+        model()
+
+
+def get_model_hessian(model, method='func'):
+    r'''get the Hessian matrix of the model loss with respect to the sorted flat parameters
+
+    Parameters:
+        model (torch.nn.Module): the model, `model()` should return a real scalar
+        method (str): 'func' or 'autograd'. 'func' builds the dense Hessian in one vectorized pass
+            with `torch.func` (vmap over vjp of the gradient), and falls back to 'autograd' if some operator
+            in the model does not support `torch.func` transforms. 'autograd' calls `.backward()` once per parameter
+
+    Returns:
+        ret (np.ndarray): shape (num_parameter, num_parameter)
+    '''
+    assert method in {'func', 'autograd'}
+    ret = None
+    if method=='func':
+        hf0, theta = _get_model_functional(model)
+        try:
+            ret = torch.func.jacrev(torch.func.grad(hf0))(theta).detach().cpu().numpy()
+        except (RuntimeError, NotImplementedError):
+            pass #e.g. torch.autograd.Function without setup_context()
+        _hf_restore_model(model)
+    if ret is None:
+        ret = _get_model_hessian_autograd(model)
+    return ret
+
+
+def _get_model_hessian_vector_product_func(model, vec, restore=True):
+    # None if some operator in the model does not support torch.func transforms
+    # restore=False skips the extra forward, the caller must run a plain forward before reading the model attributes
+    hf0, theta = _get_model_functional(model)
+    vec = torch.as_tensor(np.asarray(vec), dtype=theta.dtype, device=theta.device)
+    hf_hvp = lambda x: torch.func.jvp(torch.func.grad(hf0), (theta,), (x,))[1]
+    try:
+        ret = (hf_hvp(vec) if (vec.ndim==1) else torch.func.vmap(hf_hvp)(vec)).detach().cpu().numpy()
+    except (RuntimeError, NotImplementedError):
+        ret = None #e.g. torch.autograd.Function without setup_context()
+    if restore:
+        _hf_restore_model(model)
+    return ret
+
+
+def _get_model_hessian_vector_product_autograd(model, vec):
+    parameter_sorted = _get_sorted_parameter(model)
+    loss = model()
+    tmp0 = torch.autograd.grad(loss, parameter_sorted, create_graph=True)
+    grad = torch.cat([x.reshape(-1) for x in tmp0])
+    vec = np.asarray(vec)
+    tmp1 = torch.as_tensor(vec.reshape(-1, grad.numel()), dtype=grad.dtype, device=grad.device)
+    ret = []
+    for x in tmp1:
+        tmp2 = torch.autograd.grad(grad, parameter_sorted, grad_outputs=x, retain_graph=True, allow_unused=True)
+        ret.append(torch.cat([(torch.zeros_like(y) if (z is None) else z).reshape(-1) for y,z in zip(parameter_sorted,tmp2)]))
+    ret = torch.stack(ret).detach().cpu().numpy().reshape(vec.shape)
+    return ret
+
+
+def get_model_hessian_vector_product(model, vec, method='func'):
+    r'''get the Hessian-vector product of the model loss at the current parameters
+
+    Parameters:
+        model (torch.nn.Module): the model, `model()` should return a real scalar
+        vec (np.ndarray): shape (num_parameter,) or (batch_size, num_parameter)
+        method (str): 'func' or 'autograd'. 'func' uses forward-over-reverse mode `torch.func.jvp(torch.func.grad(loss))`
+            vectorized over `vec` via `torch.func.vmap`, and falls back to 'autograd' if some operator in the model
+            does not support `torch.func` transforms. 'autograd' uses double backward, one `.grad()` call per vector
+
+    Returns:
+        ret (np.ndarray): same shape as `vec`
+    '''
+    assert method in {'func', 'autograd'}
+    assert np.ndim(vec) in (1,2)
+    ret = _get_model_hessian_vector_product_func(model, vec) if (method=='func') else None
+    if ret is None:
+        ret = _get_model_hessian_vector_product_autograd(model, vec)
+    return ret
+
+
+def hf_model_hessp_wrapper(model, profiler=None):
+    r'''wrap the model into `hessp(theta, vec)` for scipy.optimize.minimize
+    (method 'Newton-CG', 'trust-ncg', 'trust-krylov', 'trust-constr'), switch to double backward
+    once `torch.func` fails on the model. The attributes set in `model.forward()` (e.g. `.dm_torch`) are not
+    restored after each call, scipy evaluates `fun` (a plain forward) before using the result, and so does
+    `minimize` at the end'''
+    method = ['func']
+    def hf0(theta, vec):
+        t0 = time.perf_counter()
+        set_model_flat_parameter(model, theta)
+        ret = _get_model_hessian_vector_product_func(model, vec, restore=False) if (method[0]=='func') else None
+        if ret is None:
+            method[0] = 'autograd'
+            ret = _get_model_hessian_vector_product_autograd(model, vec)
+        ret = ret.astype(theta.dtype)
+        if profiler is not None:
+            profiler.update_hessp(time.perf_counter()-t0)
+        return ret
+    return hf0
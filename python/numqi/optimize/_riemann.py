@@ -0,0 +1,123 @@
+import numpy as np
+import scipy.optimize
+
+
+def _lbfgs_two_loop(grad, s_list, y_list, rho_list):
+    q = grad.copy()
+    alpha_list = []
+    for s,y,rho in zip(reversed(s_list), reversed(y_list), reversed(rho_list)):
+        alpha = rho * np.dot(s, q)
+        q -= alpha * y
+        alpha_list.append(alpha)
+    if len(s_list):
+        q *= np.dot(s_list[-1], y_list[-1]) / np.dot(y_list[-1], y_list[-1])
+    for s,y,rho,alpha in zip(s_list, y_list, rho_list, reversed(alpha_list)):
+        beta = rho * np.dot(y, q)
+        q += (alpha - beta) * s
+    return q
+
+
+def _line_search_armijo(hf0, geometry, x, fval, slope, direction, alpha, c1=1e-4, shrink=0.5, maxiter=30):
+    # backtracking along the retraction curve, return None if no sufficient decrease is found
+    for _ in range(maxiter):
+        x_new = geometry.retract(x, alpha*direction)
+        f_new,egrad_new = hf0(x_new)
+        if f_new <= fval + c1*alpha*slope:
+            return alpha, x_new, f_new, egrad_new
+        alpha = alpha * shrink
+    return None
+
+
+def minimize_riemann(hf0, x0, geometry, method:str='lbfgs', tol:float=1e-7, maxiter:int|None=None,
+            callback=None, num_memory:int=10):
+    r'''Riemannian L-BFGS / conjugate gradient on the product manifold, the tangent vectors are transported by projection
+
+    reference: Absil, Mahony, Sepulchre, Optimization Algorithms on Matrix Manifolds
+    [doi-link](https://doi.org/10.1515/9781400830244)
+
+    Parameters:
+        hf0 (callable): `hf0(x)` returns `(fval, euclidean_grad)`
+        x0 (np.ndarray): initial point, projected onto the manifold first
+        geometry (numqi.manifold._riemann.ProductGeometry): geometry of the parameter vector
+        method (str): 'lbfgs' or 'cg' (Polak-Ribiere+)
+        tol (float): stop if the max-norm of the Riemannian gradient, or the relative decrease of the loss is less than `tol`
+        maxiter (int,None): maximum number of iterations, default to 15000 (same as scipy L-BFGS-B)
+        callback (callable,None): `callback(x)` is called after each iteration
+        num_memory (int): number of correction pairs of L-BFGS
+
+    Returns:
+        ret (scipy.optimize.OptimizeResult): the result
+    '''
+    assert method in {'lbfgs','cg'}
+    maxiter = 15000 if (maxiter is None) else maxiter
+    nfev = [0]
+    def hf1(x):
+        nfev[0] += 1
+        return hf0(x)
+    x = geometry.to_manifold(np.asarray(x0, dtype=np.float64))
+    fval,egrad = hf1(x)
+    grad = geometry.proj(x, egrad)
+    s_list,y_list,rho_list = [],[],[]
+    direction = None
+    alpha = None
+    success = False
+    message = 'maximum number of iterations reached'
+    nit = 0
+    while nit<maxiter:
+        if np.abs(grad).max() <= tol:
+            success = True
+            message = 'Riemannian gradient norm less than tol'
+            break
+        if method=='lbfgs':
+            direction = -_lbfgs_two_loop(grad, s_list, y_list, rho_list)
+            is_steepest = len(s_list)==0
+        elif direction is None:
+            direction = -grad
+            is_steepest = True
+        slope = np.dot(grad, direction)
+        if slope>=0: #not a descent direction, restart
+            s_list,y_list,rho_list = [],[],[]
+            direction = -grad
+            is_steepest = True
+            slope = np.dot(grad, direction)
+        if alpha is None:
+            alpha0 = min(1, 1/np.linalg.norm(grad))
+        else:
+            alpha0 = 1 if (method=='lbfgs') else min(1, 2*alpha)
+        tmp0 = _line_search_armijo(hf1, geometry, x, fval, slope, direction, alpha0)
+        if tmp0 is None:
+            if is_steepest:
+                message = 'line search failed'
+                break
+            s_list,y_list,rho_list = [],[],[]
+            direction = None
+            alpha = None
+            continue
+        alpha,x_new,f_new,egrad_new = tmp0
+        grad_new = geometry.proj(x_new, egrad_new)
+        grad_transport = geometry.transport(x, x_new, grad)
+        direction_transport = geometry.transport(x, x_new, direction)
+        if method=='lbfgs':
+            s_list = [geometry.transport(x, x_new, z) for z in s_list] + [alpha*direction_transport]
+            y_list = [geometry.transport(x, x_new, z) for z in y_list] + [grad_new-grad_transport]
+            # the transported pairs may violate the curvature condition, drop them
+            tmp1 = [(a,b) for a,b in zip(s_list,y_list) if np.dot(a,b)>1e-10*np.dot(b,b)][-num_memory:]
+            s_list = [a for a,_ in tmp1]
+            y_list = [b for _,b in tmp1]
+            rho_list = [1/np.dot(a,b) for a,b in tmp1]
+        else:
+            beta = max(0, np.dot(grad_new, grad_new-grad_transport) / np.dot(grad, grad))
+            direction = -grad_new + beta*direction_transport
+            is_steepest = False
+        f_old = fval
+        x,fval,grad = x_new,f_new,grad_new
+        nit += 1
+        if callback is not None:
+            callback(x)
+        if (f_old-fval) <= tol*max(abs(f_old), abs(fval), 1):
+            success = True
+            message = 'relative reduction of f less than tol'
+            break
+    ret = scipy.optimize.OptimizeResult(x=x, fun=fval, jac=grad, nit=nit, nfev=nfev[0], njev=nfev[0],
+                success=success, status=(0 if success else 1), message=message)
+    return ret
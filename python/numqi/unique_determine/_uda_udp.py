@@ -268,7 +268,7 @@ def _find_optimal_UD_one(is_uda, mat_list, num_repeat, num_init_sample, indexF,
 def find_optimal_UD(kind:str, num_round:int, mat_list:np.ndarray|list, num_repeat:int, num_init_sample:int=0, indexF:None|tuple[int]=None,
             early_stop_threshold:float=0.01, converge_tol:float=1e-5, last_converge_tol:None|float=None, last_num_repeat:None|int=None,
             dtype:str='float32', num_worker:int=1, key:(str|None)=None, file:(str|None)=None,
-            tag_single_thread:bool=True, tag_print:bool=False, seed=None):
+            tag_single_thread:bool=True, tag_print:bool=False, seed=None, checkpoint:str|None=None):
     r'''Find the optimal measurement scheme for UDA or UDP
 
     Parameters:
@@ -291,6 +291,8 @@ def find_optimal_UD(kind:str, num_round:int, mat_list:np.ndarray|list, num_repea
         tag_single_thread (bool): if True, use single thread for each worker
         tag_print (bool): if True, print the result
         seed (int): random seed
+        checkpoint (str|None): checkpoint file, the result of each finished round is saved,
+            and the finished rounds are skipped when restarting with the same file
 
     Returns:
         ret (list[int]|list[list[int]]): list of index of the optimal measurement scheme. For batch input, it is a list of list of index.
@@ -318,14 +320,18 @@ def find_optimal_UD(kind:str, num_round:int, mat_list:np.ndarray|list, num_repea
         for x in mat_list:
             tmp0 = (x-x.T.conj()).data
             assert (len(tmp0)==0) or np.abs(tmp0).max() < 1e-10
-    ret = []
     kwargs = dict(is_uda=is_uda, mat_list=mat_list, num_repeat=num_repeat, num_init_sample=num_init_sample,
                   indexF=indexF, early_stop_threshold=early_stop_threshold, converge_tol=converge_tol,
                   last_converge_tol=last_converge_tol, last_num_repeat=last_num_repeat,
                   dtype=dtype, tag_single_thread=tag_single_thread, tag_print=tag_print)
+    sweep_ckpt = numqi.optimize.SweepCheckpoint(checkpoint, np_rng)
+    ret = [sweep_ckpt[x] for x in range(num_round) if (x in sweep_ckpt) and (sweep_ckpt[x] is not None)]
     if num_worker==1:
-        for _ in range(num_round):
+        for ind_round in range(num_round):
+            if ind_round in sweep_ckpt:
+                continue
             ret_i = _find_optimal_UD_one(**kwargs, np_rng=np_rng)
+            sweep_ckpt[ind_round] = ret_i
             if ret_i is not None:
                 ret.append(ret_i)
                 if key is not None:
@@ -335,10 +341,12 @@ def find_optimal_UD(kind:str, num_round:int, mat_list:np.ndarray|list, num_repea
         # https://github.com/pytorch/pytorch/wiki/Autograd-and-Fork
         with concurrent.futures.ProcessPoolExecutor(max_workers=num_worker, mp_context=multiprocessing.get_context('spawn')) as executor:
 
-            job_list = [executor.submit(_find_optimal_UD_one, **kwargs, np_rng=x) for x in range(np_rng.spawn(num_round))]
+            tmp0 = [x for x in range(num_round) if x not in sweep_ckpt]
+            job_to_round = {executor.submit(_find_optimal_UD_one, **kwargs, np_rng=y):x for x,y in zip(tmp0, np_rng.spawn(len(tmp0)))}
             time_start = time.time()
-            for ind0,job_i in enumerate(concurrent.futures.as_completed(job_list)):
+            for ind0,job_i in enumerate(concurrent.futures.as_completed(job_to_round)):
                 ret_i = job_i.result()
+                sweep_ckpt[job_to_round[job_i]] = ret_i
                 if ret_i is not None:
                     ret.append(ret_i)
                     tmp0 = time.time() - time_start
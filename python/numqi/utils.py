@@ -1,9 +1,13 @@
 import functools
 import collections
+import multiprocessing
+import concurrent.futures
 import numpy as np
 import torch
+from tqdm.auto import tqdm
 
 import numqi._torch_op
+from numqi._disk_cache import get_cache_dir, set_cache_dir, clear_cache
 
 @functools.lru_cache(maxsize=128)
 def _hf_num_state_to_num_qubit_hf0(num_state:int, kind:str):
@@ -147,12 +151,10 @@ def get_fidelity(rho0:np.ndarray|torch.Tensor, rho1:np.ndarray|torch.Tensor):
         elif ndim0==2 and ndim1==1:
             ret = torch.vdot(rho1, rho0 @ rho1).real
         else:
-            EVL0,EVC0 = torch.linalg.eigh(rho0)
-            zero = torch.tensor(0.0, device=rho0.device)
-            tmp0 = torch.sqrt(torch.maximum(zero, EVL0))
-            tmp1 = (tmp0.reshape(-1,1) * EVC0.T.conj()) @ rho1 @ (EVC0 * tmp0)
-            tmp2 = torch.linalg.eigvalsh(tmp1)
-            ret = torch.sum(torch.sqrt(torch.maximum(zero, tmp2)))**2
+            tmp0 = numqi._torch_op.get_psd_matrix_spectral(rho0, 'sqrt')
+            # Tr sqrt(M) via the spectral op, finite gradient at the zero eigenvalues
+            tmp1 = numqi._torch_op.get_psd_matrix_spectral(tmp0 @ rho1 @ tmp0, 'sqrt')
+            ret = torch.diagonal(tmp1, dim1=-2, dim2=-1).sum().real**2
     else:
         if ndim0==1 and ndim1==1:
             ret = abs(np.vdot(rho0, rho1))**2
@@ -169,17 +171,32 @@ def get_fidelity(rho0:np.ndarray|torch.Tensor, rho1:np.ndarray|torch.Tensor):
     return ret
 
 
+def _get_factor_gram(matY, prob):
+    # rho=Y diag(p) Y^dagger shares the nonzero spectrum with the (rank,rank) Gram matrix sqrt(p) Y^dagger Y sqrt(p)
+    if isinstance(matY, torch.Tensor):
+        tmp0 = matY * torch.sqrt(prob).unsqueeze(-2).to(matY.dtype)
+    else:
+        tmp0 = matY * np.sqrt(prob)[...,np.newaxis,:]
+    ret = tmp0.swapaxes(-2,-1).conj() @ tmp0
+    return ret
+
+
 def get_von_neumann_entropy(rho:np.ndarray|torch.Tensor, _torch_logm:str|tuple='eigen'):
     r'''get the von Neumann entropy of a density matrix
     [wiki-link](https://en.wikipedia.org/wiki/Von_Neumann_entropy)
 
     Parameters:
-        rho (np.ndarray,torch.Tensor): a density matrix, shape=(dim,dim)
-        _torch_logm (str,tuple): 'eigen' or ('pade',num_sqrtm,pade_order), 'pade' is used only when requires_grad
+        rho (np.ndarray,torch.Tensor,tuple): a density matrix, shape=(dim,dim), or the factored form `(matY,prob)`
+            with $\rho=Y\mathrm{diag}(p)Y^\dagger$ (see `numqi.manifold.Trace1PSD(return_factor=True)`),
+            then only a `(rank,rank)` matrix is diagonalized
+        _torch_logm (str,tuple): 'eigen' or ('pade',num_sqrtm,pade_order), 'pade' is used only when requires_grad,
+            'eigen' uses one eigen-decomposition with the Daleckii-Krein gradient `numqi._torch_op.get_psd_matrix_spectral`
 
     Returns:
         ret (float): the von Neumann entropy of the density matrix
     '''
+    if isinstance(rho, tuple):
+        rho = _get_factor_gram(*rho)
     shape = rho.shape
     assert (len(shape)>=2) and (shape[-1]==shape[-2])
     dim = shape[-1]
@@ -191,10 +208,7 @@ def get_von_neumann_entropy(rho:np.ndarray|torch.Tensor, _torch_logm:str|tuple='
             ret = -torch.einsum(rho.reshape(-1,dim*dim).conj(), [0,1], log_rho.reshape(-1,dim*dim), [0,1], [0]).real
             # ret = -torch.vdot(rho.reshape(-1), log_rho.reshape(-1)).real
         else:
-            eps = torch.tensor(torch.finfo(rho.dtype).eps)
-            EVL = torch.maximum(torch.linalg.eigvalsh(rho), eps)
-            ret = -torch.einsum(EVL, [0,1], torch.log(EVL), [0,1], [0])
-            # ret = -torch.dot(EVL, torch.log(EVL))
+            ret = numqi._torch_op.get_psd_matrix_spectral(rho, 'entropy')
     else:
         EVL = np.maximum(np.linalg.eigvalsh(rho), np.finfo(rho.dtype).eps)
         ret = - np.einsum(EVL, [0,1], np.log(EVL), [0,1], [0], optimize=True)
@@ -272,11 +286,13 @@ def get_purity(rho):
     r'''get the purity of a density matrix
 
     Parameters:
-        rho (np.ndarray,torch.Tensor): a density matrix, shape=(dim,dim)
+        rho (np.ndarray,torch.Tensor,tuple): a density matrix, shape=(dim,dim), or the factored form `(matY,prob)`
 
     Returns:
         ret (float): the purity of the density matrix
     '''
+    if isinstance(rho, tuple):
+        rho = _get_factor_gram(*rho)
     assert (rho.ndim==2) and (rho.shape[0]==rho.shape[1])
     # ret = np.trace(rho @ rho).real
     tmp0 = rho.reshape(-1)
@@ -290,10 +306,8 @@ def get_purity(rho):
 
 def _get_psd_logm(mat, method):
     if isinstance(mat, torch.Tensor):
-        eps = torch.tensor(torch.finfo(mat.dtype).eps)
         if method=='eigen':
-            EVL,EVC = torch.linalg.eigh(mat)
-            ret = (EVC * torch.log(torch.maximum(eps, EVL))) @ EVC.T.conj()
+            ret = numqi._torch_op.get_psd_matrix_spectral(mat, 'log')
         else:
             assert (len(method)==3) and (method[0]=='pade')
             logm_op = numqi._torch_op.get_PSDMatrixLogm(int(method[1]), int(method[2]))
@@ -312,38 +326,48 @@ def get_relative_entropy(rho, sigma, tr_rho_log_rho:float=None, _torch_logm=('pa
     $$ S(\rho,\sigma) = \mathrm{Tr}(\rho \log\rho - \rho \log\sigma) $$
 
     Parameters:
-        rho (np.ndarray,torch.Tensor): a density matrix, shape=(dim,dim)
-        sigma (np.ndarray,torch.Tensor): a density matrix, shape=(dim,dim)
-        tr_rho_log_rho (float,None): tr(rho log(rho)), if None, calculate it
-        _torch_logm (str,tuple): 'eigen' or ('pade',num_sqrtm,pade_order), 'pade' is used only when requires_grad
+        rho (np.ndarray,torch.Tensor,tuple): a density matrix, shape=(dim,dim), the leading dimensions (if any) are batch dimensions.
+            Or the factored form `(matY,prob)` with $\rho=Y\mathrm{diag}(p)Y^\dagger$, `matY.shape=(...,dim,rank)`,
+            then $\mathrm{Tr}(\rho\log\rho)$ is evaluated on a `(rank,rank)` matrix
+        sigma (np.ndarray,torch.Tensor): a density matrix, shape=(dim,dim) or with the same batch dimensions as `rho`
+        tr_rho_log_rho (float,np.ndarray,torch.Tensor,None): tr(rho log(rho)), if None, calculate it
+        _torch_logm (str,tuple): 'eigen' or ('pade',num_sqrtm,pade_order), 'pade' is used only when requires_grad,
+            'eigen' uses one eigen-decomposition with the Daleckii-Krein gradient `numqi._torch_op.get_psd_matrix_spectral`
 
     Returns:
-        ret (float,torch.Tensor): the relative entropy of the density matrices
+        ret (float,np.ndarray,torch.Tensor): the relative entropy of the density matrices, of the batch shape if batched
     '''
+    is_factor = isinstance(rho, tuple)
+    if is_factor:
+        matY,prob = rho
+        rho = _get_factor_gram(matY, prob) #only used for tr(rho log rho)
     is_torch = isinstance(rho, torch.Tensor)
     if is_torch:
-        eps = torch.tensor(torch.finfo(rho.dtype).eps)
         assert (_torch_logm=='eigen') or ((len(_torch_logm)==3) and (_torch_logm[0]=='pade'))
         if (rho.requires_grad or sigma.requires_grad) and (_torch_logm!='eigen'):
             tmp0 = numqi._torch_op.get_PSDMatrixLogm(int(_torch_logm[1]), int(_torch_logm[2]))
             log_sigma = tmp0(sigma)
         else:
-            EVL,EVC = torch.linalg.eigh(sigma)
-            log_sigma = (EVC * torch.log(torch.maximum(eps, EVL))) @ EVC.T.conj()
-        ret = - torch.vdot(rho.reshape(-1), log_sigma.reshape(-1)).real
+            log_sigma = numqi._torch_op.get_psd_matrix_spectral(sigma, 'log')
+        if is_factor:
+            ret = - (((matY.conj() * (log_sigma @ matY)).sum(dim=-2)).real * prob).sum(dim=-1)
+        else:
+            ret = - (rho.conj() * log_sigma).sum(dim=(-2,-1)).real
         if tr_rho_log_rho is None:
-            EVL = torch.maximum(eps, torch.linalg.eigvalsh(rho))
-            ret = ret + torch.dot(EVL, torch.log(EVL))
+            ret = ret - numqi._torch_op.get_psd_matrix_spectral(rho, 'entropy')
         else:
             ret = tr_rho_log_rho + ret
     else: #numpy
         eps = np.finfo(rho.dtype).eps
         EVL,EVC = np.linalg.eigh(sigma)
-        log_sigma = (EVC * np.log(np.maximum(eps, EVL))) @ EVC.T.conj()
-        ret = - np.vdot(rho.reshape(-1), log_sigma.reshape(-1)).real
+        log_sigma = (EVC * np.log(np.maximum(eps, EVL))[...,np.newaxis,:]) @ EVC.swapaxes(-2,-1).conj()
+        if is_factor:
+            ret = - (((matY.conj() * (log_sigma @ matY)).sum(axis=-2)).real * prob).sum(axis=-1)
+        else:
+            ret = - (rho.conj() * log_sigma).sum(axis=(-2,-1)).real
         if tr_rho_log_rho is None:
             EVL = np.maximum(eps, np.linalg.eigvalsh(rho))
-            ret = ret + np.dot(EVL, np.log(EVL))
+            ret = ret + (EVL * np.log(EVL)).sum(axis=-1)
         else:
             ret = tr_rho_log_rho + ret
     return ret
@@ -398,3 +422,71 @@ def is_positive_semi_definite(np0:np.ndarray, shift:float=0.0, hermitian_eps:flo
     except np.linalg.LinAlgError:
         ret = False
     return ret
+
+
+_SWEEP_WORKER_SOLVER = None
+
+def _sweep_worker_init(hf_setup, setup_args, tag_single_thread):
+    global _SWEEP_WORKER_SOLVER
+    if tag_single_thread and (torch.get_num_threads()!=1):
+        torch.set_num_threads(1)
+    _SWEEP_WORKER_SOLVER = hf_setup(*setup_args)
+
+
+def _sweep_worker_run(index_list, item_list):
+    # the chunks are dispatched dynamically, the state of the previous chunk (e.g. warm start) is unrelated
+    if hasattr(_SWEEP_WORKER_SOLVER, 'reset'):
+        _SWEEP_WORKER_SOLVER.reset()
+    ret = [(x,_SWEEP_WORKER_SOLVER(y)) for x,y in zip(index_list,item_list)]
+    return ret
+
+
+def run_parallel_sweep(hf_setup, setup_args:tuple, item_list:list, num_worker:int=1, use_tqdm:bool=True,
+                tag_single_thread:bool=True, hf_callback=None):
+    r'''evaluate a sweep of independent items (e.g. directions of the numerical range), sharded over spawn processes.
+    The solver `hf_setup(*setup_args)` (e.g. the compiled cvxpy problem, the torch model) is built once per worker,
+    then `solver(item)` is evaluated for each item in the contiguous chunk assigned to the worker. If the solver
+    carries state between the items (e.g. warm start), it should provide `solver.reset()` which is called at the
+    start of each chunk, since a worker may receive the chunks in any order.
+
+    Parameters:
+        hf_setup (callable): `hf_setup(*setup_args)` returns the callable `solver(item)`, must be picklable (module-level function)
+        setup_args (tuple): arguments of `hf_setup`, must be picklable
+        item_list (list): list of items
+        num_worker (int): number of workers, if `1`, evaluate in the current process
+        use_tqdm (bool): if `True`, then use tqdm to show the progress
+        tag_single_thread (bool): if True, use single thread of torch for each worker
+        hf_callback (callable,None): `hf_callback(index, result)` is called in the current process once the result is available
+
+    Returns:
+        ret (list): results in the same order of `item_list`
+    '''
+    num_item = len(item_list)
+    num_worker = max(1, min(int(num_worker), num_item))
+    ret = [None]*num_item
+    if num_worker==1:
+        solver = hf_setup(*setup_args)
+        if hasattr(solver, 'reset'):
+            solver.reset()
+        for ind0,item in enumerate(tqdm(item_list) if use_tqdm else item_list):
+            ret[ind0] = solver(item)
+            if hf_callback is not None:
+                hf_callback(ind0, ret[ind0])
+    else:
+        # contiguous chunks, so that the neighbouring items (e.g. warm start) are in the same worker
+        chunk_list = [x for x in np.array_split(np.arange(num_item), min(num_item, 4*num_worker)) if len(x)]
+        pbar = tqdm(total=num_item) if use_tqdm else None
+        # https://github.com/pytorch/pytorch/wiki/Autograd-and-Fork
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_worker, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_sweep_worker_init, initargs=(hf_setup, setup_args, tag_single_thread)) as executor:
+            job_list = [executor.submit(_sweep_worker_run, x.tolist(), [item_list[y] for y in x]) for x in chunk_list]
+            for job_i in concurrent.futures.as_completed(job_list):
+                for ind0,ret_i in job_i.result():
+                    ret[ind0] = ret_i
+                    if hf_callback is not None:
+                        hf_callback(ind0, ret_i)
+                if pbar is not None:
+                    pbar.update(len(job_i.result()))
+        if pbar is not None:
+            pbar.close()
+    return ret
@@ -25,6 +25,38 @@ def test_qudit_partial_trace_AC_to_AB():
                 assert np.all(np.linalg.eigvalsh(ret0)+1e-7>0) #almost PSD (ignoring rounding error)
 
 
+def test_partial_trace_ABk_to_AB_fused():
+    for dimA,dimB,k in [(2,2,3), (3,3,4), (2,4,3)]:
+        Brsab = numqi.dicke.get_partial_trace_ABk_to_AB_index(k, dimB, return_tensor=True)
+        num_klist = numqi.dicke.get_dicke_number(k, dimB)
+        np0 = np.random.randn(dimA,num_klist) + 1j*np.random.randn(dimA,num_klist)
+        ret_ = np.einsum(np0, [0,1], Brsab, [2,3,1,4], np0.conj(), [5,4], [0,2,5,3], optimize=True).reshape(dimA*dimB,-1)
+        Bij = numqi.dicke.get_partial_trace_ABk_to_AB_index(k, dimB, fused=True)
+        assert np.abs(numqi.dicke.partial_trace_ABk_to_AB(np0, Bij) - ret_).max() < 1e-10
+        Bij_torch = (Bij[0],) + tuple(torch.tensor(x) for x in Bij[1:])
+        torch0 = torch.tensor(np0, requires_grad=True)
+        ret0 = numqi.dicke.partial_trace_ABk_to_AB(torch0, Bij_torch)
+        assert np.abs(ret0.detach().numpy() - ret_).max() < 1e-10
+        tmp0 = torch.tensor(np.random.randn(*ret_.shape) + 1j*np.random.randn(*ret_.shape))
+        torch.vdot(ret0.reshape(-1), tmp0.reshape(-1)).real.backward()
+        torch1 = torch.tensor(np0, requires_grad=True)
+        ret1 = torch.einsum(torch1, [0,1], torch.tensor(Brsab), [2,3,1,4], torch1.conj(), [5,4], [0,2,5,3]).reshape(dimA*dimB,-1)
+        torch.vdot(ret1.reshape(-1), tmp0.reshape(-1)).real.backward()
+        assert torch.abs(torch0.grad - torch1.grad).max().item() < 1e-10
+
+
+def test_partial_trace_ABk_to_AB_batch():
+    dimA,dimB,k,batch_size = 2,3,4,3
+    num_klist = numqi.dicke.get_dicke_number(k, dimB)
+    Bij = numqi.dicke.get_partial_trace_ABk_to_AB_index(k, dimB, fused=True)
+    Bij_torch = (Bij[0],) + tuple(torch.tensor(x) for x in Bij[1:])
+    np0 = np.random.randn(batch_size,dimA,num_klist) + 1j*np.random.randn(batch_size,dimA,num_klist)
+    ret_ = np.stack([numqi.dicke.partial_trace_ABk_to_AB(x, Bij) for x in np0])
+    assert np.abs(numqi.dicke.partial_trace_ABk_to_AB(np0, Bij) - ret_).max() < 1e-10
+    ret0 = numqi.dicke.partial_trace_ABk_to_AB(torch.tensor(np0), Bij_torch).numpy()
+    assert np.abs(ret0 - ret_).max() < 1e-10
+
+
 def test_get_dicke_klist():
     para_list = [(2,2), (2,3), (2,4), (2,5), (3,2), (3,3), (3,4), (3,5)]
     for n,d in para_list:
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.optimize
 import torch
 
 import numqi
@@ -51,3 +52,54 @@ def test_convex_hull_approximation_iterative():
     ret_ = numqi.entangle.hf_interpolate_dm(dm0, beta=beta)
     ret0 = np.einsum(lambda_,[0],ketA,[0,1],ketA.conj(),[0,3],ketB,[0,2],ketB.conj(),[0,4],[1,2,3,4],optimize=True).reshape(dm0.shape)
     assert np.abs(ret_-ret0).max() < 1e-6
+
+
+def test_cha_ray_simplex():
+    np_rng = np.random.default_rng()
+    dim,num_state = 8,60
+    vec_target = np_rng.normal(size=dim)
+    vec_target /= np.linalg.norm(vec_target)
+    solver = numqi.entangle.cha._CHARaySimplex(vec_target, num_state)
+    matA = np_rng.normal(size=(num_state,dim))
+    for ind0 in range(3):
+        if ind0==0:
+            solver.set_column(matA)
+        else: #warm start
+            mask = solver.probability < 1e-7
+            matA[mask] = np_rng.normal(size=(mask.sum(),dim))
+            solver.set_column(matA[mask], mask)
+        beta = solver.solve()
+        assert np.abs(solver.probability @ matA - beta*vec_target).max() < 1e-8
+        assert abs(solver.probability.sum()-1) < 1e-8
+        tmp0 = np.zeros((dim+1,num_state+1))
+        tmp0[:dim,:num_state] = matA.T
+        tmp0[:dim,num_state] = -vec_target
+        tmp0[dim,:num_state] = 1
+        tmp1 = scipy.optimize.linprog(np.eye(num_state+1)[-1]*-1, A_eq=tmp0, b_eq=np.eye(dim+1)[-1],
+                    bounds=[(0,None)]*num_state+[(None,None)])
+        assert abs(beta+tmp1.fun) < 1e-8
+        assert solver.status=='optimal'
+
+    # the simplex stops early, the result comes from cvxpy instead of the suboptimal basis
+    solver = numqi.entangle.cha._CHARaySimplex(vec_target, num_state)
+    solver.set_column(matA)
+    beta0 = solver.solve(maxiter=2)
+    assert solver.status=='maxiter'
+    assert abs(beta0-beta) < 1e-6
+    assert np.abs(solver.probability @ matA - beta0*vec_target).max() < 1e-6
+
+    # singular warm basis, restart from phase-1
+    class _SingularSimplex(numqi.entangle.cha._CHARaySimplex):
+        num_fail = 0
+        def _refactor(self):
+            if self.num_fail>0:
+                self.num_fail -= 1
+                return False
+            return super()._refactor()
+    solver = _SingularSimplex(vec_target, num_state)
+    solver.set_column(matA)
+    solver.solve()
+    solver.num_fail = 1
+    beta1 = solver.solve()
+    assert (solver.status=='optimal') and (solver.num_fail==0)
+    assert abs(beta1-beta) < 1e-8
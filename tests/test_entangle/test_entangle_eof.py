@@ -61,6 +61,30 @@ def test_EntanglementFormationModel_werner():
         assert np.abs(ret_-ret0).max() < 1e-7
 
 
+def test_EntanglementFormationModel_batch():
+    for dim in [2,3]:
+        alpha_list = np.linspace(-1, 1, 10)
+        model = numqi.entangle.EntanglementFormationModel(dim, dim, 2*dim*dim, batch_size=len(alpha_list))
+        model.set_density_matrix(np.stack([numqi.state.Werner(dim, x) for x in alpha_list]))
+        ret0 = numqi.optimize.minimize_batch(model, num_repeat=3, tol=1e-10)
+        assert np.abs(numqi.state.get_Werner_eof(dim, alpha_list)-ret0).max() < 1e-7
+
+        alpha_list = np.linspace(-1/(dim*dim-1), 1, 10)
+        model.set_density_matrix(np.stack([numqi.state.Isotropic(dim, x) for x in alpha_list]))
+        ret0 = numqi.optimize.minimize_batch(model, num_repeat=3, tol=1e-10)
+        assert np.abs(numqi.state.get_Isotropic_eof(dim, alpha_list)-ret0).max() < 1e-7
+
+    # entangled states only, the optimum of a separable state is non-smooth and stalls the joint line search
+    alpha_list = np.linspace(0.6, 1, 6)
+    rho = np.stack([numqi.state.Werner(2, x) for x in alpha_list])
+    model = numqi.entangle.ConcurrenceModel(2, 2, num_term=12, rank=4, batch_size=len(rho))
+    model.set_density_matrix(rho)
+    ret0 = numqi.optimize.minimize_batch(model, theta0='uniform', num_repeat=3, tol=1e-10)
+    assert np.abs(np.array([numqi.entangle.get_concurrence_2qubit(x) for x in rho])-ret0).max() < 1e-7
+    loss = model()
+    assert (not model.loss_batch.requires_grad) and loss.requires_grad
+
+
 def test_2qubits_Concurrence_EntanglementFormation():
     dimA = 2
     dimB = 2
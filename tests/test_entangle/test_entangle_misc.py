@@ -62,3 +62,16 @@ def test_werner_state():
             assert not tmp0 #only d==2 is correct
         else:
             assert tmp0
+
+
+def test_ree_bisection_solve():
+    np_rng = np.random.default_rng(233)
+    xtol = 1e-4
+    maxiter = int(np.ceil(np.log2(1/xtol)))
+    for _ in range(20):
+        x_star = np_rng.uniform(0.1, 0.9)
+        coeff = np_rng.uniform(0.2, 5)
+        hf0 = lambda x: coeff*max(x-x_star,0)**2
+        beta,history_info = numqi.entangle._misc._ree_bisection_solve(hf0, 0, 1, xtol, 1e-7, use_tqdm=False)
+        assert abs(beta-x_star-np.sqrt(1e-7/coeff)) < xtol/2
+        assert len(history_info) < maxiter
@@ -27,6 +27,35 @@ def test_is_ppt():
         assert numqi.entangle.is_ppt(tmp0, dim)==False
 
 
+def test_separability_prescreen_batch():
+    dm_tiles = numqi.entangle.load_upb('tiles', return_bes=True)[1]
+    rho_list = np.stack([dm_tiles, np.eye(9)/9, numqi.state.Werner(3, 0.9), numqi.state.Isotropic(3, 0.1)]
+                + [numqi.random.rand_density_matrix(9) for _ in range(6)])
+    ret0 = numqi.entangle.is_ppt(rho_list, (3,3))
+    assert np.array_equal(ret0, [numqi.entangle.is_ppt(x, (3,3)) for x in rho_list])
+    ret0 = numqi.entangle.check_reduction_witness(rho_list, (3,3))
+    assert np.array_equal(ret0, [numqi.entangle.check_reduction_witness(x, (3,3)) for x in rho_list])
+    ret0 = numqi.entangle.is_generalized_ppt(rho_list, (3,3))
+    assert np.array_equal(ret0, [numqi.entangle.is_generalized_ppt(x, (3,3)) for x in rho_list])
+    info = numqi.entangle.is_generalized_ppt(rho_list, (3,3), return_info=True)[1]
+    tmp0 = [numqi.entangle.is_generalized_ppt(x, (3,3), return_info=True)[1] for x in rho_list]
+    assert all(np.abs(x[2]-np.array([y[ind0][2] for y in tmp0])).max()<1e-10 for ind0,x in enumerate(info))
+    ret0 = numqi.entangle.get_negativity(rho_list, (3,3))
+    assert np.abs(ret0 - np.array([numqi.entangle.get_negativity(x, (3,3)) for x in rho_list])).max() < 1e-10
+    tag,info = numqi.entangle.get_separability_prescreen(rho_list, (3,3), return_info=True)
+    # tiles BES is PPT but violates the realignment criterion
+    assert (tag[0]==-1) and (info[0]=='realignment')
+    assert (tag[1]==1) and (info[1]=='ball')
+    assert (tag[2]==-1) and (info[2]=='ppt')
+    # isotropic state with alpha=0.1 is inside the separable ball
+    assert (tag[3]==1) and (info[3]=='ball')
+    assert np.all((tag==-1)==(~numqi.entangle.is_ppt(rho_list, (3,3)) | ~numqi.entangle.check_realignment_criterion(rho_list, (3,3))))
+
+    dim = (2,3) #PPT is necessary and sufficient
+    rho_list = np.stack([numqi.random.rand_bipartite_state(*dim, k=x, return_dm=True) for x in [1,1,2,2]])
+    assert np.array_equal(numqi.entangle.get_separability_prescreen(rho_list, dim), [1,1,-1,-1])
+
+
 def _test_cvx_matrix_xlogx_hf0(Y, sqrt_order, pade_order):
     # maximize_X tr(X) - tr(XlogX) + tr(XlogY)
     # solution: tr(Y)
@@ -71,6 +100,21 @@ def test_cvx_matrix_xlogx():
     _test_cvx_matrix_xlogx_hf0(Y, sqrt_order=3, pade_order=3)
 
 
+def test_get_ppt_ree_cached_problem():
+    # re-solving the cached problem should not warm start from the previous density matrix
+    dimA,dimB = 2,2
+    rho_list = [numqi.random.rand_bipartite_state(dimA, dimB, k=2, return_dm=True) for _ in range(3)]
+    kwargs = dict(sqrt_order=3, pade_order=3, use_tqdm=False)
+    hf0 = numqi.entangle.ppt._get_ppt_ree_problem
+    ret_ = []
+    for rho in rho_list:
+        hf0.cache_clear()
+        ret_.append(numqi.entangle.get_ppt_ree(rho, dimA, dimB, **kwargs))
+    hf0.cache_clear()
+    ret0 = numqi.entangle.get_ppt_ree(np.stack(rho_list), dimA, dimB, **kwargs)
+    assert np.abs(np.array(ret_) - ret0).max() < 1e-7
+
+
 def test_cvx_relative_entropy_entanglement_random():
     dimA = 2
     dimB = 2
@@ -127,6 +171,11 @@ def test_cvx_relative_entropy_entanglement_werner01():
     ret0 = numqi.entangle.get_ppt_ree(dm_list, dim, dim, sqrt_order=3, pade_order=3, use_tqdm=False)
     assert np.abs(ret_-ret0).max() < 1e-4 #1e-5 fail for solver=SCS
 
+    # the compiled problem is cached, the second call only updates the parameter
+    ret1 = np.array([numqi.entangle.get_ppt_ree(x, dim, dim, sqrt_order=3, pade_order=3, use_tqdm=False) for x in dm_list[:3]])
+    assert np.abs(ret_[:3]-ret1).max() < 1e-4
+    assert numqi.entangle.ppt._get_ppt_ree_problem.cache_info().hits >= 3
+
 # TODO rename all rho to dm
 
 def test_get_ppt_boundary():
@@ -186,6 +235,9 @@ def test_get_ppt_numerical_range():
     ret_ = np.array([s12, 1/2, s12, 1/2])
     assert np.abs(ret_-z0).max() < (1e-6 if USE_MOSEK else 1e-4)
 
+    z1 = numqi.entangle.get_ppt_numerical_range([op0,op1], direction, dim=(2,2), use_tqdm=False, num_worker=2)
+    assert np.abs(ret_-z1).max() < (1e-6 if USE_MOSEK else 1e-4)
+
 
 def test_get_generalized_ppt_boundary():
     rho = numqi.entangle.load_upb('tiles', return_bes=True)[1]
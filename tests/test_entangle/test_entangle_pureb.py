@@ -47,6 +47,21 @@ def test_pureb_werner2_ree():
             assert abs(ret0-ret_) < 1e-8
 
 
+def test_pureb_werner2_ree_batch():
+    dim = 2
+    kext = 16
+    alpha_kext_boundary = (kext+dim**2-dim)/(kext*dim+dim-1)
+    alpha_list = np.concatenate([np.linspace(0, alpha_kext_boundary, 4), np.linspace(alpha_kext_boundary, 1, 4, endpoint=False)])
+    dm_target = np.stack([numqi.state.Werner(dim, x) for x in alpha_list])
+    dm_kext_boundary = numqi.state.Werner(dim, alpha_kext_boundary)
+    ret_ = np.array([(numqi.utils.get_relative_entropy(x, dm_kext_boundary) if y>alpha_kext_boundary else 0) for x,y in zip(dm_target,alpha_list)])
+    model = numqi.entangle.PureBosonicExt(dim, dim, kext=kext, distance_kind='ree', batch_size=len(alpha_list))
+    ret0 = model.minimize_batch(dm_target, num_repeat=3, tol=1e-12)
+    assert ret0.shape==(len(alpha_list),)
+    assert np.abs(ret0-ret_).max() < 1e-7
+    assert np.abs(model.loss_batch.numpy()-ret0).max() < 1e-12
+
+
 def test_pureb_boundary_werner2():
     # about 10 seconds
     dim = 2
@@ -98,6 +113,17 @@ def test_pureb_boundary_isotropic2():
         assert abs(beta0-beta_) < 5e-4
 
 
+def test_pureb_boundary_werner2_warm_start():
+    dim = 2
+    dm0 = numqi.state.Werner(2, 1)
+    for kext in [5,16]:
+        alpha_kext_boundary = (kext+dim**2-dim)/(kext*dim+dim-1)
+        model = numqi.entangle.PureBosonicExt(dim, dim, kext=kext, distance_kind='ree')
+        beta0 = model.get_boundary(dm0, xtol=1e-4, converge_tol=1e-10, threshold=1e-7, num_repeat=3, use_tqdm=False, warm_start=True)
+        beta_ = numqi.gellmann.dm_to_gellmann_norm(numqi.state.Werner(dim, alpha_kext_boundary))
+        assert abs(beta0-beta_) < 5e-4
+
+
 def test_pureb_ree_seperable():
     # about 20 seconds
     # (3,3,8) fail with a relatively low probability
@@ -142,3 +168,14 @@ def test_pureb_boundary_tiles_upb_bes_k16():
 # def test_pureb_boundary_tiles_upb_bes_k32():
 #     # obtained from previous running
 #     _pureb_boundary_tiles_upb_bes_hf0(kext=32, ret_=0.231290449794623)
+
+
+def test_pureb_numerical_range_parallel():
+    dimA,dimB,kext = 2,2,8
+    op0,op1 = [numqi.random.rand_hermitian_matrix(dimA*dimB, seed=np_rng) for _ in range(2)]
+    model = numqi.entangle.PureBosonicExt(dimA, dimB, kext=kext)
+    kwargs = dict(num_theta=5, num_repeat=3, converge_tol=1e-10, use_tqdm=False)
+    ret_ = model.get_numerical_range(op0, op1, **kwargs)
+    ret0 = model.get_numerical_range(op0, op1, num_worker=2, **kwargs)
+    assert ret0.shape==(5,2)
+    assert np.abs(ret_-ret0).max() < 1e-4
@@ -75,6 +75,11 @@ def test_werner_state_kext():
     ret0 = numqi.entangle.is_ABk_symmetric_ext(dm_list, (dim,dim), kext, use_ppt=False)
     assert all((not x) for x in ret0)
 
+    # batch over worker processes, same result in the same order
+    dm_list = [numqi.state.Werner(dim,x) for x in np.concatenate([alpha_yes_list, alpha_no_list])]
+    ret1 = numqi.entangle.is_ABk_symmetric_ext(dm_list, (dim,dim), kext, use_ppt=False, num_worker=2)
+    assert np.array_equal(ret1, [True]*5 + [False]*5)
+
     rho = numqi.state.Werner(dim, boundary)
     ret_ = numqi.gellmann.dm_to_gellmann_norm(rho)
     ret0 = numqi.entangle.get_ABk_symmetric_extension_boundary(rho, (dim,dim), kext, use_ppt=False, use_boson=False)
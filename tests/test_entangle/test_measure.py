@@ -25,6 +25,27 @@ def test_werner_gme():
     assert np.abs(ret-ret_analytical).max() < 1e-7
 
 
+def test_werner_gme_batch():
+    alpha_list = np_rng.uniform(0, 1, 10)
+    dim = 3
+    model = numqi.entangle.DensityMatrixGMEModel([dim,dim], num_ensemble=27, batch_size=len(alpha_list))
+    model.set_density_matrix(np.stack([numqi.state.Werner(dim, alpha=x) for x in alpha_list]))
+    ret = numqi.optimize.minimize_batch(model, num_repeat=3, tol=1e-10)
+    ret_analytical = numqi.state.get_Werner_GME(dim, alpha_list)
+    assert np.abs(ret-ret_analytical).max() < 1e-7
+    assert np.abs(model.loss_batch.numpy()-ret).max() < 1e-12
+
+    # CPrank>1, same result as the single target model
+    rho_list = [numqi.random.rand_density_matrix(4) for _ in range(3)]
+    model = numqi.entangle.DensityMatrixGMEModel([2,2], num_ensemble=8, CPrank=2, batch_size=len(rho_list))
+    model.set_density_matrix(np.stack(rho_list))
+    ret = numqi.optimize.minimize_batch(model, num_repeat=3, tol=1e-12)
+    model = numqi.entangle.DensityMatrixGMEModel([2,2], num_ensemble=8, CPrank=2)
+    for rho,ret_i in zip(rho_list, ret):
+        model.set_density_matrix(rho)
+        assert abs(numqi.optimize.minimize(model, num_repeat=3, tol=1e-12, print_every_round=0).fun - ret_i) < 1e-7
+
+
 def test_isotropic_gme():
     alpha_list = np_rng.uniform(0, 1, 10)
     dim = 3
@@ -67,6 +67,39 @@ def test_Trace1PSD():
                 assert np.abs(x0 - x1).max() < 1e-10
 
 
+def test_Trace1PSD_factor():
+    batch_size = 3
+    dim = 7
+    for method in ['cholesky','ensemble','riemann']:
+        for rank in [1,3]:
+            manifold = numqi.manifold.density_matrix(dim, rank, batch_size, method=method, return_factor=True)
+            matY,prob = manifold()
+            assert (matY.shape==(batch_size,dim,rank)) and (prob.shape==(batch_size,rank))
+            rho = ((matY*prob.unsqueeze(-2)) @ matY.transpose(-1,-2).conj()).detach()
+            manifold.return_factor = False
+            assert torch.abs(manifold() - rho).max().item() < 1e-10
+            # toggling return_factor is not hidden by the memoized forward
+            with torch.no_grad():
+                assert isinstance(manifold(), torch.Tensor)
+                manifold.return_factor = True
+                assert isinstance(manifold(), tuple)
+            if method!='riemann':
+                tmp0 = manifold.theta.detach().numpy()
+                hf0 = numqi.manifold.to_trace1_psd_cholesky if method=='cholesky' else numqi.manifold.to_trace1_psd_ensemble
+                Y_np,p_np = hf0(tmp0, dim, rank, return_factor=True)
+                assert np.abs(((Y_np*p_np[:,np.newaxis]) @ Y_np.transpose(0,2,1).conj()) - rho.numpy()).max() < 1e-10
+
+    manifold = numqi.manifold.density_matrix(dim, rank=3, method='ensemble', return_factor=True)
+    matY,prob = manifold()
+    rho = (matY*prob) @ matY.T.conj()
+    sigma = torch.tensor(numqi.random.rand_density_matrix(dim, seed=np_rng), dtype=torch.complex128)
+    for x,y in [((matY,prob),rho), ((matY.detach().numpy(),prob.detach().numpy()),rho.detach().numpy())]:
+        assert abs(numqi.utils.get_purity(x) - numqi.utils.get_purity(y)) < 1e-10
+        assert abs(numqi.utils.get_von_neumann_entropy(x) - numqi.utils.get_von_neumann_entropy(y)) < 1e-7
+        z = sigma if isinstance(y, torch.Tensor) else sigma.numpy()
+        assert abs(numqi.utils.get_relative_entropy(x, z) - numqi.utils.get_relative_entropy(y, z)) < 1e-7
+
+
 class DummyModel00(torch.nn.Module):
     def __init__(self, dm0):
         super().__init__()
@@ -159,11 +192,24 @@ def test_DiscreteProbabilitty():
         assert np.abs(x0-x1).max() < 1e-10
 
 
+def test_SeparableDensityMatrix():
+    dimA,dimB,num_cha = 3,4,7
+    for batch_size in [None,2]:
+        manifold = numqi.manifold.SeparableDensityMatrix(dimA, dimB, num_cha, batch_size=batch_size)
+        ret = manifold().detach().numpy()
+        prob = manifold.manifold_p().detach().numpy().reshape(-1, num_cha)
+        psiA = manifold.manifold_psiA().detach().numpy().reshape(-1, num_cha, dimA)
+        psiB = manifold.manifold_psiB().detach().numpy().reshape(-1, num_cha, dimB)
+        ret_ = np.einsum(prob, [5,0], psiA, [5,0,1], psiA.conj(), [5,0,3], psiB, [5,0,2], psiB.conj(), [5,0,4], [5,1,2,3,4], optimize=True)
+        assert ret.shape==(((batch_size,) if batch_size else ())+(dimA,dimB,dimA,dimB))
+        assert np.abs(ret.reshape(ret_.shape)-ret_).max() < 1e-12
+
+
 def test_Stiefel():
     batch_size = 3
     for dim,rank in [(7,1), (7,3), (7,7)]:
         for dtype in [torch.float64, torch.complex128]:
-            for method in ['choleskyL','qr','so-cayley','so-exp','polar']:
+            for method in ['choleskyL','qr','so-cayley','so-exp','polar','cayley']:
                 manifold = numqi.manifold.Stiefel(dim, rank, batch_size, method=method, dtype=dtype)
                 x0 = manifold().detach().numpy()
                 assert np.abs(x0.conj().transpose(0,2,1) @ x0 - np.eye(rank)).max() < 1e-10
@@ -178,6 +224,35 @@ def test_Stiefel():
                 elif method=='polar':
                     x1 = numqi.manifold.to_stiefel_polar(tmp0, dim, rank)
                     assert np.abs(x0-x1).max() < 1e-10
+                elif method=='cayley':
+                    x1 = numqi.manifold.to_stiefel_cayley(tmp0, dim, rank)
+                    assert np.abs(x0-x1).max() < 1e-10
+
+
+def test_manifold_memoize():
+    manifold = numqi.manifold.Stiefel(7, 3, dtype=torch.complex128)
+    x0 = manifold()
+    with torch.no_grad():
+        assert torch.equal(manifold(), x0)
+        # the hit is a fresh tensor, and the in-place modification of the returned output is not cached
+        x1 = manifold()
+        assert x1.data_ptr()!=x0.data_ptr()
+        x0.mul_(0)
+        x1.mul_(0)
+        assert torch.abs(manifold()).max().item() > 0.1
+    # numqi.optimize writes the parameter without bumping the version counter
+    numqi.optimize.set_model_flat_parameter(manifold, np_rng.uniform(-1, 1, size=manifold.theta.numel()))
+    with torch.no_grad():
+        x1 = manifold().numpy()
+    assert np.abs(x1-numqi.manifold.to_stiefel_polar(manifold.theta.detach().numpy(), 7, 3)).max() < 1e-10
+    # the graph is never shared
+    manifold().abs().sum().backward()
+    manifold().abs().sum().backward()
+    with torch.no_grad():
+        manifold()
+        manifold.float()
+        assert manifold().dtype==torch.complex64
+
 
 def test_SpecialOrthogonal():
     batch_size = 3
@@ -327,3 +402,38 @@ def test_stiefel_euler():
         assert (torch1.dtype==torch.float32) or (torch1.dtype==torch.complex64)
         assert np.abs(np1-torch1.numpy()).max() < 1e-5
         assert np.abs(np1-torch2.numpy()).max() < 1e-10
+
+
+class _DummyStiefelTraceModel(torch.nn.Module):
+    def __init__(self, matH, rank, method):
+        super().__init__()
+        self.matH = torch.tensor(matH)
+        self.manifold = numqi.manifold.Stiefel(matH.shape[0], rank, dtype=self.matH.dtype, method=method)
+
+    def forward(self):
+        mat = self.manifold()
+        loss = torch.trace(mat.T.conj() @ self.matH @ mat).real
+        return loss
+
+
+def test_riemann_method():
+    dim = 6
+    rank = 2
+    for cls,kwargs in [(numqi.manifold.Sphere, dict(dim=dim, dtype=torch.complex128)),
+                (numqi.manifold.Trace1PSD, dict(dim=dim, rank=rank, dtype=torch.complex128)),
+                (numqi.manifold.SpecialOrthogonal, dict(dim=dim, dtype=torch.float64)),
+                (numqi.manifold.Stiefel, dict(dim=dim, rank=rank, dtype=torch.complex128))]:
+        manifold = cls(**kwargs)
+        x0 = manifold().detach().numpy().copy()
+        numqi.manifold.set_riemann_method(manifold)
+        assert manifold.method=='riemann'
+        assert np.abs(manifold().detach().numpy()-x0).max() < 1e-10
+
+    for dtype,retraction,method in [('float64','qr','riemann-lbfgs'), ('complex128','cayley','riemann-lbfgs'), ('complex128','qr','riemann-cg')]:
+        matH = numqi.random.rand_hermitian_matrix(dim, tag_complex=(dtype=='complex128'), seed=np_rng)
+        model = _DummyStiefelTraceModel(matH, rank, 'polar')
+        numqi.manifold.set_riemann_method(model, retraction)
+        theta_optim = numqi.optimize.minimize(model, 'normal', num_repeat=3, tol=1e-12, method=method, print_every_round=0)
+        assert abs(theta_optim.fun - np.linalg.eigvalsh(matH)[:rank].sum()) < 1e-7
+        mat = model.manifold().detach().numpy()
+        assert np.abs(mat.T.conj() @ mat - np.eye(rank)).max() < 1e-10
@@ -1,5 +1,6 @@
 import itertools
 import numpy as np
+import torch
 
 import numqi
 
@@ -33,6 +34,35 @@ def test_ABk2localHermitian():
         assert np.abs(ret_-ret0).max() < 1e-10
 
 
+def test_ABkHermitian_batch():
+    dimA,dimB,kext = 2,3,3
+    batch_size = 3
+    for hf0 in [numqi.manifold.ABkHermitian, numqi.manifold.ABk2localHermitian]:
+        layer = hf0(dimA, dimB, kext, batch_size=batch_size)
+        ret0 = layer()
+        assert ret0.shape==(batch_size, dimA*dimB**kext, dimA*dimB**kext)
+        ret0 = ret0.detach().numpy().copy()
+        layer1 = hf0(dimA, dimB, kext)
+        for ind0 in range(batch_size):
+            for x,y in zip(layer1.parameters(), layer.parameters()):
+                x.data.copy_(y.data[ind0])
+            assert np.abs(layer1().detach().numpy()-ret0[ind0]).max() < 1e-10
+        numqi.optimize.check_model_gradient(_ABkDummyModel(layer), tol=1e-6)
+
+
+class _ABkDummyModel(torch.nn.Module):
+    def __init__(self, layer):
+        super().__init__()
+        self.layer = layer
+        # normalized so that the loss is O(1), the round-off error of the finite difference is relative
+        tmp0 = np.random.default_rng().normal(size=layer().shape)
+        self.matH = torch.tensor(tmp0/tmp0.size, dtype=torch.complex128)
+
+    def forward(self):
+        loss = ((self.layer()*self.matH).sum().abs())**2
+        return loss
+
+
 def test_ABk_2local_symmetry_index():
     dimA_list = [1,2,3]
     dimB_list = [2,3]
@@ -1,8 +1,11 @@
+import json
 import numpy as np
 import torch
 
 import numqi
 
+np_rng = np.random.default_rng()
+
 class Rosenbrock(torch.nn.Module):
     def __init__(self, num_parameter=3) -> None:
         super().__init__()
@@ -20,3 +23,221 @@ class Rosenbrock(torch.nn.Module):
 def test_gradient_correct():
     model = Rosenbrock(num_parameter=5)
     numqi.optimize.check_model_gradient(model, zero_eps=1e-4)
+
+
+def test_get_model_hessian():
+    model = Rosenbrock(num_parameter=5)
+    ret_ = numqi.optimize.get_model_hessian(model, method='autograd')
+    ret0 = numqi.optimize.get_model_hessian(model, method='func')
+    assert np.abs(ret_-ret0).max() < 1e-10
+    vec = np_rng.normal(size=(3,5))
+    ret1 = numqi.optimize.get_model_hessian_vector_product(model, vec)
+    assert np.abs(ret1 - vec @ ret_.T).max() < 1e-10
+    ret2 = numqi.optimize.get_model_hessian_vector_product(model, vec[0])
+    assert np.abs(ret2 - ret_ @ vec[0]).max() < 1e-10
+
+
+def test_minimize_newton_cg():
+    model = Rosenbrock(num_parameter=5)
+    theta_optim = numqi.optimize.minimize(model, 'normal', num_repeat=1, tol=1e-10, method='Newton-CG', print_every_round=0)
+    assert abs(theta_optim.fun) < 1e-7
+    assert theta_optim.nhev > 0
+
+
+class _OldStyleSquare(torch.autograd.Function):
+    # forward(ctx,...) style without setup_context, not supported by torch.func
+    @staticmethod
+    def forward(ctx, x):
+        ctx.save_for_backward(x)
+        return x*x
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        x, = ctx.saved_tensors
+        return 2*x*grad_output
+
+
+class DummyOrthogonalModel(torch.nn.Module):
+    def __init__(self, dim, old_style=False):
+        super().__init__()
+        self.manifold = numqi.manifold.SpecialOrthogonal(dim, method='exp', dtype=torch.complex128)
+        self.target = numqi.manifold.SpecialOrthogonal(dim, method='exp', dtype=torch.complex128)().detach()
+        self.old_style = old_style
+
+    def forward(self):
+        tmp0 = (self.manifold() - self.target).reshape(-1)
+        tmp0 = torch.cat([tmp0.real, tmp0.imag])
+        ret = (_OldStyleSquare.apply(tmp0) if self.old_style else tmp0*tmp0).sum()
+        return ret
+
+
+def test_minimize_newton_cg_numqi_model():
+    for old_style in [False, True]:
+        model = DummyOrthogonalModel(3, old_style)
+        num_parameter = len(numqi.optimize.get_model_flat_parameter(model))
+        hessian = numqi.optimize.get_model_hessian(model, method='autograd')
+        vec = np_rng.normal(size=(2,num_parameter))
+        # only the old-style torch.autograd.Function falls back to the double backward
+        assert (numqi.optimize._internal._get_model_hessian_vector_product_func(model, vec) is None)==old_style
+        for method in ['func', 'autograd']:
+            ret0 = numqi.optimize.get_model_hessian_vector_product(model, vec, method=method)
+            assert np.abs(ret0 - vec @ hessian.T).max() < 1e-8
+        theta_optim = numqi.optimize.minimize(model, 'normal', num_repeat=3, tol=1e-12, method='Newton-CG', print_every_round=0)
+        assert theta_optim.fun < 1e-8
+
+
+class _CountedRosenbrock(Rosenbrock):
+    def __init__(self):
+        super().__init__(num_parameter=4)
+        self.num_forward = 0
+
+    def forward(self):
+        self.num_forward += 1
+        return super().forward()
+
+
+def test_hf_model_hessp_wrapper_num_forward():
+    # one forward per Hessian-vector product, the model is not restored after each call
+    model = _CountedRosenbrock()
+    hessp = numqi.optimize.hf_model_hessp_wrapper(model)
+    theta = np_rng.normal(size=4)
+    vec = np_rng.normal(size=4)
+    model.num_forward = 0
+    ret0 = hessp(theta, vec)
+    assert model.num_forward==1
+    numqi.optimize.set_model_flat_parameter(model, theta)
+    assert np.abs(ret0 - numqi.optimize.get_model_hessian(model, method='autograd') @ vec).max() < 1e-8
+
+
+class Rosenbrock2(Rosenbrock):
+    def __init__(self):
+        super().__init__(num_parameter=3)
+        self.theta1 = torch.nn.Parameter(torch.tensor(np_rng.normal(size=(2,2)), dtype=torch.float64))
+
+    def forward(self):
+        tmp0 = torch.concat([self.theta, self.theta1.reshape(-1)])
+        tmp1 = tmp0[1:] - tmp0[:-1]
+        tmp2 = 1-tmp0
+        ret = 100*torch.dot(tmp1, tmp1) + torch.dot(tmp2,tmp2)
+        return ret
+
+
+def test_register_model_flat_buffer():
+    model = Rosenbrock2()
+    theta0 = numqi.optimize.get_model_flat_parameter(model)
+    hf_model = numqi.optimize.hf_model_wrapper(model)
+    theta1 = np_rng.normal(size=theta0.size)
+    ret_ = hf_model(theta1)
+    theta_np = numqi.optimize.register_model_flat_buffer(model)
+    assert np.abs(theta_np - theta1).max() < 1e-12
+    theta_np[:] = theta0
+    assert np.abs(numqi.optimize.get_model_flat_parameter(model) - theta0).max() < 1e-12
+    hf_model = numqi.optimize.hf_model_wrapper(model)
+    ret0 = hf_model(theta1)
+    assert abs(ret_[0]-ret0[0]) < 1e-10
+    assert np.abs(ret_[1]-ret0[1]).max() < 1e-10
+    assert np.abs(numqi.optimize.get_model_flat_grad(model) - ret0[1]).max() < 1e-12
+
+    numqi.optimize.minimize_adam(model, num_step=10, theta0='uniform', tqdm_update_freq=0)
+    theta_optim = numqi.optimize.minimize(model, 'normal', num_repeat=1, tol=1e-10, print_every_round=0)
+    assert abs(theta_optim.fun) < 1e-7
+
+
+def test_minimize_profiler(tmp_path):
+    model = Rosenbrock(num_parameter=5)
+    profiler = numqi.optimize.MinimizeProfiler(tag_trace=True)
+    callback = numqi.optimize.MinimizeCallback(print_freq=1, tag_print=False)
+    theta_optim = numqi.optimize.minimize(model, 'normal', num_repeat=3, tol=1e-10,
+                    print_every_round=0, callback=callback, profiler=profiler)
+    report = profiler.report()
+    assert report['num_round']==3
+    assert all(x['ngev']==x['nfev']==len(x['fval_trace']) for x in report['round'])
+    assert report['nfev']==sum(x['nfev'] for x in report['round'])
+    assert abs(min(x['fun'] for x in report['round']) - theta_optim.fun) < 1e-12
+    for x in report['round']:
+        tmp0 = sum(x[k] for k in ['time_set_parameter','time_forward','time_backward','time_hessp','time_callback','time_overhead'])
+        assert abs(tmp0 - x['time_total']) < 1e-6
+    numqi.optimize.minimize_adam(model, num_step=10, theta0='uniform', tqdm_update_freq=0, profiler=profiler)
+    assert profiler.report()['round'][-1]['nfev']==10
+    filepath = tmp_path / 'profile.jsonl'
+    profiler.save_jsonl(filepath)
+    with open(filepath, 'r', encoding='utf-8') as fid:
+        tmp0 = [json.loads(x) for x in fid]
+    assert [x['nfev'] for x in tmp0]==[x['nfev'] for x in profiler.round_list]
+
+
+def test_minimize_checkpoint(tmp_path):
+    filepath = str(tmp_path / 'minimize.pkl')
+    model = Rosenbrock(num_parameter=5)
+    kwargs = dict(theta0='normal', num_repeat=3, tol=1e-10, print_every_round=0, seed=233)
+    ret_ = numqi.optimize.minimize(model, **kwargs)
+    callback = numqi.optimize.MinimizeCallback(print_freq=1, tag_print=False)
+    ret0 = numqi.optimize.minimize(model, **kwargs, callback=callback, checkpoint=filepath, checkpoint_freq=2)
+    assert abs(ret_.fun-ret0.fun) < 1e-12
+    ret1 = numqi.optimize.minimize(model, **kwargs, checkpoint=filepath) #finished, load directly
+    assert np.abs(ret1.x-ret0.x).max() < 1e-12
+
+    # interrupt in the second round
+    filepath = str(tmp_path / 'minimize-interrupt.pkl')
+    class _Interrupt(Exception):
+        pass
+    class _InterruptCallback(numqi.optimize.MinimizeCallback):
+        def __call__(self, theta, fval, grad=None):
+            if len(self.history_state)==1 and self.state['step']==5:
+                raise _Interrupt()
+            super().__call__(theta, fval, grad)
+    callback = _InterruptCallback(print_freq=1, tag_print=False)
+    is_interrupted = False
+    try:
+        numqi.optimize.minimize(model, **kwargs, callback=callback, checkpoint=filepath, checkpoint_freq=1)
+    except _Interrupt:
+        is_interrupted = True
+    assert is_interrupted
+    ret2 = numqi.optimize.minimize(model, **kwargs, checkpoint=filepath)
+    assert abs(ret_.fun-ret2.fun) < 1e-10
+
+
+def test_minimize_adam_checkpoint(tmp_path):
+    filepath = str(tmp_path / 'adam.pkl')
+    model = Rosenbrock(num_parameter=5)
+    kwargs = dict(num_step=50, theta0='uniform', optim_args=('adam',0.01,0.001), seed=233, tqdm_update_freq=0, tag_return_history=True)
+    ret_ = numqi.optimize.minimize_adam(model, **kwargs)
+
+    class _Interrupt(Exception):
+        pass
+    class _InterruptModel(Rosenbrock):
+        def forward(self):
+            self.num_call += 1
+            if self.num_call==45:
+                raise _Interrupt()
+            return super().forward()
+    model = _InterruptModel(num_parameter=5)
+    model.num_call = 0
+    try:
+        numqi.optimize.minimize_adam(model, **kwargs, checkpoint=filepath, checkpoint_freq=20)
+    except _Interrupt:
+        pass
+    ret0 = numqi.optimize.minimize_adam(model, **kwargs, checkpoint=filepath, checkpoint_freq=20)
+    assert model.num_call==(45+10+1) #restart from step 40, one more call to set the best parameter
+    assert abs(ret_[0]-ret0[0]) < 1e-10
+    assert np.abs(np.array(ret_[1])-np.array(ret0[1])).max() < 1e-10
+
+
+def test_sweep_checkpoint(tmp_path):
+    filepath = str(tmp_path / 'sweep.pkl')
+    np_rng = np.random.default_rng(233)
+    sweep_ckpt = numqi.optimize.SweepCheckpoint(filepath, np_rng)
+    num_call = []
+    def hf0(x):
+        num_call.append(x)
+        return x + np_rng.uniform()
+    hf1 = sweep_ckpt.wrap(hf0)
+    ret_ = [hf1(x) for x in range(3)]
+    z0 = np_rng.uniform()
+
+    np_rng = np.random.default_rng(233)
+    hf1 = numqi.optimize.SweepCheckpoint(filepath, np_rng).wrap(hf0)
+    ret0 = [hf1(x) for x in range(3)]
+    assert ret_==ret0
+    assert len(num_call)==3
+    assert np_rng.uniform()==z0
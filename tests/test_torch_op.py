@@ -46,3 +46,91 @@ def test_PSDMatrixLogm():
     hf0 = lambda x: (scipy.linalg.logm(x @ x.T.conj())*np1).real.sum()
     ret_ = numqi.optimize.finite_difference_central(hf0, np0, zero_eps=1e-4)
     assert np.abs(ret_-ret0).max() < 1e-6
+
+
+def test_get_psd_matrix_spectral():
+    N0 = 4
+    batch_size = 3
+    np0 = np_rng.normal(size=(batch_size,N0,N0)) + 1j*np_rng.normal(size=(batch_size,N0,N0))
+    np1 = np_rng.normal(size=(batch_size,N0,N0)) + 1j*np_rng.normal(size=(batch_size,N0,N0))
+    kind_list = ['log', 'sqrt', ('power',1.5), 'entropy']
+    torch0 = torch.tensor(np0, dtype=torch.complex128, requires_grad=True)
+    # shift the spectrum away from zero, the finite difference of log is inaccurate for small eigenvalues
+    tmp0 = numqi._torch_op.get_psd_matrix_spectral(torch0 @ torch0.mH + 0.1*torch.eye(N0, dtype=torch.float64), kind_list)
+    loss = sum((x*torch.tensor(np1)).real.sum() for x in tmp0[:3]) + tmp0[3].sum()
+    loss.backward()
+    ret0 = torch0.grad.numpy()
+
+    def hf0(x):
+        EVL,EVC = np.linalg.eigh(x @ x.conj().transpose(0,2,1) + 0.1*np.eye(N0))
+        hf1 = lambda y: ((EVC*y[:,np.newaxis]) @ EVC.conj().transpose(0,2,1) * np1).real.sum()
+        ret = hf1(np.log(EVL)) + hf1(np.sqrt(EVL)) + hf1(EVL**1.5) - (EVL*np.log(EVL)).sum()
+        return ret
+    assert abs(hf0(np0) - loss.item()) < 1e-10*max(1, abs(loss.item()))
+    ret_ = numqi.optimize.finite_difference_central(hf0, np0, zero_eps=1e-4)
+    assert np.abs(ret_-ret0).max() < 1e-6*max(1, np.abs(ret_).max())
+
+    # degenerate eigenvalues
+    tmp0 = np.linalg.qr(np0[0])[0]
+    torch1 = torch.tensor((tmp0*np.array([0.1,0.1,0.3,0.5])) @ tmp0.T.conj(), requires_grad=True)
+    tmp1 = numqi._torch_op.get_psd_matrix_spectral(torch1, 'log')
+    (tmp1*torch.tensor(np1[0])).real.sum().backward()
+    ret0 = torch1.grad.numpy()
+    hf0 = lambda x: (scipy.linalg.logm(x)*np1[0]).real.sum()
+    ret_ = numqi.optimize.finite_difference_central(hf0, torch1.detach().numpy(), zero_eps=1e-5)
+    assert np.abs(ret_-ret0).max() < 1e-6
+
+
+def test_HermitianMatrixExp():
+    N0 = 4
+    np0 = np_rng.normal(size=(3,N0,N0)) + 1j*np_rng.normal(size=(3,N0,N0))
+    np0 = np0 + np0.conj().transpose(0,2,1)
+    np0[1] = np.eye(N0) #degenerate eigenvalues
+    np1 = np_rng.normal(size=(3,N0,N0)) + 1j*np_rng.normal(size=(3,N0,N0))
+    torch0 = torch.tensor(np0, dtype=torch.complex128, requires_grad=True)
+    tmp0 = numqi._torch_op.HermitianMatrixExp.apply(torch0)[0]
+    assert np.abs(tmp0.detach().numpy() - np.stack([scipy.linalg.expm(1j*x) for x in np0])).max() < 1e-10
+    (tmp0*torch.tensor(np1)).real.sum().backward()
+    hf0 = lambda x: sum((scipy.linalg.expm(1j*y)*z).real.sum() for y,z in zip(x,np1))
+    ret_ = numqi.optimize.finite_difference_central(hf0, np0, zero_eps=1e-5)
+    assert np.abs(ret_-torch0.grad.numpy()).max() < 1e-6
+
+
+def test_torch_op_func_hessian():
+    # torch.func transforms (setup_context) and the second order derivative, compared with the pure torch reference
+    N0 = 4
+    np0 = np_rng.normal(size=(2,3,N0,N0))
+    np1 = torch.tensor(np_rng.normal(size=(3,N0,N0)) + 1j*np_rng.normal(size=(3,N0,N0)))
+    np0[1,1] = 0 #degenerate eigenvalues
+    np0[0,1] = np.eye(N0)
+    def hf0(x, use_torch_op):
+        tmp0 = torch.complex(x[0], x[1])
+        tmp0 = tmp0 + tmp0.mH
+        if use_torch_op:
+            tmp1 = numqi._torch_op.HermitianMatrixExp.apply(tmp0)[0]
+        else:
+            tmp1 = torch.linalg.matrix_exp(1j*tmp0)
+        ret = (tmp1*np1).real.sum()**2
+        return ret
+    def hf1(x, use_torch_op):
+        tmp0 = x @ x.mT + 0.1*torch.eye(N0, dtype=torch.float64)
+        if use_torch_op:
+            tmp1,tmp2 = numqi._torch_op.get_psd_matrix_spectral(tmp0, ['sqrt','entropy'])
+        else:
+            EVL,EVC = torch.linalg.eigh(tmp0)
+            tmp1 = (EVC*torch.sqrt(EVL).unsqueeze(-2)) @ EVC.mT
+            tmp2 = -(EVL*torch.log(EVL)).sum(-1)
+        ret = (tmp1*np1.real).sum()**2 + (tmp2**2).sum()
+        return ret
+    # the second derivative of the spectral function is unstable for the degenerate eigenvalues (eigh backward)
+    for hf2,x0 in [(hf0, np0), (hf1, np_rng.normal(size=(3,N0,N0)))]:
+        x0 = torch.tensor(x0)
+        vec = torch.tensor(np_rng.normal(size=(2,)+x0.shape))
+        hf3 = lambda v,use_torch_op: torch.func.jvp(torch.func.grad(lambda x: hf2(x, use_torch_op)), (x0,), (v,))[1]
+        ret_ = torch.stack([hf3(x, False) for x in vec])
+        ret0 = torch.func.vmap(lambda v: hf3(v, True))(vec)
+        assert torch.abs(ret_-ret0).max().item() < 1e-8*max(1, torch.abs(ret_).max().item())
+        x1 = x0.clone().requires_grad_()
+        tmp0 = torch.autograd.grad(hf2(x1, True), x1, create_graph=True)[0]
+        ret1 = torch.autograd.grad(tmp0, x1, grad_outputs=vec[0])[0]
+        assert torch.abs(ret_[0]-ret1).max().item() < 1e-8*max(1, torch.abs(ret_).max().item())
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 
 import numqi
@@ -45,3 +46,67 @@ def test_trace_distance_contraction():
     tmp1 = numqi.channel.apply_kraus_op(kop, rho1)
     ret1 = numqi.utils.get_trace_distance(tmp0, tmp1)
     assert ret1 < (ret0+1e-10) #epsilon is added to avoid rounding error
+
+
+def test_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv('NUMQI_CACHE_MAX_SIZE', raising=False)
+    monkeypatch.setenv('NUMQI_CACHE_DIR', str(tmp_path))
+    num_call = [0]
+    @numqi._disk_cache.disk_cache('test_table')
+    def hf0(n:int):
+        num_call[0] += 1
+        return [np.arange(n, dtype=np.float64), (n, 'abc', np.eye(2))]
+    ret0 = hf0(10000)
+    ret1 = hf0(10000)
+    assert num_call[0]==1
+    assert (ret1[1][:2]==(10000,'abc')) and isinstance(ret1[0], np.memmap)
+    assert np.abs(ret0[0]-ret1[0]).max()==0 and np.abs(ret0[1][2]-ret1[1][2]).max()==0
+    assert (not ret0[0].flags.writeable) and (not ret1[0].flags.writeable)
+
+    numqi.utils.set_cache_dir(str(tmp_path), max_size=100000) #each entry is about 80KB
+    hf0(10001)
+    assert len(list(tmp_path.glob('v*/test_table-*')))==1
+    hf0(10000)
+    assert num_call[0]==3
+    # an entry removed by another process during the eviction
+    hf_getmtime = os.path.getmtime
+    def hf1(path):
+        if 'test_table-' in str(path):
+            raise FileNotFoundError(path)
+        return hf_getmtime(path)
+    monkeypatch.setattr(os.path, 'getmtime', hf1)
+    numqi._disk_cache._evict(str(next(tmp_path.glob('v*'))), 0)
+    monkeypatch.setattr(os.path, 'getmtime', hf_getmtime)
+
+    numqi.utils.clear_cache()
+    assert len(list(tmp_path.glob('v*')))==0
+    numqi.utils.set_cache_dir(None)
+    assert numqi.utils.get_cache_dir() is None
+    hf0(10000)
+    assert num_call[0]==4
+    # the memoized tables are read-only whether or not the disk cache is enabled
+    Bij = numqi.dicke.get_partial_trace_ABk_to_AB_index(5, 3)
+    assert not any(y.flags.writeable for x in Bij for y in x)
+    coeff_list = numqi.group.symext.get_symmetric_extension_irrep_coeff(3, 3)[0]
+    assert not any(x.flags.writeable for x in coeff_list)
+    assert not any(x[1].flags.writeable for x in numqi.matrix_space.get_clebsch_gordan_coeffient(2, 3))
+
+
+def _sweep_previous_item_setup():
+    # returns the previous item evaluated by the same solver
+    state = [None]
+    def hf0(item):
+        ret = state[0]
+        state[0] = item
+        return ret
+    hf0.reset = lambda: state.__setitem__(0, None)
+    return hf0
+
+
+def test_run_parallel_sweep_reset():
+    for num_worker in [1,2]:
+        ret = numqi.utils.run_parallel_sweep(_sweep_previous_item_setup, (), list(range(40)), num_worker=num_worker, use_tqdm=False)
+        assert ret[0] is None
+        # the state is never carried from an unrelated chunk
+        assert all((x is None) or (x==ind0-1) for ind0,x in enumerate(ret))
+        assert (num_worker==1) == all(x is not None for x in ret[1:])
@@ -39,6 +39,7 @@ def test_get_sud_symmetric_irrep_basis():
         [(x,2) for x in range(2,6)]
         + [(x,3) for x in range(2,6)]
         + [(x,4) for x in range(2,6)]
+        + [(3,5), (2,6)]
     )
     for dimB,kext in dimB_kext_list:
         basis_B_list = numqi.group.symext.get_sud_symmetric_irrep_basis(dimB, kext)
@@ -57,6 +58,22 @@ def test_get_sud_symmetric_irrep_basis():
         assert np.abs(scipy.linalg.block_diag(*tmp1) - dm1).max() < 1e-10
 
 
+def test_get_symmetric_extension_irrep_coeff_disk_cache(tmp_path, monkeypatch):
+    dimB = 3
+    kext = 4
+    hf0 = numqi.group.symext._get_symmetric_extension_irrep_coeff_internal
+    coeff0,multiplicity0 = numqi.group.symext.get_symmetric_extension_irrep_coeff(dimB, kext)
+    monkeypatch.setenv('NUMQI_CACHE_DIR', str(tmp_path))
+    hf0.cache_clear()
+    numqi.group.symext.get_symmetric_extension_irrep_coeff(dimB, kext) #write to disk
+    assert len(list(tmp_path.glob('v*/symext_irrep_coeff-*/tree.json')))==1
+    hf0.cache_clear()
+    coeff1,multiplicity1 = numqi.group.symext.get_symmetric_extension_irrep_coeff(dimB, kext) #read from disk
+    hf0.cache_clear()
+    assert multiplicity0==multiplicity1
+    assert all(np.abs(x-y).max() < 1e-10 for x,y in zip(coeff0,coeff1))
+
+
 def test_get_B3_irrep_basis():
     dimA = 2
     for dimB in [2,3,4,5]: